@@ -1,18 +1,24 @@
 import numpy as np
 import random
-from collections import namedtuple, deque
 
 import torch
 import torch.nn.functional as F
 import torch.optim as optim
 from torch.nn import Module, Linear
 
+from agents.dqn.numpy_qnetwork import NumpyQNetwork
+
 BUFFER_SIZE = int(1e5)  # replay buffer size
 BATCH_SIZE = 64  # minibatch size
 GAMMA = 0.9  # discount factor
 TAU = 1e-2  # for soft update of target parameters
 LR = 5e-4  # learning rate
 UPDATE_EVERY = 2  # how often to update the network
+UPDATES_PER_STEP = 1  # minibatches fused into one optimizer step
+PER_ALPHA = 0.6  # how much prioritization is used, 0 is uniform sampling
+PER_BETA_START = 0.4  # importance-sampling correction at the start, annealed to 1
+PER_BETA_STEPS = int(1e5)  # number of sampled batches over which beta reaches 1
+PER_EPS = 1e-5  # keeps priorities of transitions with zero TD error positive
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
@@ -42,11 +48,15 @@ class QNetwork(Module):
         x = F.relu(self.fc2(x))
         return self.fc3(x)
 
+    def to_numpy(self):
+        """Snapshot of the current weights as a torch-free NumpyQNetwork for inference."""
+        return NumpyQNetwork.from_state_dict(self.state_dict())
+
 
 class Agent:
     """Interacts with and learns from the environment."""
 
-    def __init__(self, state_size, action_size, seed):
+    def __init__(self, state_size, action_size, seed, prioritized=False, updates_per_step=UPDATES_PER_STEP):
         """Initialize an Agent object.
 
         Params
@@ -54,6 +64,9 @@ class Agent:
             state_size (int): dimension of each state
             action_size (int): dimension of each action
             seed (int): random seed
+            prioritized (bool): sample experiences proportionally to their TD errors
+            updates_per_step (int): number of due updates (one every UPDATE_EVERY steps) whose
+                minibatches are accumulated into a single optimizer step
         """
         self.state_size = state_size
         self.action_size = action_size
@@ -65,9 +78,15 @@ class Agent:
         self.optimizer = optim.Adam(self.qnetwork_local.parameters(), lr=LR)
 
         # Replay memory
-        self.memory = ReplayBuffer(action_size, BUFFER_SIZE, BATCH_SIZE, seed)
+        self.prioritized = prioritized
+        if prioritized:
+            self.memory = PrioritizedReplayBuffer(action_size, BUFFER_SIZE, BATCH_SIZE, seed)
+        else:
+            self.memory = ReplayBuffer(action_size, BUFFER_SIZE, BATCH_SIZE, seed)
         # Initialize time step (for updating every UPDATE_EVERY steps)
         self.t_step = 0
+        self.updates_per_step = updates_per_step
+        self.pending_updates = 0
 
     def step(self, state, action, reward, next_state, done):
         # Save experience in replay memory
@@ -76,10 +95,26 @@ class Agent:
         # Learn every UPDATE_EVERY time steps.
         self.t_step = (self.t_step + 1) % UPDATE_EVERY
         if self.t_step == 0:
-            # If enough samples are available in memory, get random subset and learn
-            if len(self.memory) > BATCH_SIZE:
-                experiences = self.memory.sample()
-                self.learn(experiences, GAMMA)
+            self._run_updates(1)
+
+    def step_batch(self, states, actions, rewards, next_states, dones):
+        """Saves a batch of experiences, learning as often as step() would for the same number of them."""
+        self.memory.add_batch(states, actions, rewards, next_states, dones)
+        updates = (self.t_step + len(states)) // UPDATE_EVERY
+        self.t_step = (self.t_step + len(states)) % UPDATE_EVERY
+        self._run_updates(updates)
+
+    def _run_updates(self, updates):
+        """Learns from updates due minibatches, updates_per_step of them per optimizer step."""
+        batch_size = BATCH_SIZE * self.updates_per_step
+        # If enough samples are available in memory, get random subset and learn
+        if len(self.memory) <= batch_size:
+            return
+        self.pending_updates += updates
+        while self.pending_updates >= self.updates_per_step:
+            self.pending_updates -= self.updates_per_step
+            experiences = self.memory.sample(batch_size)
+            self.learn(experiences, GAMMA)
 
     def act(self, state, eps=0.):
         """Returns actions for given state as per current policy.
@@ -101,32 +136,61 @@ class Agent:
         else:
             return random.choice(np.arange(self.action_size))
 
+    def act_batch(self, states, eps=0.):
+        """Returns actions for a batch of states with one forward pass.
+
+        Params
+        ======
+            states (array_like): [batch, state_size] states
+            eps (float): epsilon, for epsilon-greedy action selection
+        """
+        states = torch.from_numpy(np.asarray(states)).float().to(device)
+        self.qnetwork_local.eval()
+        with torch.no_grad():
+            action_values = self.qnetwork_local(states)
+        self.qnetwork_local.train()
+
+        # Epsilon-greedy action selection, one draw per state
+        actions = np.argmax(action_values.cpu().data.numpy(), axis=1)
+        explore = np.random.random(len(actions)) <= eps
+        actions[explore] = np.random.randint(self.action_size, size=explore.sum())
+        return actions
+
     def learn(self, experiences, gamma):
         """Update value parameters using given batch of experience tuples.
         Params
         ======
-            experiences (Tuple[torch.Tensor]): tuple of (s, a, r, s', done) tuples
+            experiences (Tuple[torch.Tensor]): tuple of (s, a, r, s', done) tuples,
+                followed by importance-sampling weights and buffer indices in prioritized mode
             gamma (float): discount factor
         """
-        states, actions, rewards, next_states, dones = experiences
+        states, actions, rewards, next_states, dones = experiences[:5]
 
-        # Get max predicted Q values (for next states) from target model
-        Q_targets_next = self.qnetwork_target(next_states).detach().max(1)[0].unsqueeze(1)
-        # Compute Q targets for current states
-        Q_targets = rewards + (gamma * Q_targets_next * (1 - dones))
+        with torch.no_grad():
+            # Get max predicted Q values (for next states) from target model
+            Q_targets_next = self.qnetwork_target(next_states).max(1)[0].unsqueeze(1)
+            # Compute Q targets for current states
+            Q_targets = rewards + (gamma * Q_targets_next * (1 - dones))
 
         # Get expected Q values from local model
         Q_expected = self.qnetwork_local(states).gather(1, actions)
 
         # Compute loss
-        loss = F.mse_loss(Q_expected, Q_targets)
+        if self.prioritized:
+            weights, indices = experiences[5:]
+            td_errors = Q_targets - Q_expected
+            loss = (weights * td_errors.pow(2)).mean()
+            self.memory.update_priorities(indices, td_errors.detach().abs().cpu().numpy()[:, 0])
+        else:
+            loss = F.mse_loss(Q_expected, Q_targets)
         # Minimize the loss
         self.optimizer.zero_grad()
         loss.backward()
         self.optimizer.step()
 
         # ------------------- update target network ------------------- #
-        self.soft_update(self.qnetwork_local, self.qnetwork_target, TAU)
+        # one soft update per optimizer step, as far as updates_per_step separate ones would move it
+        self.soft_update(self.qnetwork_local, self.qnetwork_target, 1.0 - (1.0 - TAU) ** self.updates_per_step)
 
     def soft_update(self, local_model, target_model, tau):
         """Soft update model parameters.
@@ -137,12 +201,23 @@ class Agent:
             target_model (PyTorch model): weights will be copied to
             tau (float): interpolation parameter
         """
-        for target_param, local_param in zip(target_model.parameters(), local_model.parameters()):
-            target_param.data.copy_(tau * local_param.data + (1.0 - tau) * target_param.data)
+        target_params = [param.data for param in target_model.parameters()]
+        local_params = [param.data for param in local_model.parameters()]
+        # target += tau * (local - target) in place, one fused kernel over all tensors
+        if hasattr(torch, '_foreach_lerp_'):
+            torch._foreach_lerp_(target_params, local_params, tau)
+        else:
+            for target_param, local_param in zip(target_params, local_params):
+                target_param.lerp_(local_param, tau)
 
 
 class ReplayBuffer:
-    """Fixed-size buffer to store experience tuples."""
+    """Fixed-size buffer to store experience tuples.
+
+    Experiences are written circularly into preallocated arrays, so a sample
+    is one index draw and one gather per field, and the tensors handed to
+    learn() share memory with the gathered arrays.
+    """
 
     def __init__(self, action_size, buffer_size, batch_size, seed):
         """Initialize a ReplayBuffer object.
@@ -154,30 +229,166 @@ class ReplayBuffer:
             seed (int): random seed
         """
         self.action_size = action_size
-        self.memory = deque(maxlen=buffer_size)
+        self.buffer_size = int(buffer_size)
         self.batch_size = batch_size
-        self.experience = namedtuple("Experience", field_names=["state", "action", "reward", "next_state", "done"])
-        self.seed = random.seed(seed)
+        self.rng = np.random.default_rng(seed)
+        # arrays are allocated on the first add, once the state size is known
+        self.states = None
+        self.actions = None
+        self.rewards = None
+        self.next_states = None
+        self.dones = None
+        self.position = 0
+        self.size = 0
+
+    def _allocate(self, state_size):
+        self.states = np.zeros((self.buffer_size, state_size), dtype=np.float32)
+        self.actions = np.zeros((self.buffer_size, 1), dtype=np.int64)
+        self.rewards = np.zeros((self.buffer_size, 1), dtype=np.float32)
+        self.next_states = np.zeros((self.buffer_size, state_size), dtype=np.float32)
+        self.dones = np.zeros((self.buffer_size, 1), dtype=np.float32)
 
     def add(self, state, action, reward, next_state, done):
         """Add a new experience to memory."""
-        e = self.experience(state, action, reward, next_state, done)
-        self.memory.append(e)
-
-    def sample(self):
-        """Randomly sample a batch of experiences from memory."""
-        experiences = random.sample(self.memory, k=self.batch_size)
-
-        states = torch.from_numpy(np.vstack([e.state for e in experiences if e is not None])).float().to(device)
-        actions = torch.from_numpy(np.vstack([e.action for e in experiences if e is not None])).long().to(device)
-        rewards = torch.from_numpy(np.vstack([e.reward for e in experiences if e is not None])).float().to(device)
-        next_states = torch.from_numpy(np.vstack([e.next_state for e in experiences if e is not None])).float().to(
-            device)
-        dones = torch.from_numpy(np.vstack([e.done for e in experiences if e is not None]).astype(np.uint8)).float().to(
-            device)
+        if self.states is None:
+            self._allocate(np.size(state))
+        i = self.position
+        self.states[i] = state
+        self.actions[i, 0] = action
+        self.rewards[i, 0] = reward
+        self.next_states[i] = next_state
+        self.dones[i, 0] = done
+        self.position = (i + 1) % self.buffer_size
+        self.size = min(self.size + 1, self.buffer_size)
+        return i
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        """Add a batch of experiences to memory, the oldest ones are overwritten when it is full."""
+        states = np.asarray(states).reshape(len(actions), -1)
+        if self.states is None:
+            self._allocate(states.shape[1])
+        # a batch bigger than the buffer only keeps its newest experiences
+        keep = slice(max(len(actions) - self.buffer_size, 0), None)
+        idx = (self.position + np.arange(len(actions))[keep]) % self.buffer_size
+        self.states[idx] = states[keep]
+        self.actions[idx, 0] = np.asarray(actions)[keep]
+        self.rewards[idx, 0] = np.asarray(rewards)[keep]
+        self.next_states[idx] = np.asarray(next_states).reshape(len(actions), -1)[keep]
+        self.dones[idx, 0] = np.asarray(dones)[keep]
+        self.position = (self.position + len(actions)) % self.buffer_size
+        self.size = min(self.size + len(actions), self.buffer_size)
+        return idx
+
+    def sample(self, batch_size=None):
+        """Randomly sample a batch of experiences from memory, batch_size defaults to the one of the buffer."""
+        idx = self.rng.choice(self.size, size=batch_size or self.batch_size, replace=False)
+        return self._gather(idx)
+
+    def _gather(self, idx):
+        states = torch.from_numpy(self.states[idx]).to(device)
+        actions = torch.from_numpy(self.actions[idx]).to(device)
+        rewards = torch.from_numpy(self.rewards[idx]).to(device)
+        next_states = torch.from_numpy(self.next_states[idx]).to(device)
+        dones = torch.from_numpy(self.dones[idx]).to(device)
 
         return states, actions, rewards, next_states, dones
 
     def __len__(self):
         """Return the current size of internal memory."""
-        return len(self.memory)
+        return self.size
+
+
+class SumTree:
+    """Binary tree over a fixed number of priorities where every node holds the sum of its children.
+
+    Leaves live in the second half of one array, so updating a leaf and
+    finding the leaf of a prefix sum both walk one root-to-leaf path. All
+    methods take arrays of leaves or prefix sums and walk their paths together.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = 1 << max(int(capacity) - 1, 1).bit_length()
+        self.nodes = np.zeros(2 * self.capacity)
+
+    @property
+    def total(self):
+        return self.nodes[1]
+
+    def __getitem__(self, leaves):
+        return self.nodes[self.capacity + np.asarray(leaves)]
+
+    def update(self, leaves, priorities):
+        """Set priorities of leaves and refresh the sums above them."""
+        nodes = self.capacity + np.asarray(leaves)
+        self.nodes[nodes] = priorities
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self.nodes[nodes] = self.nodes[2 * nodes] + self.nodes[2 * nodes + 1]
+            nodes = np.unique(nodes // 2)
+
+    def find(self, prefix_sums):
+        """Leaves whose cumulative priority range contains each of prefix_sums."""
+        values = np.array(prefix_sums, dtype=float)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.capacity:
+            left = 2 * nodes
+            go_right = values > self.nodes[left]
+            values -= np.where(go_right, self.nodes[left], 0.0)
+            nodes = left + go_right
+        return nodes - self.capacity
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """Replay buffer sampling experiences proportionally to priority^PER_ALPHA.
+
+    New experiences get the highest priority seen so far, so each of them is
+    replayed at least once with good chance; learn() then sets priorities to
+    the absolute TD errors. Samples carry importance-sampling weights that
+    undo the bias of non-uniform sampling as beta is annealed to 1.
+    """
+
+    def __init__(self, action_size, buffer_size, batch_size, seed, alpha=PER_ALPHA,
+                 beta_start=PER_BETA_START, beta_steps=PER_BETA_STEPS):
+        super().__init__(action_size, buffer_size, batch_size, seed)
+        self.alpha = alpha
+        self.beta_start = beta_start
+        self.beta_steps = beta_steps
+        self.tree = SumTree(self.buffer_size)
+        self.max_priority = 1.0
+        self.samples = 0
+
+    def add(self, state, action, reward, next_state, done):
+        """Add a new experience to memory with the highest priority."""
+        i = super().add(state, action, reward, next_state, done)
+        self.tree.update(np.array([i]), self.max_priority ** self.alpha)
+        return i
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        idx = super().add_batch(states, actions, rewards, next_states, dones)
+        self.tree.update(idx, self.max_priority ** self.alpha)
+        return idx
+
+    def sample(self, batch_size=None):
+        """Sample a batch proportionally to priorities, one draw from each of batch_size equal segments."""
+        bounds = np.linspace(0, self.tree.total, (batch_size or self.batch_size) + 1)
+        idx = self.tree.find(self.rng.uniform(bounds[:-1], bounds[1:]))
+        # rounding can make a prefix sum overshoot into the empty leaves
+        idx = np.minimum(idx, self.size - 1)
+
+        beta = min(1.0, self.beta_start + self.samples * (1.0 - self.beta_start) / self.beta_steps)
+        self.samples += 1
+        probabilities = self.tree[idx] / self.tree.total
+        weights = (self.size * probabilities) ** -beta
+        weights /= weights.max()
+
+        states, actions, rewards, next_states, dones = self._gather(idx)
+        weights = torch.from_numpy(weights.astype(np.float32)[:, None]).to(device)
+        return states, actions, rewards, next_states, dones, weights, idx
+
+    def update_priorities(self, idx, td_errors):
+        """Set priorities of sampled experiences from their absolute TD errors."""
+        priorities = np.abs(td_errors) + PER_EPS
+        self.max_priority = max(self.max_priority, priorities.max())
+        # a batch can hold an experience twice, update each leaf once with its last error
+        idx, last = np.unique(idx[::-1], return_index=True)
+        self.tree.update(idx, priorities[::-1][last] ** self.alpha)
@@ -0,0 +1,131 @@
+import os
+
+import numpy as np
+
+from agents.dqn.numpy_qnetwork import NumpyQNetwork, checkpoint_hash, snapshot_path
+from envs.manipulator.envs.ManipulatorVec import ManipulatorVec
+
+MODEL_PATH = 'agents/dqn/models/model1.pth'
+MAX_STEPS = 100  # rollout length limit of one situation
+
+# (model path, backend) -> loaded ManipulatorModelService, so a process reads the weights once
+_SERVICES = {}
+
+
+def load_numpy_qnetwork(model_path):
+    """
+    NumpyQNetwork of a torch checkpoint.
+
+    Reads the .npz snapshot next to the checkpoint when it was exported from
+    the same checkpoint contents, so torch is only imported to (re)export it.
+    """
+    path = snapshot_path(model_path)
+    source = checkpoint_hash(model_path) if os.path.exists(model_path) else None
+    if os.path.exists(path):
+        with np.load(path) as data:
+            fresh = source is None or ('source_sha1' in data and str(data['source_sha1']) == source)
+        if fresh:
+            return NumpyQNetwork.load(path)
+    import torch
+    network = NumpyQNetwork.from_state_dict(torch.load(model_path, map_location='cpu'))
+    network.save(path, source_sha1=source)
+    return network
+
+
+class ManipulatorModelService:
+    """
+    Pretrained manipulator QNetwork kept in memory for greedy rollouts.
+
+    The weights are read once. With the default 'numpy' backend the network
+    is evaluated by NumpyQNetwork and torch is never imported when a snapshot
+    exists; the 'torch' backend keeps a QNetwork in eval mode and runs every
+    batch under torch.inference_mode.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, backend='numpy'):
+        self.backend = backend
+        if backend == 'numpy':
+            self.qnetwork = load_numpy_qnetwork(model_path)
+        elif backend == 'torch':
+            import torch
+            from agents.dqn.dqn_agent import QNetwork, device
+            state_dict = torch.load(model_path, map_location=device)
+            state_size = state_dict['fc1.weight'].shape[1]
+            action_size = state_dict['fc3.weight'].shape[0]
+            self.qnetwork = QNetwork(state_size, action_size, seed=0).to(device)
+            self.qnetwork.load_state_dict(state_dict)
+            self.qnetwork.eval()
+        else:
+            raise ValueError(f'unknown backend {backend}')
+
+    @classmethod
+    def get(cls, model_path=MODEL_PATH, backend='numpy'):
+        """Service of model_path, loaded on the first request."""
+        if (model_path, backend) not in _SERVICES:
+            _SERVICES[model_path, backend] = cls(model_path, backend)
+        return _SERVICES[model_path, backend]
+
+    def act(self, states):
+        """Greedy actions for a [batch, state_size] array of states."""
+        states = np.asarray(states, dtype=np.float32)
+        if self.backend == 'numpy':
+            return self.qnetwork(states).argmax(axis=1)
+        import torch
+        from agents.dqn.dqn_agent import device
+        with torch.inference_mode():
+            action_values = self.qnetwork(torch.from_numpy(states).to(device))
+        return action_values.argmax(dim=1).cpu().numpy()
+
+    def solve(self, chains, max_steps=MAX_STEPS):
+        """
+        Rolls out chains of situations, one situation of every chain per tick.
+
+        Situations of one chain are solved in order, each starting from the
+        final joint angles of the previous one (written to its
+        'manipulator_angles'), so the chains advance in lockstep with one
+        batched forward pass per tick. Returns the solutions of every chain
+        (lists of steps with the joint angles and grabbed flag before the
+        action and the action name, like apply_manipulator_model writes them)
+        and the final joint angles of every chain, None for empty chains.
+
+        The pipeline in train.py hands the angles of one sub-task over to the
+        next, so all of its situations form a single chain and every tick is a
+        batch of one. There the gain comes from reading the weights once and
+        from the NumPy backend, batching only helps callers with independent
+        chains.
+        """
+        solutions = [[[] for _ in chain] for chain in chains]
+        final_angles = [None for _ in chains]
+        running = [i for i, chain in enumerate(chains) if chain]
+        if not running:
+            return solutions, final_angles
+        env = ManipulatorVec([chains[i][0] for i in running], max_steps=max_steps)
+        joints = env.num_of_joints
+        # slot -> (chain, situation index) it is rolling out, None once the chain is finished
+        slots = [(i, 0) for i in running]
+        states = env.reset()
+        while any(slot is not None for slot in slots):
+            actions = self.act(states)
+            next_states, _, dones, info = env.step(actions)
+            finished = dones | info['truncated']
+            for slot, (state, action) in enumerate(zip(states, actions)):
+                if slots[slot] is None:
+                    continue
+                chain, k = slots[slot]
+                solutions[chain][k].append({'manipulator': env.denormalize(state[:joints]),
+                                            'grabbed': bool(state[joints]),
+                                            'action': env.action_to_str(action)})
+                if not finished[slot]:
+                    continue
+                angles = env.denormalize(info['final_observations'][slot][:joints])
+                if k + 1 < len(chains[chain]):
+                    # hand the final joint angles over to the next situation of the chain
+                    situation = chains[chain][k + 1]
+                    situation['manipulator_angles'] = angles
+                    next_states[slot] = env.set_situation(slot, situation)
+                    slots[slot] = (chain, k + 1)
+                else:
+                    final_angles[chain] = angles
+                    slots[slot] = None
+            states = next_states
+        return solutions, final_angles
@@ -0,0 +1,62 @@
+import hashlib
+import os
+
+import numpy as np
+
+# layers of QNetwork in forward order
+LAYERS = ['fc1', 'fc2', 'fc3']
+
+
+def snapshot_path(model_path):
+    """Path of the NumPy snapshot that belongs to a torch checkpoint."""
+    return os.path.splitext(model_path)[0] + '.npz'
+
+
+def checkpoint_hash(model_path):
+    with open(model_path, 'rb') as read:
+        return hashlib.sha1(read.read()).hexdigest()
+
+
+class NumpyQNetwork:
+    """
+    Inference-only copy of QNetwork with weights held in NumPy arrays.
+
+    forward() is three matmuls with ReLUs in between over a batch of
+    states, no torch import or dispatch involved, so rollouts can run in
+    processes that never load torch.
+    """
+
+    def __init__(self, weights):
+        """weights maps '<layer>.weight' ([out, in]) and '<layer>.bias' ([out]) of every layer to arrays."""
+        # transposed once so forward multiplies [batch, in] @ [in, out]
+        self.weights = [np.ascontiguousarray(np.asarray(weights[f'{layer}.weight'], dtype=np.float32).T)
+                        for layer in LAYERS]
+        self.biases = [np.asarray(weights[f'{layer}.bias'], dtype=np.float32) for layer in LAYERS]
+        self.state_size = self.weights[0].shape[0]
+        self.action_size = self.weights[-1].shape[1]
+
+    @classmethod
+    def from_state_dict(cls, state_dict):
+        return cls({name: tensor.detach().cpu().numpy() for name, tensor in state_dict.items()})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(dict(data))
+
+    def save(self, path, **extra):
+        """Saves the weights as .npz, extra arrays (like the hash of the source checkpoint) are stored along."""
+        weights = dict(extra)
+        for layer, weight, bias in zip(LAYERS, self.weights, self.biases):
+            weights[f'{layer}.weight'] = weight.T
+            weights[f'{layer}.bias'] = bias
+        np.savez(path, **weights)
+
+    def forward(self, states):
+        """Q-values of a [batch, state_size] array of states."""
+        x = np.asarray(states, dtype=np.float32)
+        for weight, bias in zip(self.weights[:-1], self.biases[:-1]):
+            x = np.maximum(x @ weight + bias, 0)
+        return x @ self.weights[-1] + self.biases[-1]
+
+    __call__ = forward
@@ -0,0 +1,152 @@
+import numpy as np
+
+# dense tables bigger than this fall back to the hashed backend
+MAX_DENSE_BYTES = 512 * 2 ** 20
+EMPTY = -1
+# Fibonacci hashing multiplier, 2^64 / golden ratio
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+class QTable:
+    """
+    Q-values of integer states stored in one contiguous float32 array.
+
+    Acts as the former defaultdict(lambda: np.zeros(n_actions)) keyed by
+    str(state): q[state] returns a writable row (zeros for unseen states) and
+    iteration yields str(state) of every visited state, so q_to_policy and
+    build_policy_to_goal work unchanged.
+
+    """
+
+    def __init__(self, num_actions):
+        self.num_actions = num_actions
+        self.values = None
+
+    def rows(self, states):
+        """Rows of values for an array of states, unseen states get a zero row."""
+        raise NotImplementedError()
+
+    def visited_states(self):
+        raise NotImplementedError()
+
+    def __getitem__(self, state):
+        # rows() can replace values with a bigger array
+        row = self.rows(np.array([int(state)], dtype=np.int64))[0]
+        return self.values[row]
+
+    def __iter__(self):
+        for state in self.visited_states():
+            yield str(state)
+
+    def __len__(self):
+        return len(self.visited_states())
+
+    def greedy_policy(self, offset=0):
+        """Same dict as q_to_policy(self, offset) built in one argmax over the visited rows."""
+        states = self.visited_states()
+        actions = np.argmax(self.values[self.rows(states)], axis=1) + offset
+        return {str(state): action for state, action in zip(states.tolist(), actions.tolist())}
+
+
+class DenseQTable(QTable):
+    """Row i holds the Q-values of state i."""
+
+    def __init__(self, num_states, num_actions):
+        super().__init__(num_actions)
+        self.values = np.zeros((num_states, num_actions), dtype=np.float32)
+        self.visited = np.zeros(num_states, dtype=bool)
+
+    def __getitem__(self, state):
+        state = int(state)
+        self.visited[state] = True
+        return self.values[state]
+
+    def rows(self, states):
+        self.visited[states] = True
+        return states
+
+    def visited_states(self):
+        return np.flatnonzero(self.visited)
+
+
+class HashQTable(QTable):
+    """
+    Open-addressing int64 -> row hash in front of a growing float32 array.
+
+    Linear probing is done for whole arrays of states at once, so batched
+    trainers pay the Python overhead once per batch.
+
+    """
+
+    def __init__(self, num_actions, capacity=1024):
+        super().__init__(num_actions)
+        self._bits = max(int(np.ceil(np.log2(capacity))), 4)
+        self._keys = np.full(2 ** self._bits, EMPTY, dtype=np.int64)
+        self._slot_rows = np.full(2 ** self._bits, EMPTY, dtype=np.int64)
+        self.values = np.zeros((capacity // 2, num_actions), dtype=np.float32)
+        self.size = 0
+
+    def _slots(self, keys):
+        return ((keys.astype(np.uint64) * HASH_MULTIPLIER) >> np.uint64(64 - self._bits)).astype(np.int64)
+
+    def _probe(self, keys):
+        """Slots holding keys, or the first empty slot of their probe sequence."""
+        mask = 2 ** self._bits - 1
+        slots = self._slots(keys)
+        pending = np.arange(len(keys))
+        while len(pending):
+            found = self._keys[slots[pending]]
+            pending = pending[(found != keys[pending]) & (found != EMPTY)]
+            slots[pending] = (slots[pending] + 1) & mask
+        return slots
+
+    def _place(self, keys, rows):
+        while len(keys):
+            slots = self._probe(keys)
+            # several new keys may probe to one empty slot, the first one takes it
+            slots, first = np.unique(slots, return_index=True)
+            self._keys[slots] = keys[first]
+            self._slot_rows[slots] = rows[first]
+            rest = np.ones(len(keys), dtype=bool)
+            rest[first] = False
+            keys, rows = keys[rest], rows[rest]
+
+    def _grow(self, needed):
+        if needed > len(self.values):
+            values = np.zeros((max(needed, 2 * len(self.values)), self.num_actions), dtype=np.float32)
+            values[:self.size] = self.values[:self.size]
+            self.values = values
+        if 2 * needed > len(self._keys):
+            occupied = self._keys != EMPTY
+            keys, rows = self._keys[occupied], self._slot_rows[occupied]
+            self._bits = int(np.ceil(np.log2(4 * needed)))
+            self._keys = np.full(2 ** self._bits, EMPTY, dtype=np.int64)
+            self._slot_rows = np.full(2 ** self._bits, EMPTY, dtype=np.int64)
+            self._place(keys, rows)
+
+    def rows(self, states):
+        states = np.asarray(states, dtype=np.int64)
+        slots = self._probe(states)
+        missing = self._keys[slots] == EMPTY
+        if missing.any():
+            new_keys = np.unique(states[missing])
+            self._grow(self.size + len(new_keys))
+            self._place(new_keys, np.arange(self.size, self.size + len(new_keys)))
+            self.size += len(new_keys)
+            slots = self._probe(states)
+        return self._slot_rows[slots]
+
+    def visited_states(self):
+        occupied = self._keys != EMPTY
+        order = np.argsort(self._slot_rows[occupied])
+        return self._keys[occupied][order]
+
+    def __len__(self):
+        return self.size
+
+
+def make_q_table(num_states, num_actions, max_dense_bytes=MAX_DENSE_BYTES):
+    """Dense table when num_states rows fit into max_dense_bytes, hashed table otherwise."""
+    if num_states * num_actions * np.dtype(np.float32).itemsize <= max_dense_bytes:
+        return DenseQTable(num_states, num_actions)
+    return HashQTable(num_actions)
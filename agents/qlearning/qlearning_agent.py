@@ -1,11 +1,11 @@
 import itertools
 import sys
-from collections import defaultdict
 from ast import literal_eval
 
 import numpy as np
 
 from agents.agent import Agent
+from agents.qlearning.q_table import make_q_table
 
 
 class QLearningAgent(Agent):
@@ -17,12 +17,14 @@ class QLearningAgent(Agent):
     def __init__(self, env, gamma=1.0, alpha=0.5, epsilon=0.1, beta=0.2):
         self.environment = env
         self.number_of_action = env.action_space.n
-        self.q = defaultdict(lambda: np.zeros(self.number_of_action))
+        self.q = make_q_table(env.observation_space.n, self.number_of_action)
         self.r_avg = 0
         self.gamma = gamma
         self.alpha = alpha
         self.epsilon = epsilon
         self.beta = beta
+        # environment transitions taken by training
+        self.env_steps = 0
         self.policy = self._make_epsilon_greedy_policy()
 
     def _make_epsilon_greedy_policy(self):
@@ -63,14 +65,13 @@ class QLearningAgent(Agent):
                     sys.stdout.flush()
             # set env to start values
             state = self.environment.reset()
-            state = str(state)
             total_reward = 0.0
             for _ in range(1000):
                 # choose action by eps greedy policy
                 action = self.act(state)
                 # if illigal act -5 if nice act +5 reward else rew -1
                 next_state, reward, done, _ = self.environment.step(action)
-                next_state = str(next_state)
+                self.env_steps += 1
                 total_reward += reward
                 self.update(state, action, reward, next_state)
                 if done:
@@ -81,3 +82,60 @@ class QLearningAgent(Agent):
                 state = next_state
         # return total_total_reward / num_episodes, rewards  # return average eps reward
         return rewards, total_total_reward / num_episodes
+
+    def train_batch(self, environment, num_episodes=500, verbose=False, seed=None):
+        """
+        Q-learning over environment.num_envs episodes run in lockstep.
+
+        environment is a batched env such as BlocksWorldVec. Actions of all
+        copies are chosen with one uniform draw per batch and TD updates of a
+        tick are applied at once with np.add.at. Returns the same
+        (rewards, average) tuple as train().
+
+        """
+        rng = np.random.default_rng(seed)
+        values_per_row = self.number_of_action
+        total_total_reward = 0.0
+        rewards = []
+        finished = 0
+        states = environment.reset()
+        while finished < num_episodes:
+            rows = self.q.rows(states)
+            actions = np.argmax(self.q.values[rows], axis=1)
+            if self.epsilon > 0:
+                # one draw decides both whether to explore and which action to take
+                draw = rng.random(len(states))
+                explore = draw < self.epsilon
+                actions[explore] = (draw[explore] / self.epsilon * values_per_row).astype(np.int64)
+            next_states, reward, done, info = environment.step(actions)
+            self.env_steps += len(actions)
+
+            next_rows = self.q.rows(info['final_states'])
+            td_target = reward + self.gamma * self.q.values[next_rows].max(axis=1)
+            td_delta = td_target - self.q.values[rows, actions]
+            cells = rows * values_per_row + actions
+            # k updates of one cell move it like k sequential updates towards their mean target
+            counts = _duplicate_counts(cells)
+            np.add.at(self.q.values.reshape(-1), cells, (1 - (1 - self.alpha) ** counts) / counts * td_delta)
+            states = next_states
+
+            ended = done | info['truncated']
+            if not ended.any():
+                continue
+            ended = np.flatnonzero(ended)[:num_episodes - finished]
+            finished += len(ended)
+            completed = info['episode_returns'][ended[done[ended]]]
+            rewards.extend(completed.tolist())
+            total_total_reward += completed.sum()
+            if verbose:
+                print("\rEpisode {}/{}.".format(finished, num_episodes), end="")
+                sys.stdout.flush()
+        return rewards, total_total_reward / num_episodes
+
+
+def _duplicate_counts(cells):
+    """How many times every element of cells occurs in it."""
+    if len(cells) <= 256:
+        return (cells[:, None] == cells).sum(axis=1)
+    _, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+    return counts[inverse]
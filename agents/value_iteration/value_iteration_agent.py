@@ -0,0 +1,73 @@
+import numpy as np
+
+from agents.agent import Agent
+from agents.qlearning.q_table import HashQTable
+from envs.blocks.envs.TransitionTable import TransitionTable
+
+
+class ValueIterationAgent(Agent):
+    """
+    Solves a fully known deterministic BlocksWorld exactly.
+
+    The transition model is the TransitionTable of the environment, values
+    of all reachable states are updated at once until they stop changing.
+    The resulting Q-values are kept in a QTable, so q_to_policy(agent.q)
+    gives the same policy dict as for QLearningAgent.
+
+    """
+
+    def __init__(self, env, gamma=0.99, tol=1e-4, max_iterations=10000):
+        self.environment = env
+        self.number_of_action = env.action_space.n
+        self.gamma = gamma
+        self.tol = tol
+        self.max_iterations = max_iterations
+        self.table = env.table if env.table is not None else TransitionTable.build(env)
+        self.q = HashQTable(self.number_of_action, capacity=2 * len(self.table))
+        # transitions of the table evaluated by training, every sweep backs up each of them once
+        self.env_steps = 0
+
+    def act(self, state):
+        return int(np.argmax(self.q[state]))
+
+    def update(self, state, action, reward, next_state):
+        """Does nothing, the values of all states are computed at once by train()."""
+
+    def train(self, num_episodes=None, verbose=False):
+        """
+        Runs value iteration and returns (rewards, average) of one greedy
+        episode from the starting state, like QLearningAgent.train does for
+        its training episodes. num_episodes is accepted for compatibility.
+
+        """
+        table = self.table
+        # start from the fixed points of looping on step rewards and of staying in the goal,
+        # so only the distance to the goal is left to propagate
+        values = np.full(len(table), table.rewards.max(axis=1).min() / (1 - self.gamma))
+        if table.goal_index != -1:
+            values[table.goal_index] = table.rewards[table.goal_index].max() / (1 - self.gamma)
+        q = table.rewards + self.gamma * values[table.next_index]
+        for iteration in range(self.max_iterations):
+            new_values = q.max(axis=1)
+            delta = np.abs(new_values - values).max()
+            values = new_values
+            q = table.rewards + self.gamma * values[table.next_index]
+            if delta < self.tol:
+                break
+        if verbose:
+            print('Value iteration converged in {} iterations.'.format(iteration + 1))
+        self.env_steps += (iteration + 2) * table.next_index.size
+        # rows() can replace values of a hashed table with a bigger array
+        rows = self.q.rows(table.states)
+        self.q.values[rows] = q
+
+        total_reward = 0.0
+        row = table.start_index
+        for _ in range(1000):
+            action = np.argmax(q[row])
+            total_reward += table.rewards[row, action]
+            done = table.dones[row, action]
+            row = table.next_index[row, action]
+            if done:
+                return [total_reward], total_reward
+        return [], 0.0
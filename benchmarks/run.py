@@ -0,0 +1,261 @@
+"""
+Benchmarks of the pipeline stages and environments.
+
+    python -m benchmarks.run [--only NAME ...] [--skip NAME ...] [--output PATH]
+    python -m benchmarks.run --compare BASELINE.json [--threshold 0.1]
+
+Every benchmark case runs --repeat times in isolation and the fastest run
+is kept. Results go to a JSON file (benchmarks/results/<timestamp>.json by
+default), with the number of processed items and items per second next to
+wall and CPU time. With --compare the fresh results are checked against a
+baseline file, cases that got slower by more than --threshold are flagged
+and the exit code is 1.
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from utils.instrumentation import Instrumentation
+
+SPATIAL_TASKS = range(5)
+TASKS_GLOB = 'tasks_jsons/*/task*/'
+RESULTS_PATH = 'benchmarks/results/'
+WINDOW_SIZE = 30
+ENV_STEPS = 20000
+EPISODES = 200
+DQN_UPDATES = 200
+DQN_STATE_SIZE = 6
+DQN_ACTION_SIZE = 10
+
+
+def planner_search():
+    from map_spatial_wrapper.config_master import create_config, get_config
+    from mapspatial.mapplanner import MapPlanner
+    for task_num in SPATIAL_TASKS:
+        planner = MapPlanner(**get_config(create_config(task_num=str(task_num), delim='/', backward='False',
+                                                        task_type='spatial')))
+
+        def search(planner=planner):
+            planner.search()
+            return 1
+
+        yield f'spatial/task{task_num}', search, 'searches'
+
+
+def parse():
+    from utils.planner_parser import parse as parse_steps
+    for task_path in sorted(glob.glob(TASKS_GLOB + 'planner_steps/')):
+        def run(task_path=task_path):
+            to_path = tempfile.mkdtemp() + '/'
+            try:
+                parse_steps(task_path, to_path, multiple=True, window_size=WINDOW_SIZE)
+                return len(os.listdir(to_path))
+            finally:
+                shutil.rmtree(to_path)
+
+        yield _task_name(task_path), run, 'windows'
+
+
+def q_learning():
+    from agents.qlearning.qlearning_agent import QLearningAgent
+    from envs.blocks.envs.BlocksWorld import BlocksWorld
+    from envs.blocks.envs.BlocksWorldVec import BlocksWorldVec
+    for path in _windows():
+        map_dict = _load(path)
+        env = BlocksWorld(map_dict, use_table=True)
+        vec_env = BlocksWorldVec(map_dict, num_envs=64, use_table=True)
+
+        def train(env=env, vec_env=vec_env):
+            agent = QLearningAgent(env, gamma=0.99, alpha=0.6, epsilon=0.2)
+            agent.train_batch(vec_env, EPISODES, seed=0)
+            return agent.env_steps
+
+        yield _window_name(path), train, 'env steps'
+
+        # what train_rl runs by default: one BlocksWorld stepping the map itself
+        scalar_env = BlocksWorld(map_dict)
+
+        def train_scalar(env=scalar_env):
+            np.random.seed(0)
+            agent = QLearningAgent(env, gamma=0.99, alpha=0.6, epsilon=0.2)
+            agent.train(EPISODES)
+            return agent.env_steps
+
+        yield _window_name(path) + '/scalar', train_scalar, 'env steps'
+
+
+def blocksworld_steps():
+    from envs.blocks.envs.BlocksWorld import BlocksWorld
+    from envs.blocks.envs.BlocksWorldVec import BlocksWorldVec
+    map_dict = _load(_windows()[0])
+    env = BlocksWorld(map_dict)
+
+    def step():
+        actions = np.random.default_rng(0).integers(env.action_space.n, size=ENV_STEPS)
+        env.reset()
+        for action in actions:
+            if env.step(action)[2]:
+                env.reset()
+        return ENV_STEPS
+
+    yield 'single', step, 'env steps'
+    for use_table in (False, True):
+        vec_env = BlocksWorldVec(map_dict, num_envs=64, use_table=use_table)
+
+        def step_vec(vec_env=vec_env):
+            actions = np.random.default_rng(0).integers(vec_env.action_space.n, size=(ENV_STEPS // 64, 64))
+            vec_env.reset()
+            for batch in actions:
+                vec_env.step(batch)
+            return actions.size
+
+        yield 'vec_table' if use_table else 'vec', step_vec, 'env steps'
+
+
+def manipulator_steps():
+    from envs.manipulator.envs.Manipulator import Manipulator
+    from envs.manipulator.envs.ManipulatorVec import ManipulatorVec
+    situation = {'manipulator_angles': [0, 0, 0, 0], 'grabbed': False, 'block_pos': 3, 'task': 'grab', 'id': 0}
+    env = Manipulator(situation)
+
+    def step():
+        actions = np.random.default_rng(0).integers(env.action_space.n, size=ENV_STEPS)
+        env.reset()
+        for action in actions:
+            if env.step(int(action))[2]:
+                env.reset()
+        return ENV_STEPS
+
+    yield 'single', step, 'env steps'
+    vec_env = ManipulatorVec([situation] * 64, max_steps=100)
+
+    def step_vec():
+        actions = np.random.default_rng(0).integers(vec_env.action_space.n, size=(ENV_STEPS // 64, 64))
+        vec_env.reset()
+        for batch in actions:
+            vec_env.step(batch)
+        return actions.size
+
+    yield 'vec', step_vec, 'env steps'
+
+
+def dqn_learn():
+    from agents.dqn.dqn_agent import Agent, BATCH_SIZE, GAMMA
+    rng = np.random.default_rng(0)
+    size = 10 * BATCH_SIZE * DQN_UPDATES
+    transitions = (rng.random((size, DQN_STATE_SIZE)), rng.integers(DQN_ACTION_SIZE, size=size),
+                   rng.normal(size=size), rng.random((size, DQN_STATE_SIZE)), rng.random(size) < 0.01)
+    for prioritized in (False, True):
+        agent = Agent(DQN_STATE_SIZE, DQN_ACTION_SIZE, seed=0, prioritized=prioritized)
+        agent.memory.add_batch(*transitions)
+
+        def learn(agent=agent):
+            for _ in range(DQN_UPDATES):
+                agent.learn(agent.memory.sample(), GAMMA)
+            return DQN_UPDATES * BATCH_SIZE
+
+        yield 'prioritized' if prioritized else 'uniform', learn, 'samples'
+
+
+BENCHMARKS = {'planner_search': planner_search,
+              'parse': parse,
+              'q_learning': q_learning,
+              'blocksworld_steps': blocksworld_steps,
+              'manipulator_steps': manipulator_steps,
+              'dqn_learn': dqn_learn}
+
+
+def _load(path):
+    with open(path, 'r') as read:
+        return json.load(read)
+
+
+def _task_name(path):
+    # tasks_jsons/<type>/task<n>/...
+    return '/'.join(path.split('/')[1:3])
+
+
+def _windows():
+    return sorted(glob.glob(TASKS_GLOB + 'planner_steps_parsed/parsed_tasks_*.json'),
+                  key=lambda path: (os.path.dirname(path), _window_index(path)))
+
+
+def _window_index(path):
+    return int(os.path.basename(path).split('.')[0].split('_')[-1])
+
+
+def _window_name(path):
+    return f'{_task_name(path)}/{_window_index(path)}'
+
+
+def run(names, repeat=3):
+    """Results of every case of the named benchmarks, keyed by '<benchmark>/<case>'."""
+    instrumentation = Instrumentation()
+    results = {}
+    for name in names:
+        for case, body, unit in BENCHMARKS[name]():
+            best = None
+            for _ in range(repeat):
+                with instrumentation.stage(name, case=case) as record:
+                    record['items'] = body()
+                if best is None or record['wall'] < best['wall']:
+                    best = record
+            result = {'wall': best['wall'], 'cpu': best['cpu'], 'items': best['items'], 'unit': unit,
+                      'rate': best['items'] / best['wall'] if best['wall'] > 0 else None}
+            results[f'{name}/{case}'] = result
+            print('{:<45} {:9.4f}s  {:12.0f} {}/s'.format(f'{name}/{case}', result['wall'], result['rate'] or 0,
+                                                          unit))
+    return results
+
+
+def compare(baseline, results, threshold=0.1):
+    """Names of the cases that take more than (1 + threshold) times their baseline wall time."""
+    slower = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['wall'] / baseline[name]['wall'] if baseline[name]['wall'] > 0 else 1.0
+        flag = 'SLOWER' if ratio > 1 + threshold else ''
+        if flag:
+            slower.append(name)
+        print('{:<45} {:9.4f}s -> {:9.4f}s  x{:.2f} {}'.format(name, baseline[name]['wall'], result['wall'], ratio,
+                                                              flag))
+    return slower
+
+
+def main(args):
+    argparser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    argparser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    argparser.add_argument('--skip', nargs='+', choices=list(BENCHMARKS), default=[])
+    argparser.add_argument('--repeat', type=int, default=3)
+    argparser.add_argument('--output', default=None, help='results file, a timestamped one in ' + RESULTS_PATH)
+    argparser.add_argument('--compare', default=None, help='baseline results file to check for slowdowns')
+    argparser.add_argument('--threshold', type=float, default=0.1, help='allowed relative slowdown')
+    args = argparser.parse_args(args)
+
+    names = [name for name in args.only if name not in args.skip]
+    results = run(names, args.repeat)
+    output = args.output or RESULTS_PATH + time.strftime('%Y%m%d-%H%M%S') + '.json'
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w+') as write:
+        write.write(json.dumps({'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'repeat': args.repeat,
+                                'results': results}, indent=4))
+    print('results saved to', output)
+    if args.compare:
+        slower = compare(_load(args.compare)['results'], results, args.threshold)
+        if slower:
+            print('{} case(s) slower than the baseline by more than {:.0%}'.format(len(slower), args.threshold))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
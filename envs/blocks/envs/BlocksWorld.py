@@ -8,6 +8,8 @@ import time
 import imageio
 import json
 
+from envs.blocks.envs.TransitionTable import TransitionTable
+
 COLOURS = {'empty': [1, 1, 1],
            'wall': [0, 0, 0],
            'path': [0, 1, 0],
@@ -21,13 +23,14 @@ LEFT = 3
 PICKUP = 4
 PUTDOWN = 5
 NUM_ACTIONS = 6
+TABLE_CACHE_DIR = 'tasks_jsons/.cache/transition_tables/'
 
 
 class BlocksWorld(gym.Env):
     metadata = {'render.modes': ['human']}
 
     def __init__(self, map_dict, goal_reward=10.0, step_reward=-1.0,
-                 windiness=0.3):
+                 windiness=0.3, use_table=False, table_cache_dir=TABLE_CACHE_DIR):
         self.walls = None
         self.state = None
         self.possibleStates = []
@@ -41,31 +44,34 @@ class BlocksWorld(gym.Env):
         self.nice_action_reward = 5
         self.illegal_action_reward = -5
 
-        obs = (self.num_rows*self.num_cols)**3
-        self.observation_space = spaces.Discrete(obs)
+        self.observation_space = spaces.Discrete(self.num_states)
         self.action_space = spaces.Discrete(NUM_ACTIONS)
 
         self.windiness = windiness
 
         self.np_random = None
 
+        # optional precomputed (state, action) -> (next_state, reward, done) lookups
+        self.table = None
+        if use_table:
+            self.table = TransitionTable.load_or_build(self, table_cache_dir)
+
     def _map_init(self):
-        self.num_rows = self.map_dict['map']['rows']
-        self.num_cols = self.map_dict['map']['cols']
+        self.num_rows = int(self.map_dict['map']['rows'])
+        self.num_cols = int(self.map_dict['map']['cols'])
         if self.num_rows < 6:
             self.num_rows = 10 # too small table doesn't let learning
         if self.num_cols < 6:
             self.num_cols = 10 # too small table doesn't let learning
+        # occupancy grids: walls are static, blocks lying on the ground change with delivered
+        self.walls_grid = np.zeros((self.num_rows, self.num_cols), dtype=bool)
         if self.map_dict['map']['walls'] is not None:
-            self.walls = []
-            for wall in self.map_dict['map']['walls']:
-                if wall[0] == wall[2]:  # horizontal wall
-                    for y_c in range(wall[1], wall[3]+1):
-                        self.walls.append([wall[0], y_c])
-                if wall[1] == wall[3]:  # vertical wall
-                    for x_c in range(wall[0], wall[2]+1):
-                        if [x_c, wall[1]] not in self.walls:
-                            self.walls.append([x_c, wall[1]])
+            for x_0, y_0, x_1, y_1 in self.map_dict['map']['walls']:
+                if x_0 == x_1:  # horizontal wall
+                    self._fill_walls(x_0, x_0, y_0, y_1)
+                if y_0 == y_1:  # vertical wall
+                    self._fill_walls(x_0, x_1, y_0, y_0)
+            self.walls = np.argwhere(self.walls_grid).tolist()
         blocks = self.map_dict['blocks']
         self.blocks_start = {}
         self.blocks_dest = {}
@@ -93,6 +99,15 @@ class BlocksWorld(gym.Env):
         #     agent['start_x'] = agent['start_y'] = agent['goal_x'] = agent[
         #         'goal_y'] = 0.0  # pick-up and stack only from start
         self.num_blocks = len(self.delivered)
+        rc = self.num_rows * self.num_cols
+        # upper bound of the ids produced by _encode
+        self.num_states = rc ** (self.num_blocks + 1) * (self.num_blocks + 1) if self.num_blocks else rc ** 2
+        # state // _agent_divisor is the encoded cell of the agent
+        self._agent_divisor = rc ** self.num_blocks * (self.num_blocks + 1) if self.num_blocks else rc
+        self._blocks_grid = np.zeros((self.num_rows, self.num_cols), dtype=np.int16)
+        self.occupancy = self.walls_grid.copy()
+        for block in self.blocks_start.values():
+            self._add_block_cell(block, 1)
         self.agent_coord_mode = agent['coord_mode']
         b_in_h = 0
         if agent['holding_start'] is not None:
@@ -110,11 +125,29 @@ class BlocksWorld(gym.Env):
         self.state = self.starting_state
         self.goal = self._encode(goal_coord, self.blocks_dest, self.b_in_h_goal)
 
+    def _fill_walls(self, x_0, x_1, y_0, y_1):
+        # clipped to the map, negative bounds would wrap around
+        self.walls_grid[max(int(x_0), 0):max(int(x_1) + 1, 0), max(int(y_0), 0):max(int(y_1) + 1, 0)] = True
+
+    def _add_block_cell(self, block, count):
+        x, y = int(block['x']), int(block['y'])
+        if 0 <= x < self.num_rows and 0 <= y < self.num_cols:
+            self._blocks_grid[x, y] += count
+            self.occupancy[x, y] = self.walls_grid[x, y] or self._blocks_grid[x, y] > 0
+
+    def _deliver(self, index):
+        """Marks a block as delivered and moves its cell in the occupancy grid from start to destination."""
+        if not self.delivered[index]:
+            self.delivered[index] = True
+            name = self.block_names[index]
+            self._add_block_cell(self.blocks_start[name], -1)
+            self._add_block_cell(self.blocks_dest[name], 1)
+
     def _encode_row_col(self, row_col):
-        return row_col[0] * self.num_rows + row_col[1]
+        return int(row_col[0]) * self.num_cols + int(row_col[1])
 
     def _decode_row_col(self, i):
-        return [i // self.num_rows, i % self.num_rows]
+        return [i // self.num_cols, i % self.num_cols]
 
     def _encode(self, agent, blocks, block_in_hand):
         rc = self.num_rows * self.num_cols # получаем размер Q-таблицы
@@ -170,8 +203,16 @@ class BlocksWorld(gym.Env):
             blocks_dict[i]['y'] = blocks_arr[i][1]
         return blocks_dict
 
+    def _table_step(self, action):
+        i = self.table.index(self.state)
+        self.done = bool(self.table.dones[i, action])
+        self.state = int(self.table.states[self.table.next_index[i, action]])
+        return self.state, float(self.table.rewards[i, action]), self.done, None
+
     def step(self, action):
         assert self.action_space.contains(action)
+        if self.table is not None:
+            return self._table_step(action)
         if self.state == self.goal:
             self.done = True
             return self.state, self.goal_reward, self.done, None
@@ -221,7 +262,7 @@ class BlocksWorld(gym.Env):
                     b_in_h = 0
                     blocks_arr[curr_block_index] = curr_block_dest
                     reward = self.nice_action_reward
-                    self.delivered[curr_block_index] = True
+                    self._deliver(curr_block_index)
                 else:
                     reward = self.illegal_action_reward
         blocks = self._blocks_arr_to_dict(blocks_arr)
@@ -231,20 +272,7 @@ class BlocksWorld(gym.Env):
         return self.state, reward, self.done, None
 
     def _is_possible_move(self, state):
-        (a_x, a_y), _, _ = self._decode(state)
-        if self.walls is not None:
-            if [a_x, a_y] in self.walls:
-                return False
-        blocks_start_arr = [[block['x'], block['y']]
-                            for block in self.blocks_start.values()]
-        blocks_dest_arr = [[block['x'], block['y']]
-                           for block in self.blocks_dest.values()]
-        blocks_on_ground = [blocks_dest_arr[i] if val
-                            else blocks_start_arr[i]
-                            for i, val in enumerate(self.delivered)]
-        if [a_x, a_y] in blocks_on_ground:
-            return False
-        return True
+        return not self.occupancy.flat[state // self._agent_divisor]
 
     def reset(self):
         self.done = False
@@ -454,7 +482,7 @@ class BlocksWorld(gym.Env):
         for i in range(self.num_rows):
             for j in range(self.num_cols):
                 for k in range(3):
-                    if self.walls is not None and [i, j] in self.walls:
+                    if self.walls_grid[i, j]:
                         this_value = COLOURS['wall'][k]
                     else:
                         this_value = COLOURS['empty'][k]
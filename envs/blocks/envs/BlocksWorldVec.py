@@ -0,0 +1,186 @@
+import numpy as np
+
+from envs.blocks.envs.BlocksWorld import BlocksWorld, PICKUP, PUTDOWN, TABLE_CACHE_DIR
+
+# row and column shift of every action, pick up and put down keep the agent in place
+ACTION_DX = np.array([-1, 0, 1, 0, 0, 0])
+ACTION_DY = np.array([0, 1, 0, -1, 0, 0])
+
+
+class BlocksWorldVec(BlocksWorld):
+    """
+    num_envs copies of BlocksWorld stepped together with array operations.
+
+    Agent coordinates, block coordinates, block in hand and delivered flags of
+    every copy live in NumPy arrays, so one step() advances all copies. Copies
+    that reach the goal or run for max_steps are reset automatically. With
+    use_table=True a step is a lookup of all copies in the TransitionTable and
+    only the state ids are tracked.
+
+    """
+
+    def __init__(self, map_dict, num_envs=64, max_steps=1000, goal_reward=10.0, step_reward=-1.0,
+                 windiness=0.3, use_table=False, table_cache_dir=TABLE_CACHE_DIR):
+        super().__init__(map_dict, goal_reward=goal_reward, step_reward=step_reward, windiness=windiness,
+                         use_table=use_table, table_cache_dir=table_cache_dir)
+        self.num_envs = num_envs
+        self.max_steps = max_steps
+        self._vec_init()
+        self.reset()
+
+    def _vec_init(self):
+        (a_x, a_y), blocks, b_in_h = self._decode(self.starting_state)
+        self._start_agent = np.array([a_x, a_y], dtype=np.int64)
+        self._start_blocks = np.array(self._blocks_dict_to_arr(blocks), dtype=np.int64).reshape(self.num_blocks, 2)
+        self._start_b_in_h = b_in_h
+        self._blocks_start_arr = np.array(self._blocks_dict_to_arr(self.blocks_start),
+                                          dtype=np.int64).reshape(self.num_blocks, 2)
+        self._blocks_dest_arr = np.array(self._blocks_dict_to_arr(self.blocks_dest),
+                                         dtype=np.int64).reshape(self.num_blocks, 2)
+
+    def _encode_batch(self, agent, blocks, b_in_h):
+        rc = self.num_rows * self.num_cols
+        states = agent[:, 0] * self.num_cols + agent[:, 1]
+        for j in range(self.num_blocks):
+            states = states * rc + blocks[:, j, 0] * self.num_cols + blocks[:, j, 1]
+        if self.num_blocks:
+            return states * (self.num_blocks + 1) + b_in_h
+        return states * rc
+
+    @staticmethod
+    def _is_near_batch(agent, block):
+        diff = np.abs(agent - block)
+        return (diff <= 1).all(axis=1) & (diff != 0).any(axis=1)
+
+    def _reset_envs(self, mask):
+        self.agent[mask] = self._start_agent
+        self.blocks[mask] = self._start_blocks
+        self.b_in_h[mask] = self._start_b_in_h
+        self.delivered[mask] = False
+        self.steps[mask] = 0
+        self.returns[mask] = 0.0
+        self.states[mask] = self.starting_state
+
+    def reset(self):
+        n = self.num_envs
+        self.agent = np.empty((n, 2), dtype=np.int64)
+        self.blocks = np.empty((n, self.num_blocks, 2), dtype=np.int64)
+        self.b_in_h = np.empty(n, dtype=np.int64)
+        self.delivered = np.empty((n, self.num_blocks), dtype=bool)
+        self.steps = np.empty(n, dtype=np.int64)
+        self.returns = np.empty(n, dtype=np.float64)
+        self.states = np.empty(n, dtype=np.int64)
+        self._reset_envs(np.ones(n, dtype=bool))
+        return self.states.copy()
+
+    def _decode_batch(self, states):
+        rc = self.num_rows * self.num_cols
+        states = np.asarray(states, dtype=np.int64)
+        n = len(states)
+        if self.num_blocks:
+            b_in_h = states % (self.num_blocks + 1)
+            rest = states // (self.num_blocks + 1)
+        else:
+            b_in_h = np.zeros(n, dtype=np.int64)
+            rest = states // rc
+        blocks = np.empty((n, self.num_blocks, 2), dtype=np.int64)
+        for j in reversed(range(self.num_blocks)):
+            cell = rest % rc
+            blocks[:, j, 0] = cell // self.num_cols
+            blocks[:, j, 1] = cell % self.num_cols
+            rest = rest // rc
+        agent = np.stack([rest // self.num_cols, rest % self.num_cols], axis=1)
+        # a block is delivered iff it was put down at its destination and is not in hand again
+        in_hand = b_in_h[:, None] == np.arange(1, self.num_blocks + 1)
+        delivered = (blocks == self._blocks_dest_arr).all(axis=2) & ~in_hand
+        return agent, blocks, b_in_h, delivered
+
+    def _transition(self, agent, blocks, b_in_h, delivered, actions):
+        """
+        Batched BlocksWorld.step without side effects.
+
+        Returns new (agent, blocks, b_in_h, delivered) arrays together with
+        rewards and done flags of every row.
+
+        """
+        n = len(actions)
+        idx = np.arange(n)
+        done = self._encode_batch(agent, blocks, b_in_h) == self.goal
+        active = ~done
+        rewards = np.full(n, -1.0)
+        delivered = delivered.copy()
+
+        shift = np.stack([ACTION_DX[actions], ACTION_DY[actions]], axis=1)
+        new_agent = agent + shift
+        moved = active & (actions < PICKUP) & (new_agent >= 0).all(axis=1) & \
+            (new_agent[:, 0] < self.num_rows) & (new_agent[:, 1] < self.num_cols)
+        new_agent[~moved] = agent[~moved]
+        new_blocks = blocks.copy()
+        new_b_in_h = b_in_h.copy()
+        holding = b_in_h > 0
+
+        if self.num_blocks:
+            carried = moved & holding
+            new_blocks[carried, b_in_h[carried] - 1] += shift[carried]
+            undelivered = ~delivered
+            curr = np.where(holding, b_in_h - 1,
+                            np.where(undelivered.any(axis=1), undelivered.argmax(axis=1), -1))
+        else:
+            curr = np.full(n, -1)
+        rewards[active & ~moved & (curr == -1)] = self.illegal_action_reward
+
+        if self.num_blocks:
+            has_curr = active & ~moved & (curr >= 0)
+            safe_curr = np.maximum(curr, 0)
+            curr_dest = self._blocks_dest_arr[safe_curr]
+            pickup = has_curr & (actions == PICKUP)
+            putdown = has_curr & (actions == PUTDOWN)
+            can_pick = pickup & ~holding & self._is_near_batch(agent, blocks[idx, safe_curr])
+            can_put = putdown & holding & (b_in_h != self.b_in_h_goal) & self._is_near_batch(agent, curr_dest)
+            rewards[pickup | putdown] = self.illegal_action_reward
+            rewards[can_pick | can_put] = self.nice_action_reward
+            new_blocks[can_pick, curr[can_pick]] = agent[can_pick]
+            new_b_in_h[can_pick] = curr[can_pick] + 1
+            new_blocks[can_put, curr[can_put]] = curr_dest[can_put]
+            new_b_in_h[can_put] = 0
+            delivered[can_put, curr[can_put]] = True
+
+        impossible = done | self.walls_grid[new_agent[:, 0], new_agent[:, 1]]
+        if self.num_blocks:
+            on_ground = np.where(delivered[..., None], self._blocks_dest_arr, self._blocks_start_arr)
+            impossible |= (on_ground == new_agent[:, None, :]).all(axis=2).any(axis=1)
+        new_agent[impossible] = agent[impossible]
+        new_blocks[impossible] = blocks[impossible]
+        new_b_in_h[impossible] = b_in_h[impossible]
+        rewards[done] = self.goal_reward
+        return new_agent, new_blocks, new_b_in_h, delivered, rewards, done
+
+    def step(self, actions):
+        """
+        Applies one action per copy and returns (states, rewards, dones, info).
+
+        Finished copies are already reset in the returned states; their last
+        states before the reset are in info['final_states'].
+
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        if self.table is not None:
+            i = self.table.index(self.states)
+            rewards = self.table.rewards[i, actions].astype(np.float64)
+            done = self.table.dones[i, actions]
+            self.states = self.table.states[self.table.next_index[i, actions]]
+        else:
+            self.agent, self.blocks, self.b_in_h, self.delivered, rewards, done = \
+                self._transition(self.agent, self.blocks, self.b_in_h, self.delivered, actions)
+            self.states = self._encode_batch(self.agent, self.blocks, self.b_in_h)
+
+        self.returns += rewards
+        self.steps += 1
+        truncated = ~done & (self.steps >= self.max_steps)
+        info = {'final_states': self.states.copy(),
+                'truncated': truncated,
+                'episode_returns': self.returns.copy()}
+        finished = done | truncated
+        if finished.any():
+            self._reset_envs(finished)
+        return self.states.copy(), rewards, done, info
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+NUM_ACTIONS = 6
+# part of the cache key, bump it when the state encoding or the stored arrays change
+TABLE_VERSION = 1
+
+
+class TransitionTable:
+    """
+    Every transition of BlocksWorld reachable from its starting state.
+
+    states holds the sorted ids of the reachable states, row i of next_index,
+    rewards and dones describes the six actions applied in states[i]. Next
+    states are stored as row indices, so a training loop can stay in the
+    compact [0, len(states)) index space.
+
+    """
+
+    def __init__(self, states, next_index, rewards, dones, start, goal):
+        self.states = states
+        self.next_index = next_index
+        self.rewards = rewards
+        self.dones = dones
+        self.start = start
+        self.goal = goal
+        self.start_index = self.index(start)
+        self.goal_index = self.index(goal) if goal in self else -1
+
+    def __len__(self):
+        return len(self.states)
+
+    def __contains__(self, state):
+        i = np.searchsorted(self.states, state)
+        return i < len(self.states) and self.states[i] == state
+
+    def index(self, state):
+        """Row of a state id (or an array of ids) in the table."""
+        return np.searchsorted(self.states, state)
+
+    @staticmethod
+    def key(env):
+        """Hash of everything the table depends on: the table format, the map and the rewards."""
+        payload = json.dumps({'version': TABLE_VERSION,
+                              'map_dict': env.map_dict,
+                              'goal_reward': env.goal_reward,
+                              'nice_action_reward': env.nice_action_reward,
+                              'illegal_action_reward': env.illegal_action_reward},
+                             sort_keys=True)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    @classmethod
+    def build(cls, env, max_states=int(2e6)):
+        """Enumerates reachable states breadth-first with the batched BlocksWorldVec kernel."""
+        from envs.blocks.envs.BlocksWorldVec import BlocksWorldVec
+        vec = BlocksWorldVec(env.map_dict, num_envs=1, goal_reward=env.goal_reward,
+                             step_reward=env.step_reward, windiness=env.windiness)
+        actions = np.arange(NUM_ACTIONS)
+        known = np.array([env.starting_state], dtype=np.int64)
+        frontier = known
+        sources, next_states, rewards, dones = [], [], [], []
+        while len(frontier):
+            agent, blocks, b_in_h, delivered = vec._decode_batch(np.repeat(frontier, NUM_ACTIONS))
+            agent, blocks, b_in_h, _, reward, done = vec._transition(agent, blocks, b_in_h, delivered,
+                                                                     np.tile(actions, len(frontier)))
+            nxt = vec._encode_batch(agent, blocks, b_in_h)
+            sources.append(frontier)
+            next_states.append(nxt)
+            rewards.append(reward)
+            dones.append(done)
+            frontier = np.setdiff1d(nxt, known)
+            known = np.union1d(known, frontier)
+            if len(known) > max_states:
+                raise ValueError(f'more than {max_states} reachable states, the map is too big for a table')
+        sources = np.concatenate(sources)
+        order = np.argsort(sources, kind='stable')
+        next_index = np.searchsorted(known, np.concatenate(next_states)).reshape(-1, NUM_ACTIONS)[order]
+        rewards = np.concatenate(rewards).reshape(-1, NUM_ACTIONS)[order]
+        dones = np.concatenate(dones).reshape(-1, NUM_ACTIONS)[order]
+        return cls(known, next_index.astype(np.int32), rewards.astype(np.float32), dones,
+                   env.starting_state, env.goal)
+
+    def save(self, path):
+        """Writes the table next to path and moves it into place, readers never see a partial file."""
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as write:
+            np.savez_compressed(write, states=self.states, next_index=self.next_index,
+                                rewards=self.rewards, dones=self.dones, start=self.start, goal=self.goal)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data['states'], data['next_index'], data['rewards'], data['dones'],
+                   int(data['start']), int(data['goal']))
+
+    @classmethod
+    def load_or_build(cls, env, cache_dir):
+        """Loads the table of env from cache_dir, building and saving it on a miss."""
+        path = os.path.join(cache_dir, cls.key(env) + '.npz')
+        if os.path.exists(path):
+            return cls.load(path)
+        table = cls.build(env)
+        os.makedirs(cache_dir, exist_ok=True)
+        table.save(path)
+        return table
@@ -1 +1,2 @@
 from envs.blocks.envs.BlocksWorld import BlocksWorld
+from envs.blocks.envs.BlocksWorldVec import BlocksWorldVec
@@ -35,6 +35,33 @@ BLOCK_TO_COORDS = {
     7: [-1.5, 1.5, 1]
 }
 
+# (num_of_joints, block_pos, task) -> (best_block_dist, best_man_dist), the grid search only depends on these
+_PERFECT_POSITIONS = {}
+
+
+def hand_positions(manipulator_angles, num_of_joints):
+    """
+    Forward kinematics of an [..., num_of_joints] array of joint angles in degrees.
+
+    The first joint rotates the arm around z, the others bend it in the
+    vertical plane. Returns hand coordinates of shape [..., 3].
+
+    """
+    angles = np.deg2rad(np.asarray(manipulator_angles, dtype=float))
+    bend = np.cumsum(angles[..., 1:num_of_joints], axis=-1)
+    lengths = np.array(LENGTHS[1:num_of_joints])
+    reach = (lengths * np.cos(bend)).sum(axis=-1)
+    height = (lengths * np.sin(bend)).sum(axis=-1)
+    base = angles[..., 0]
+    # height of platform that holds the manipulator
+    return np.stack([reach * np.cos(base), reach * np.sin(base), height + 1], axis=-1)
+
+
+def joint_grid(num_of_joints):
+    """All joint configurations on the DEGREES grid inside BOUNDS, shape [n, num_of_joints]."""
+    axes = [np.arange(-(-low // DEGREES) * DEGREES, high + 1, DEGREES) for low, high in BOUNDS[:num_of_joints]]
+    return np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, num_of_joints)
+
 
 class Manipulator(gym.Env):
     metadata = {'render.modes': ['human']}
@@ -88,66 +115,19 @@ class Manipulator(gym.Env):
         return res
 
     def _calculate_perfect_positions(self):
-        def lb(bound):
-            while True:
-                if bound % DEGREES == 0:
-                    return bound
-                bound += 1
-
-        best_man_dist = np.inf
-        best_block_dist = np.inf
-        for first in range(lb(BOUNDS[0][0]), BOUNDS[0][1]+1, DEGREES):
-            for second in range(lb(BOUNDS[1][0]), BOUNDS[1][1]+1, DEGREES):
-                for third in range(lb(BOUNDS[2][0]), BOUNDS[2][1]+1, DEGREES):
-                    if self.num_of_joints == 4:
-                        for fourth in range(lb(BOUNDS[3][0]), BOUNDS[3][1]+1, DEGREES):
-                            pos = self._calculate_hand_pos([first, second, third, fourth])
-                            man_dist = self.distance(pos, self.goal_man_coords)
-                            if man_dist < best_man_dist:
-                                best_man_dist = man_dist
-
-                            block_dist = self.distance(pos, self.block_coords)
-                            if block_dist < best_block_dist:
-                                best_block_dist = block_dist
-                    else:
-                        pos = self._calculate_hand_pos([first, second, third])
-                        man_dist = self.distance(pos, self.goal_man_coords)
-                        if man_dist < best_man_dist:
-                            best_man_dist = man_dist
-
-                        block_dist = self.distance(pos, self.block_coords)
-                        if block_dist < best_block_dist:
-                            best_block_dist = block_dist
-        return best_block_dist, best_man_dist
+        key = (self.num_of_joints, self.block_pos, self.task)
+        if key not in _PERFECT_POSITIONS:
+            positions = hand_positions(joint_grid(self.num_of_joints), self.num_of_joints)
+            best_block_dist = np.linalg.norm(positions - self.block_coords, axis=1).min()
+            best_man_dist = np.linalg.norm(positions - self.goal_man_coords, axis=1).min()
+            _PERFECT_POSITIONS[key] = best_block_dist, best_man_dist
+        return _PERFECT_POSITIONS[key]
 
     def action_to_str(self, action):
         return ACTIONS[action]
 
     def _calculate_hand_pos(self, manipulator_angles):
-        # without rotation
-        def angle_n(n):
-            return np.deg2rad(manipulator_angles[n])
-
-        def rot_z_matr(angle):
-            ct = np.cos(angle)
-            st = np.sin(angle)
-            return np.array([[ct, -st,  0],
-                             [st, ct,  0],
-                             [0, 0,  1]])
-        temp_x = 0
-        temp_z = 0
-        temp_angle = 0
-        for i in range(self.num_of_joints-1):
-            temp_angle += angle_n(i+1)
-            temp_x += LENGTHS[i + 1] * np.cos(temp_angle)
-            temp_z += LENGTHS[i + 1] * np.sin(temp_angle)
-        point = np.array([temp_x, 0, temp_z])
-
-        # add rotation around z
-        rot_matr = rot_z_matr(angle_n(0))
-        point = rot_matr @ point
-        point[2] += 1  # height of platform that holds the manipulator
-        return point
+        return hand_positions(manipulator_angles, self.num_of_joints)
 
     def _encode(self, manipulator_angles, grabbed):
         res = 0
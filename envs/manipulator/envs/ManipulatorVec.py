@@ -0,0 +1,140 @@
+import numpy as np
+
+from agents.dqn.rewards import tolerance
+from envs.manipulator.envs.Manipulator import Manipulator, BOUNDS, DEGREES, BLOCK_TO_COORDS, TOL_BOUNDS, \
+    TOL_MARGIN, hand_positions
+
+BLOCK_COORDS = np.array([BLOCK_TO_COORDS[pos] for pos in range(len(BLOCK_TO_COORDS))], dtype=float)
+MOVEMENT = np.array([0, 0, 1])
+
+
+class ManipulatorVec(Manipulator):
+    """
+    One Manipulator per situation, stepped together with array operations.
+
+    Joint angles, grabbed flags, block positions and tasks of every copy live
+    in NumPy arrays, so hand positions, tolerance rewards and done flags of
+    all copies come out of one step(). Observations are the return_all
+    vectors of Manipulator stacked into [num_envs, num_of_joints + 2], ready
+    for a batched forward pass. Copies that finish or run for max_steps are
+    reset to their situation automatically.
+
+    """
+
+    def __init__(self, situations, max_steps=1000, goal_reward=50.0, step_reward=-1.0, windiness=0.3):
+        super().__init__(situations[0], goal_reward=goal_reward, step_reward=step_reward, windiness=windiness)
+        self.situations = list(situations)
+        self.num_envs = len(situations)
+        self.max_steps = max_steps
+        self._vec_init()
+        self.reset()
+
+    def _vec_init(self):
+        n, joints = self.num_envs, self.num_of_joints
+        self._lows = np.array([low for low, _ in BOUNDS[:joints]])
+        self._highs = np.array([high for _, high in BOUNDS[:joints]])
+        self._start_angles = np.empty((n, joints), dtype=np.int64)
+        self._start_grabbed = np.empty(n, dtype=bool)
+        self._situation_block_pos = np.empty(n, dtype=np.int64)
+        self.task_grab = np.empty(n, dtype=bool)
+        for i, situation in enumerate(self.situations):
+            self._load_situation(i, situation)
+
+    def _load_situation(self, i, situation):
+        # angles go through the state encoding like in Manipulator, which also pads shorter angle lists
+        angles, _ = self._decode(self._encode(situation['manipulator_angles'], situation['grabbed']))
+        self._start_angles[i] = np.rint(angles)
+        self._start_grabbed[i] = bool(situation['grabbed'])
+        self._situation_block_pos[i] = situation['block_pos'] or 0
+        self.task_grab[i] = situation['task'] == 'grab'
+
+    def set_situation(self, i, situation):
+        """Puts copy i into a new situation and resets it there."""
+        self.situations[i] = situation
+        self._load_situation(i, situation)
+        mask = np.zeros(self.num_envs, dtype=bool)
+        mask[i] = True
+        self._reset_envs(mask)
+        return self._observations()[i]
+
+    def _reset_envs(self, mask):
+        self.angles[mask] = self._start_angles[mask]
+        self.grabbed[mask] = self._start_grabbed[mask]
+        # like Manipulator._map_init, a missing (or zero) block_pos is drawn again on every reset
+        block_pos = self._situation_block_pos[mask]
+        random_pos = block_pos == 0
+        block_pos[random_pos] = np.random.choice(list(range(8)), size=random_pos.sum())
+        self.block_pos_arr[mask] = block_pos
+        self.block_coords_arr[mask] = BLOCK_COORDS[block_pos]
+        self.goal_man_coords_arr[mask] = BLOCK_COORDS[block_pos] + MOVEMENT
+        self.steps[mask] = 0
+        self.returns[mask] = 0.0
+
+    def reset(self, return_all=True):
+        n = self.num_envs
+        self.angles = np.empty((n, self.num_of_joints), dtype=np.int64)
+        self.grabbed = np.empty(n, dtype=bool)
+        self.block_pos_arr = np.empty(n, dtype=np.int64)
+        self.block_coords_arr = np.empty((n, 3))
+        self.goal_man_coords_arr = np.empty((n, 3))
+        self.steps = np.empty(n, dtype=np.int64)
+        self.returns = np.empty(n, dtype=np.float64)
+        self._reset_envs(np.ones(n, dtype=bool))
+        return self._observations()
+
+    def _observations(self):
+        normed = (self.angles - self._lows) / (self._highs - self._lows)
+        return np.concatenate([normed, self.grabbed[:, None], self.block_pos_arr[:, None] / 7], axis=1)
+
+    def step(self, actions, return_all=True):
+        """
+        Applies one action per copy and returns (observations, rewards, dones, info).
+
+        Finished copies are already reset in the returned observations; their
+        last observations before the reset are in info['final_observations'].
+
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        n = self.num_envs
+        idx = np.arange(n)
+        joints = self.num_of_joints
+        old_pos = hand_positions(self.angles, joints)
+        old_distance = np.linalg.norm(self.block_coords_arr - old_pos, axis=1)
+        goal_grabbed = np.where(self.task_grab, self.grabbed, ~self.grabbed)
+        at_goal = goal_grabbed & (np.linalg.norm(self.goal_man_coords_arr - old_pos, axis=1) < 0.5)
+        active = ~at_goal
+        rewards = np.zeros(n)
+
+        turn = active & (actions < joints * 2)
+        joint = np.minimum(actions // 2, joints - 1)
+        new_angles = self.angles.copy()
+        new_angles[idx, joint] += np.where(actions % 2 == 0, DEGREES, -DEGREES)
+        legal = (new_angles[idx, joint] >= self._lows[joint]) & (new_angles[idx, joint] <= self._highs[joint])
+        rewards[turn & ~legal] = self.illegal_action_reward
+        turned = turn & legal
+        self.angles[turned] = new_angles[turned]
+        new_distance = np.linalg.norm(self.block_coords_arr - hand_positions(self.angles, joints), axis=1)
+        rewards[turned] = tolerance(new_distance[turned], bounds=TOL_BOUNDS, margin=TOL_MARGIN) / 10
+
+        grab = active & (actions == joints * 2)
+        release = active & (actions == joints * 2 + 1)
+        can_grab = grab & ~self.grabbed & self.task_grab & (old_distance <= 0.5)
+        can_release = release & self.grabbed & ~self.task_grab & (old_distance <= 0.5)
+        rewards[grab | release] = self.illegal_action_reward
+        self.grabbed[can_grab] = True
+        self.grabbed[can_release] = False
+        done = at_goal | can_grab | can_release
+        rewards[done] = self.goal_reward
+
+        observations = self._observations()
+        self.returns += rewards
+        self.steps += 1
+        truncated = ~done & (self.steps >= self.max_steps)
+        info = {'final_observations': observations,
+                'truncated': truncated,
+                'episode_returns': self.returns.copy()}
+        finished = done | truncated
+        if finished.any():
+            self._reset_envs(finished)
+            observations = self._observations()
+        return observations, rewards, done, info
@@ -1 +1,2 @@
 from envs.manipulator.envs.Manipulator import Manipulator
+from envs.manipulator.envs.ManipulatorVec import ManipulatorVec
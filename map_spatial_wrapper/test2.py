@@ -1,4 +1,5 @@
 import argparse
+import hashlib
 import os
 import platform
 import json
@@ -6,7 +7,8 @@ import json
 from .config_master import create_config, get_config
 from mapspatial.mapplanner import MapPlanner
 
-def main(args, task_num, type, solution_save_path):
+def search(args, task_num, type):
+    """Runs the planner, returns the solution and the path of the problem file."""
     if platform.system() != 'Windows':
         delim = '/'
     else:
@@ -34,26 +36,73 @@ def main(args, task_num, type, solution_save_path):
     # after 1 time creating config simply send a path
     planner = MapPlanner(**get_config(path))
     solution = planner.search()
-    save_steps(solution, planner.problem, solution_save_path)
+    return solution, planner.problem
+
+
+def main(args, task_num, type, solution_save_path=None):
+    solution, problem_path = search(args, task_num, type)
+    if solution_save_path is not None:
+        save_steps(solution, problem_path, solution_save_path)
     return solution
 
 
-def save_steps(solution, problem_path, save_path):
+def planner_steps(solution, problem_path):
+    """
+    Yields the situations of the solution actions in plan order, ready for
+    utils.planner_parser.parse, without a round trip through files.
+    """
     with open(problem_path, 'r') as read:
         map_data = json.load(read)['map']
-    situations = []
+    seen = set()
     for i in solution:
         for j in i.values():
             for k in j:
                 if k[1] != 'Clarify' and k[1] != 'Abstract' and k[1] != 'rotate':
-                    sit = {'map': map_data,
-                                       'global-start': k[6][0],
-                                       'global-finish': k[6][1]}
-                    if sit not in situations:
-                        situations.append(sit)
-    for i, sit in enumerate(situations):
+                    # every situation refers to the one map_data, so start and finish tell them apart
+                    digest = situation_digest(k[6][0], k[6][1])
+                    if digest not in seen:
+                        seen.add(digest)
+                        yield {'map': map_data,
+                               'global-start': k[6][0],
+                               'global-finish': k[6][1]}
+
+
+def situation_digest(start, finish):
+    """Hash of a situation by its global start and finish, the same for equal contents."""
+    payload = json.dumps([start, finish], sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def pack_steps(steps):
+    """Steps as one JSON-ready document, every distinct map is stored once."""
+    maps = []
+    situations = []
+    for sit in steps:
+        if not maps or (sit['map'] is not maps[-1] and sit['map'] != maps[-1]):
+            maps.append(sit['map'])
+        situations.append({'map': len(maps) - 1,
+                           'global-start': sit['global-start'],
+                           'global-finish': sit['global-finish']})
+    return {'maps': maps, 'situations': situations}
+
+
+def unpack_steps(document):
+    """Steps of a pack_steps document, situations of one map share it."""
+    maps = document['maps']
+    return [{'map': maps[sit['map']],
+             'global-start': sit['global-start'],
+             'global-finish': sit['global-finish']} for sit in document['situations']]
+
+
+def write_steps(steps, save_path, indent=4):
+    """Disk sink of planner steps, <save_path>/<i>.json for the i-th step."""
+    for i, sit in enumerate(steps):
         with open(save_path + f'/{i}.json', 'w+') as write:
-            write.write(json.dumps(sit, indent=4))
+            write.write(json.dumps(sit, indent=indent))
+
+
+def save_steps(solution, problem_path, save_path):
+    write_steps(planner_steps(solution, problem_path), save_path)
 
 
 # if __name__ == '__main__':
@@ -17,7 +17,6 @@ class PlanningTask(Task):
     def __init__(self, name, signs, start_situation, goal_situation, subtasks=None):
         super().__init__(name, signs)
         self.name = name
-        self.signs = signs
         self.start_situation = start_situation
         self.goal_situation = goal_situation
         self.subtasks = subtasks
@@ -62,8 +61,8 @@ class PlanningTask(Task):
         if plan:
             logging.debug('\tCleaning swm...')
 
-            self.start_situation.name += self.name
-            self.goal_situation.name += self.name
+            self.start_situation.set_name(self.start_situation.name + self.name)
+            self.goal_situation.set_name(self.goal_situation.name + self.name)
 
             plan_sit = [pm[0].sign for pm in plan]
             pl_cm_ind = [pm[0].index for pm in plan]
@@ -105,12 +104,12 @@ class PlanningTask(Task):
                 pm_signs = im.get_signs()
                 for sit in pm_signs:
                     if sit in plan_sit:
-                        global_sit.images.pop(ind)
+                        global_sit.drop('image', ind)
                     else:
                         global_sit.remove_image(im)
 
             for sit in plan_sit:
-                sit.out_images = []
+                sit.clear_out('image')
                 global_cm = global_sit.add_image()
                 sit_im = sit.images[1]
                 connector = global_cm.add_feature(sit_im)
@@ -126,10 +125,7 @@ class PlanningTask(Task):
                 if name.startswith(SIT_PREFIX):
                     self.signs.pop(name)
                 else:
-                    sign.meanings = {}
-                    sign.out_meanings = []
-                    sign.images = {}
-                    sign.out_images = []
+                    sign.clear('meaning', 'image')
         if self.I_obj:
             I_obj = "_"+self.I_obj[0].name
         else:
@@ -150,13 +146,13 @@ class PlanningTask(Task):
             start.sign.add_meaning(scm)
             for con in start.sign.out_meanings.copy():
                 if con.in_sign.name == plan_name:
-                    start.sign.out_meanings.remove(con)
+                    start.sign.remove_out_meaning(con)
         if not finish.sign.meanings:
             fcm = finish.copy('image', 'meaning')
             finish.sign.add_meaning(fcm)
             for con in finish.sign.out_meanings.copy():
                 if con.in_sign.name == plan_name:
-                    finish.sign.out_meanings.remove(con)
+                    finish.sign.remove_out_meaning(con)
         plan_sign = Sign(plan_name + self.name)
         plan_mean = plan_sign.add_meaning()
         connector = plan_mean.add_feature(start.sign.meanings[1])
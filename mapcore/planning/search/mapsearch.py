@@ -1,7 +1,7 @@
 import logging
 
 from mapcore.swm.src.components import sign_task as st
-from mapcore.swm.src.components.semnet import Sign
+from mapcore.swm.src.components.semnet import Sign, forget_activity
 from copy import copy, deepcopy
 import itertools
 
@@ -48,7 +48,10 @@ class MapSearch():
         else:
             self.I_obj = None
         self.precedent_activation()
-        plans = self._map_iteration(self.active_pm, iteration=0, current_plan=[])
+        try:
+            plans = self._map_iteration(self.active_pm, iteration=0, current_plan=[])
+        finally:
+            forget_activity()
         return plans, self.goal
 
 
@@ -174,6 +177,19 @@ class MapSearch():
                     pr = list(precedent)[0].sign
                     self.precedents.add(pr.meanings[1])
 
+    def including_situations(self, pm):
+        """
+        Experienced situations that include pm. Only the situations that have
+        every sign of the events of pm are checked, they come from the index
+        of the world model.
+        """
+        candidates = None
+        for event in pm.fingerprint().applicable:
+            for name in event.signature()[1]:
+                situations = self.world_model.situations(name)
+                candidates = situations if candidates is None else candidates & situations
+        return [sit for sit in self.exp_sits if (candidates is None or sit in candidates) and sit.includes('image', pm)]
+
     def applicable_search(self, meanings, active_pm):
         applicable_meanings = set()
         for agent, cm in meanings:
@@ -193,12 +209,7 @@ class MapSearch():
         This function implements experience actions search in agent's world model
         :return:
         """
-        exp_acts = {}
-        for name, sign in self.world_model.items():
-            if sign.meanings and sign.images:
-                for index, cm in sign.meanings.items():
-                    if cm.is_causal():
-                        exp_acts.setdefault(sign, {})[index] = cm
+        exp_acts = self.world_model.causal_meanings()
 
         applicable_meanings = {}
         used = {key: {} for key in exp_acts.keys()}
@@ -252,7 +263,7 @@ class MapSearch():
         for action in applicable:
             plan = copy(cur_plan)
             next_pm = self._time_shift_forward(active_pm, action[1], self.backward)
-            included_sit = [sit for sit in self.exp_sits if sit.includes('image', next_pm)]
+            included_sit = self.including_situations(next_pm)
             if included_sit:
                 plan.append(
                     (active_pm.sign.images[1], action[1].sign.name, action[1], action[0]))
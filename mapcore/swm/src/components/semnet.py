@@ -1,13 +1,91 @@
 import itertools
+import sys
+import weakref
+from collections import Counter
 from copy import copy
 
+# generation of the network, bumped by every change of matrices, events and out connectors
+generation = 0
+# weak references to the world models told the names of the changed signs, to update their indexes
+watchers = []
+# (spread function, id of the matrix or sign, base, depth) -> (matrix or sign, activity) of _activity_generation,
+# dropped when the network changes and when a search ends
+_activity = {}
+_activity_generation = 0
 
-class CausalMatrix:
+
+def changed(sign=None):
+    global generation
+    generation += 1
+    if sign is not None:
+        # a copy, collected world models remove their references from watchers
+        for ref in list(watchers):
+            world_model = ref()
+            if world_model is not None:
+                world_model.touch(sign)
+
+
+def watch(world_model):
+    watchers.append(weakref.ref(world_model, watchers.remove))
+
+
+def cached_activity(owner, spread, base, depth):
+    """
+    Result of spread(owner, base, depth), computed once per generation of the
+    network. Callers get the cached object itself and must not change it. The
+    owner is kept in the entry, so its id is not reused while the entry lives.
+    """
+    global _activity_generation
+    if not _activity_generation == generation:
+        _activity.clear()
+        _activity_generation = generation
+    key = (spread, id(owner), base, depth)
+    entry = _activity.get(key)
+    if entry is None:
+        entry = _activity[key] = (owner, spread(owner, base, depth))
+    return entry[1]
+
+
+def forget_activity():
+    """Drops the cached activity, its entries keep their matrices and signs and so the whole network alive."""
+    _activity.clear()
+
+
+class Slotted:
+    """
+    Base of the __slots__ classes of the network, a grounded task creates
+    hundreds of thousands of them, so they carry no per-instance __dict__.
+    Pickled state is the dict of the set slots, as it was for the dict-backed
+    classes, so world models pickled before the slots still load. Slots
+    named in _cached hold values derived from the others and are not pickled.
+    """
+    __slots__ = ()
+    _cached = ()
+
+    def __getstate__(self):
+        state = {}
+        for name in self.__slots__:
+            if name in self._cached:
+                continue
+            try:
+                state[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class CausalMatrix(Slotted):
     """
     Causal matrix - main structure in causal network defining causal and hierarchical relations
     cause - is the list of causal events at each moment
     effect - is the list of effect events at each moment (can be empty)
     """
+    __slots__ = ('sign', 'index', 'cause', 'effect', '_fingerprint')
+    _cached = ('_fingerprint',)
 
     def __init__(self, sign=None, index=None, cause=None, effect=None):
         self.sign = sign
@@ -20,6 +98,7 @@ class CausalMatrix:
             self.effect = []
         else:
             self.effect = effect
+        self._fingerprint = None
 
     def __str__(self):
         return '{0}:{1}'.format(str(self.sign), str(self.index))
@@ -44,19 +123,22 @@ class CausalMatrix:
         return False
 
     def __sub__(self, cm):
+        fingerprint = cm.fingerprint()
         subtraction = []
-        for e1 in self.cause:
-            for e2 in cm.cause:
-                if e1.exp_resonate(e2):
-                    break
-            else:
-                subtraction.append(e1)
-        for e1 in self.effect:
-            for e2 in cm.effect:
-                if e1.exp_resonate(e2):
-                    break
-            else:
-                subtraction.append(e1)
+        for events, part, signatures in ((self.cause, cm.cause, fingerprint.causes),
+                                         (self.effect, cm.effect, fingerprint.effects)):
+            for e1 in events:
+                count, names = e1.signature()
+                if count == len(names):
+                    # no repeated out signs, e1 exp_resonates exactly with the events of its signature
+                    if (count, names) not in signatures:
+                        subtraction.append(e1)
+                    continue
+                for e2 in part:
+                    if e1.exp_resonate(e2):
+                        break
+                else:
+                    subtraction.append(e1)
         return subtraction
 
     def longstr(self):
@@ -67,6 +149,8 @@ class CausalMatrix:
         mult, part = (-1, self.effect) if effect else (1, self.cause)
         order = (len(part) + 1) * mult
         part.append(event)
+        self._fingerprint = None
+        changed(self.sign)
         return order
 
     def get_event(self, order):
@@ -96,7 +180,11 @@ class CausalMatrix:
             connector.in_order = (len(part) + 1) * mult
             part.append(Event(connector.in_order, {connector}))
         else:
-            part[abs(order) - 1].coincidences.add(connector)
+            event = part[abs(order) - 1]
+            event.coincidences.add(connector)
+            event._signature = None
+        self._fingerprint = None
+        changed(self.sign)
         if zero_out and not actuator and not view:
             connector.out_index = 0
         return connector
@@ -108,10 +196,9 @@ class CausalMatrix:
         return len(self.effect) > 0
 
     def includes(self, base, smaller):
-        sub1 = [event for event in itertools.chain(self.cause, self.effect) if "I" not in event.get_signs_names()]
-        sub2 = [event for event in itertools.chain(smaller.cause, smaller.effect) if "I" not in event.get_signs_names()]
-        for event2 in sub2:
-            for event1 in sub1:
+        fingerprint = self.fingerprint()
+        for event2 in smaller.fingerprint().applicable:
+            for event1 in fingerprint.candidates(event2):
                 if event2.resonate(base, event1):
                     break
             else:
@@ -119,6 +206,16 @@ class CausalMatrix:
 
         return True
 
+    def fingerprint(self):
+        """
+        Fingerprint of the events of the matrix, built on the first call and
+        kept until the events change
+        """
+        fingerprint = getattr(self, '_fingerprint', None)
+        if fingerprint is None or not fingerprint.size == (len(self.cause), len(self.effect)):
+            fingerprint = self._fingerprint = Fingerprint(self)
+        return fingerprint
+
     def copy(self, base, new_base, copied=None):
         if copied is None:
             copied = {}
@@ -127,6 +224,7 @@ class CausalMatrix:
             pm.cause.append(event.copy(pm, base, new_base, copied))
         for event in self.effect:
             pm.effect.append(event.copy(pm, base, new_base, copied))
+        changed(pm.sign)
         return pm
 
     def expand(self, base, copied=None):
@@ -143,6 +241,7 @@ class CausalMatrix:
             cm.cause.extend(event.expand(cm, base, copied))
         for event in self.effect:
             cm.effect.extend(event.expand(cm, base, copied))
+        changed(cm.sign)
         return cm
 
     def replace(self, base, old_sign, new_cm, deleted=None):
@@ -152,21 +251,23 @@ class CausalMatrix:
             event.replace(base, old_sign, new_cm, deleted)
         for event in self.effect:
             event.replace(base, old_sign, new_cm, deleted)
+        self._fingerprint = None
+        changed(self.sign)
 
     def resonate(self, base, pm, check_order=True, check_sign=True):
         if check_sign and not self.sign == pm.sign:
             return False
-        sub1 = [event for event in itertools.chain(self.cause, self.effect) if "I" not in event.get_signs_names()]
-        sub2 = [event for event in itertools.chain(pm.cause, pm.effect) if "I" not in event.get_signs_names()]
-        if not len(sub1) == len(sub2):
+        fingerprint1 = self.fingerprint()
+        fingerprint2 = pm.fingerprint()
+        if not len(fingerprint1.applicable) == len(fingerprint2.applicable):
             return False
         if check_order:
             for e1, e2 in zip(itertools.chain(self.cause, self.effect), itertools.chain(pm.cause, pm.effect)):
                 if not e1.resonate(base, e2):
                     return False
         else:
-            for e1 in sub1:
-                for e2 in sub2:
+            for e1 in fingerprint1.applicable:
+                for e2 in fingerprint2.candidates(e1):
                     if e1.resonate(base, e2, check_order):
                         break
                 else:
@@ -188,11 +289,15 @@ class CausalMatrix:
         @param depth: recursive depth of spreading
         @return: active chains of PredictionMatrices
         """
+        chains = cached_activity(self, CausalMatrix._spread_down_activity, base, depth)
+        return [list(chain) for chain in chains]
+
+    def _spread_down_activity(self, base, depth):
         active_chains = []
 
         def check_pm(pm):
             if not pm.is_empty():
-                chains = pm.spread_down_activity(base, depth - 1)
+                chains = cached_activity(pm, CausalMatrix._spread_down_activity, base, depth - 1)
                 for chain in chains:
                     active_chains.append([self] + chain)
             else:
@@ -273,10 +378,12 @@ class CausalMatrix:
                         iner.append(cm)
         return iner
 
-class Event:
+class Event(Slotted):
     """
     Event - the set of coincident connectors
     """
+    __slots__ = ('order', 'coincidences', '_signature')
+    _cached = ('_signature',)
 
     def __init__(self, order, coincidences=None):
         self.order = order
@@ -284,6 +391,7 @@ class Event:
             self.coincidences = set()
         else:
             self.coincidences = coincidences
+        self._signature = None
 
     def __str__(self):
         return '{{{0}}}'.format(','.join(str(x) for x in self.coincidences))
@@ -300,20 +408,33 @@ class Event:
                 return True
         return False
 
+    def signature(self):
+        """
+        Number of connectors and frozenset of the names of their out signs,
+        kept until the connectors change. Every out sign of an event has to be
+        in the signature of the event it resonates with.
+        """
+        signature = getattr(self, '_signature', None)
+        if signature is None:
+            names = frozenset(con.out_sign.name for con in self.coincidences if isinstance(con, Connector))
+            signature = self._signature = (len(self.coincidences), names)
+        return signature
+
     def add_coincident(self, base, connector):
         self.coincidences.add(connector)
+        self._signature = None
+        changed(connector.in_sign)
         getattr(connector.out_sign, 'add_out_' + base)(connector)
 
     def resonate(self, base, event, check_order=True):
-        if not len(self.coincidences) == len(event.coincidences):
-            if not len(self.coincidences) == 1 and not [con.out_sign.name for con in self.coincidences][0] in [con.out_sign.name for con in event.coincidences]:
-                return False
+        if not self.signature()[1] <= event.signature()[1]:
+            return False
         for connector in self.coincidences:
             for conn in event.coincidences:
                 if connector.out_sign == conn.out_sign:
                     cm = connector.get_out_cm(base)
                     pm = conn.get_out_cm(base)
-                    if cm.get_signs() == pm.get_signs():
+                    if cm.fingerprint().names == pm.fingerprint().names:
                         break
             else:
                 return False
@@ -326,6 +447,8 @@ class Event:
     def exp_resonate(self, event):
         if not len(self.coincidences) == len(event.coincidences):
             return False
+        if not self.signature()[1] <= event.signature()[1]:
+            return False
         for connector in self.coincidences:
             for conn in event.coincidences:
                 if connector.out_sign == conn.out_sign:
@@ -372,6 +495,7 @@ class Event:
                     deleted.append(connector.out_index)
                 connector.out_sign = new_cm.sign
                 connector.out_index = new_cm.index
+                self._signature = None
             else:
                 connector.get_out_cm(base).replace(base, old_sign, new_cm, deleted)
     def get_signs(self):
@@ -380,16 +504,51 @@ class Event:
             scm.add(connector.out_sign)
         return scm
     def get_signs_names(self):
-        scm = set()
-        for connector in self.coincidences:
-            scm.add(str(connector.out_sign.name))
-        #names = {s.name for s in scm}
-        return scm
+        return {str(name) for name in self.signature()[1]}
 
-class Connector:
+
+class Fingerprint:
+    """
+    Canonical fingerprint of a causal matrix built from the signatures of its events
+    ordered - signatures of the cause and effect events in order
+    unordered - multiset of the signatures as a frozenset of (signature, count)
+    names - names of all out signs, what get_signs() of equal sets have in common
+    applicable - events without "I", the ones resonate() and includes() match
+    postings - name of an out sign -> positions in applicable of the events with it
+    causes, effects - signatures of the cause and effect events
+    """
+    __slots__ = ('size', 'ordered', 'unordered', 'names', 'applicable', 'postings', 'causes', 'effects')
+
+    def __init__(self, cm):
+        self.size = (len(cm.cause), len(cm.effect))
+        self.causes = frozenset(event.signature() for event in cm.cause)
+        self.effects = frozenset(event.signature() for event in cm.effect)
+        self.ordered = tuple(event.signature() for event in itertools.chain(cm.cause, cm.effect))
+        self.unordered = frozenset(Counter(self.ordered).items())
+        self.names = frozenset().union(*(names for _, names in self.ordered))
+        self.applicable = []
+        self.postings = {}
+        for event in itertools.chain(cm.cause, cm.effect):
+            names = event.signature()[1]
+            if 'I' in names:
+                continue
+            for name in names:
+                self.postings.setdefault(name, []).append(len(self.applicable))
+            self.applicable.append(event)
+
+    def candidates(self, event):
+        """Applicable events, in order, that have every out sign of event"""
+        names = event.signature()[1]
+        if not names:
+            return self.applicable
+        positions = min((self.postings.get(name, ()) for name in names), key=len)
+        return [self.applicable[i] for i in positions if names <= self.applicable[i].signature()[1]]
+
+class Connector(Slotted):
     """
     Connector - link between to sign components with marker (in_index, in_order, out_index)
     """
+    __slots__ = ('in_sign', 'out_sign', 'in_index', 'out_index', 'in_order')
 
     def __init__(self, in_sign, out_sign, in_index, out_index=None, in_order=None):
         self.in_sign = in_sign
@@ -423,10 +582,11 @@ class Connector:
     def get_in_cm(self, base):
         return getattr(self.in_sign, base + 's')[self.in_index]
 
-class Actuator():
+class Actuator(Slotted):
     """
     Actuator - link between sign and motor function with order marker
     """
+    __slots__ = ('in_sign', 'motor', 'in_order')
 
     def __init__(self, in_sign, motor, in_order=None):
         self.in_sign = in_sign
@@ -438,11 +598,13 @@ class Actuator():
     def __repr__(self):
         return '{0}->{1}:{2}'.format(self.in_sign, self.motor, self.in_order)
 
-class View:
+class View(Slotted):
     """
     View - link between sign and view of this sign.
     Views can be implemented in lists, tuples, ndarrays, etc...
     """
+    __slots__ = ('in_sign', 'view', 'in_order')
+
     def __init__(self, in_sign, view, in_order = None):
         self.in_sign = in_sign
         self.view = view
@@ -454,9 +616,13 @@ class View:
     def __repr__(self):
         return '{0}->{1}:{2}'.format(self.in_sign, self.view, self.in_order)
 
-class Sign:
+class Sign(Slotted):
+    __slots__ = ('name', 'images', 'significances', 'meanings', 'out_significances', 'out_images', 'out_meanings',
+                 '_next_image', '_next_significance', '_next_meaning')
+
     def __init__(self, name):
-        self.name = name
+        # names are compared and hashed all the time, interned ones compare by identity first
+        self.name = sys.intern(name) if type(name) is str else name
         self.images = {}
         self.significances = {}
         self.meanings = {}
@@ -493,6 +659,7 @@ class Sign:
             pm.index = self._next_image
         self.images[pm.index] = pm
         self._next_image += 1
+        changed(self)
         return pm
 
     def add_significance(self, pm=None):
@@ -502,6 +669,7 @@ class Sign:
             pm.index = self._next_significance
         self.significances[pm.index] = pm
         self._next_significance += 1
+        changed(self)
         return pm
 
     def add_meaning(self, pm=None):
@@ -511,19 +679,36 @@ class Sign:
             pm.index = self._next_meaning
         self.meanings[pm.index] = pm
         self._next_meaning += 1
+        changed(self)
         return pm
 
 
     def add_out_significance(self, connector):
         self.out_significances.append(connector)
+        changed(self)
 
     def add_out_image(self, connector):
         self.out_images.append(connector)
+        changed(self)
 
     def add_out_meaning(self, connector):
         self.out_meanings.append(connector)
+        changed(self)
+
+    def remove_out_significance(self, connector):
+        self.out_significances.remove(connector)
+        changed(self)
+
+    def remove_out_image(self, connector):
+        self.out_images.remove(connector)
+        changed(self)
+
+    def remove_out_meaning(self, connector):
+        self.out_meanings.remove(connector)
+        changed(self)
 
     def remove_meaning(self, cm, deleted=None):
+        changed(self)
         if deleted is None:
             deleted = []
         for event in cm.cause:
@@ -548,6 +733,7 @@ class Sign:
             raise Exception('Already removed!')
 
     def remove_significance(self, cm, deleted=None):
+        changed(self)
         if deleted is None:
             deleted = []
         for event in cm.cause:
@@ -572,6 +758,7 @@ class Sign:
             raise Exception('Already removed!')
 
     def remove_image(self, cm, deleted=None):
+        changed(self)
         if deleted is None:
             deleted = []
         for event in cm.cause:
@@ -595,16 +782,59 @@ class Sign:
             raise Exception('Already removed!')
 
     def remove_view(self, cm):
+        changed(self)
         for event in itertools.chain(cm.cause, cm.effect):
             for connector in event.coincidences:
                 if connector.out_index > 0:
                     pm = connector.get_out_cm('image')
                     del pm.sign.images[pm.index]
+                    changed(pm.sign)
                     for connector in copy(pm.sign.out_images):
                         if connector.out_index == pm.index:
                             pm.sign.out_images.remove(connector)
         del self.images[cm.index]
 
+    def drop(self, base, index):
+        """
+        Takes the causal matrix of index out of the base of the sign, unlike
+        remove_<base> the connectors to and from it are left as they are
+        """
+        changed(self)
+        return getattr(self, base + 's').pop(index)
+
+    def clear(self, *bases):
+        """Forgets the causal matrices of the bases and the connectors to them, connected signs keep theirs"""
+        changed(self)
+        for base in bases:
+            setattr(self, base + 's', {})
+        self.clear_out(*bases)
+
+    def clear_out(self, *bases):
+        """Forgets the connectors of the bases to the causal matrices of the sign"""
+        changed(self)
+        for base in bases:
+            setattr(self, 'out_' + base + 's', [])
+
+    def set_name(self, name):
+        """
+        Gives the sign a new name in place, unlike rename() which builds a new
+        sign. Signatures of the events connected to the sign and the indexes of
+        the world models are built again.
+        """
+        changed(self)
+        for base in ('significance', 'meaning', 'image'):
+            for connector in getattr(self, 'out_' + base + 's'):
+                cm = getattr(connector.in_sign, base + 's').get(connector.in_index)
+                if cm is None:
+                    continue
+                for event in itertools.chain(cm.cause, cm.effect):
+                    if connector in event.coincidences:
+                        event._signature = None
+                cm._fingerprint = None
+                changed(connector.in_sign)
+        self.name = sys.intern(name) if type(name) is str else name
+        changed(self)
+
 
     def rename(self, new_name):
         new_sign = Sign(new_name)
@@ -653,13 +883,16 @@ class Sign:
         @param depth: recursive depth of spreading
         @return: active PredictionMatrices
         """
+        return set(cached_activity(self, Sign._spread_up_activity_act, base, depth))
+
+    def _spread_up_activity_act(self, base, depth):
         active_pms = set()
         if depth > 0:
             for connector in getattr(self, 'out_' + base + 's'):
                 if connector.get_in_cm(base).is_causal():
                     active_pms.add(connector.get_in_cm(base))
                 else:
-                    pms = connector.in_sign.spread_up_activity_act(base, depth - 1)
+                    pms = cached_activity(connector.in_sign, Sign._spread_up_activity_act, base, depth - 1)
                     active_pms |= pms
         return active_pms
 
@@ -670,12 +903,15 @@ class Sign:
         @param depth: recursive depth of spreading
         @return: active PredictionMatrices
         """
+        return set(cached_activity(self, Sign._spread_up_activity_obj, base, depth))
+
+    def _spread_up_activity_obj(self, base, depth):
         active_pms = set()
         if depth > 0:
             for connector in getattr(self, 'out_' + base + 's'):
                 if not connector.get_in_cm(base).is_causal():
                     active_pms.add(connector.get_in_cm(base))
-                    pms = connector.in_sign.spread_up_activity_obj(base, depth - 1)
+                    pms = cached_activity(connector.in_sign, Sign._spread_up_activity_obj, base, depth - 1)
                     active_pms |= pms
         return active_pms
 
@@ -686,6 +922,9 @@ class Sign:
         @param depth: recursive depth of spreading
         @return: active matrices
         """
+        return set(cached_activity(self, Sign._spread_down_activity_obj, base, depth))
+
+    def _spread_down_activity_obj(self, base, depth):
         active_pms = set()
         if depth > 0:
             for _, cm in getattr(self, base + 's').items():
@@ -693,7 +932,7 @@ class Sign:
                     for event in cm.cause:
                         for connector in event.coincidences:
                             active_pms.add(connector.get_out_cm(base))
-                            pms = connector.out_sign.spread_down_activity_obj(base, depth - 1)
+                            pms = cached_activity(connector.out_sign, Sign._spread_down_activity_obj, base, depth - 1)
                             active_pms |= pms
         return active_pms
 
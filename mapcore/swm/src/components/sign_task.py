@@ -3,6 +3,8 @@ import logging
 import os
 import pickle
 
+from mapcore.swm.src.components.world_model import WorldModel
+
 DEFAULT_FILE_PREFIX = 'wmodel_'
 DEFAULT_FILE_SUFFIX = '.swm'
 
@@ -41,7 +43,7 @@ def load_signs(agent, file_name=None, load_type=None):
 class Task:
     def __init__(self, name, signs):
         self.name = name
-        self.signs = signs
+        self.signs = signs if isinstance(signs, WorldModel) else WorldModel(signs)
 
 
     def __str__(self):
@@ -85,10 +87,7 @@ class Task:
                 if name.startswith(SIT_PREFIX):
                     self.signs.pop(name)
                 else:
-                    sign.meanings = {}
-                    sign.out_meanings = []
-                    sign.images = {}
-                    sign.out_images = []
+                    sign.clear('meaning', 'image')
 
         file_name = DEFAULT_FILE_PREFIX + datetime.datetime.now().strftime('%m_%d_%H_%M') + '_classic_'+ DEFAULT_FILE_SUFFIX
         logging.debug('Start saving to {0}'.format(file_name))
@@ -0,0 +1,160 @@
+import itertools
+
+from mapcore.swm.src.components import semnet
+
+SITUATION = 'situation'
+
+
+class WorldModel(dict):
+    """
+    Signs of the world model by name, with indexes the planners query
+    instead of walking every sign:
+    causal meanings - sign -> its meanings with effects (signs with images only)
+    fillers - role -> signs put into the significances of the role
+    situations - name of a sign -> images of the situations that contain it
+
+    Semnet tells the world model the names of the signs it changes, only
+    those signs are indexed again on the next query. Situations are the
+    images put into the images of the 'situation' sign, like exp_sits of the
+    search, their signs do not have to be in the world model.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self._order = {}
+        self._counter = itertools.count()
+        self._dirty = set()
+        self._causal = {}
+        self._fillers = {}
+        # images are kept by id, renaming a sign changes the hash of its images
+        # name -> {id: image} of the situations with it, id of a situation image -> (image, name of its sign,
+        # names it is indexed by), name of a situation sign -> {id: image} of its images
+        self._situations = {}
+        self._situation_names = {}
+        self._situation_signs = {}
+        self.update(*args, **kwargs)
+        semnet.watch(self)
+
+    def __reduce__(self):
+        # indexes are not stored, they are built again on the first query after loading
+        return WorldModel, (dict(self),)
+
+    def __setitem__(self, name, sign):
+        if name not in self:
+            self._order[name] = next(self._counter)
+        super().__setitem__(name, sign)
+        self._dirty.add(name)
+
+    def __delitem__(self, name):
+        super().__delitem__(name)
+        del self._order[name]
+        self._dirty.add(name)
+
+    def pop(self, name, *default):
+        if name in self:
+            sign = self[name]
+            del self[name]
+            return sign
+        return super().pop(name, *default)
+
+    def popitem(self):
+        name, sign = super().popitem()
+        del self._order[name]
+        self._dirty.add(name)
+        return name, sign
+
+    def setdefault(self, name, sign=None):
+        if name not in self:
+            self[name] = sign
+        return self[name]
+
+    def update(self, *args, **kwargs):
+        for name, sign in dict(*args, **kwargs).items():
+            self[name] = sign
+
+    def clear(self):
+        self._dirty.update(self)
+        super().clear()
+        self._order.clear()
+
+    def copy(self):
+        return WorldModel(self)
+
+    def touch(self, sign):
+        """Marks the sign changed, called by semnet"""
+        self._dirty.add(sign.name)
+
+    def causal_meanings(self):
+        """Sign -> {index: meaning} of the meanings with effects of every sign with images, in world model order"""
+        self._refresh()
+        names = sorted(self._causal, key=self._order.__getitem__)
+        return {self[name]: dict(self._causal[name]) for name in names}
+
+    def fillers(self, role):
+        """Signs put into the significances of the role"""
+        self._refresh()
+        return set(self._fillers.get(self._name(role), ()))
+
+    def situations(self, sign):
+        """Images of the situations with an event connected to the sign"""
+        self._refresh()
+        return set(self._situations.get(self._name(sign), {}).values())
+
+    @staticmethod
+    def _name(sign):
+        return sign if isinstance(sign, str) else sign.name
+
+    def _refresh(self):
+        while self._dirty:
+            name = self._dirty.pop()
+            self._causal.pop(name, None)
+            self._fillers.pop(name, None)
+            if name in self:
+                self._index(name, self[name])
+            if name == SITUATION:
+                self._index_situations()
+            elif name in self._situation_signs:
+                for image in list(self._situation_signs[name].values()):
+                    self._unindex_situation(image)
+                    self._index_situation(image)
+
+    def _index(self, name, sign):
+        if sign.images:
+            causal = {index: cm for index, cm in sign.meanings.items() if cm.is_causal()}
+            if causal:
+                self._causal[name] = causal
+        fillers = set()
+        for cm in sign.significances.values():
+            if len(cm.cause) == 1 and not cm.is_causal():
+                fillers.update(con.out_sign for con in cm.cause[0].coincidences if isinstance(con, semnet.Connector))
+        if fillers:
+            self._fillers[name] = fillers
+
+    def _index_situations(self):
+        images = {}
+        if SITUATION in self:
+            images = {id(image): image for image in self[SITUATION].spread_down_activity_obj('image', 1)}
+        for key, (image, _, _) in list(self._situation_names.items()):
+            if key not in images:
+                self._unindex_situation(image)
+        for key, image in images.items():
+            if key not in self._situation_names:
+                self._index_situation(image)
+
+    def _index_situation(self, image):
+        names = image.fingerprint().names
+        # unindexed by the names it had, its sign or the signs in it can be renamed in between
+        self._situation_names[id(image)] = image, image.sign.name, names
+        self._situation_signs.setdefault(image.sign.name, {})[id(image)] = image
+        for name in names:
+            self._situations.setdefault(name, {})[id(image)] = image
+
+    def _unindex_situation(self, image):
+        _, sign_name, names = self._situation_names.pop(id(image))
+        for name in names:
+            del self._situations[name][id(image)]
+            if not self._situations[name]:
+                del self._situations[name]
+        del self._situation_signs[sign_name][id(image)]
+        if not self._situation_signs[sign_name]:
+            del self._situation_signs[sign_name]
@@ -2,7 +2,7 @@ import logging
 
 import mapcore.swm.src.components.sign_task as st
 import random
-from mapcore.swm.src.components.semnet import Sign
+from mapcore.swm.src.components.semnet import Sign, forget_activity
 from mapcore.planning.search.mapsearch import mix_pairs
 from mapcore.planning.search.mapsearch import MapSearch as MScore
 from copy import copy
@@ -47,7 +47,10 @@ class MapSearch(MScore):
     def search_plan(self):
         self.I_sign, self.I_obj, self.agents = self.__get_agents()
         self.precedent_activation()
-        plans = self._map_iteration(self.active_pm, iteration=0, current_plan=[])
+        try:
+            plans = self._map_iteration(self.active_pm, iteration=0, current_plan=[])
+        finally:
+            forget_activity()
         return plans
 
     def applicable_search(self, meanings, active_pm):
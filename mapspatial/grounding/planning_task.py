@@ -2,6 +2,7 @@ import sys
 
 from mapcore.swm.src.components.semnet import Sign
 from mapcore.swm.src.components.sign_task import *
+from mapcore.swm.src.components.world_model import WorldModel
 import mapspatial.grounding.utils as ut
 
 DEFAULT_FILE_PREFIX = 'wmodel_'
@@ -49,7 +50,7 @@ class SpTask:
     def __init__(self, name, signs, agent_state,
                 additions, initial_state, goal_state, static_map, plagent):
         self.name = name
-        self.signs = signs
+        self.signs = signs if isinstance(signs, WorldModel) else WorldModel(signs)
         self.start_situation = agent_state['I']['start-sit']
         self.goal_situation = agent_state['I']['goal-sit']
         self.goal_map = agent_state['I']['goal-map']
@@ -342,7 +343,7 @@ class SpTask:
                 pm_signs = im.get_signs()
                 for sign in pm_signs:
                     if sign not in plan_sit:
-                        global_sit.images.pop(index)
+                        global_sit.drop('image', index)
 
             logging.info('\tСохраняю пространственный прецедент...')
 
@@ -355,10 +356,7 @@ class SpTask:
                 if name.startswith(SIT_PREFIX) or name.startswith(MAP_PREFIX):
                     self.signs.pop(name)
                 else:
-                    sign.meanings = {}
-                    sign.out_meanings = []
-                    sign.images = {}
-                    sign.out_images = []
+                    sign.clear('meaning', 'image')
         if I_obj:
             I_obj = "_"+I_obj[0].name
         else:
@@ -6,6 +6,9 @@ from copy import deepcopy, copy
 from functools import reduce
 from mapcore.swm.src.components.semnet import Sign
 
+# events with these signs are not compared by sit_simularity
+SIMULARITY_IGNORED = frozenset(('contain', 'orientation'))
+
 
 def draw(state, mapjs, gif = False):
     from PIL import Image, ImageDraw, ImageOps
@@ -55,8 +58,8 @@ def sit_simularity(base, sit1, sit2):
     if diff >= len_x1 or diff >=len_x2:
         return False
 
-    sub1 = [event for event in itertools.chain(sit1.cause, sit1.effect) if "contain" not in event.get_signs_names() and 'orientation' not in event.get_signs_names()]
-    sub2 = [event for event in itertools.chain(sit2.cause, sit2.effect) if "contain" not in event.get_signs_names() and 'orientation' not in event.get_signs_names()]
+    sub1 = [event for event in itertools.chain(sit1.cause, sit1.effect) if not SIMULARITY_IGNORED & event.signature()[1]]
+    sub2 = [event for event in itertools.chain(sit2.cause, sit2.effect) if not SIMULARITY_IGNORED & event.signature()[1]]
     for event2 in sub2:
         for event1 in sub1:
             if event2.resonate(base, event1):
@@ -760,7 +763,7 @@ def update_situation(sit_image, cell_map, signs, fast_est=None):
                         break
                 else:
                     if [con.get_out_cm('image').sign.name for con in event.coincidences][0] in target_signs:
-                        sit_image.cause.append(event.copy(sit_image, 'image', 'image', copied))
+                        sit_image.add_event(event.copy(sit_image, 'image', 'image', copied))
                         # sit_meaning.add_event(event, False)
     return sit_image
 
@@ -63,7 +63,10 @@ class SpSearch(MapSearch):
 
     def search_plan(self):
         self._precedent_activation()
-        plans = self._map_sp_iteration(self.active_pm, self.active_map, iteration=self.iteration, current_plan=[])
+        try:
+            plans = self._map_sp_iteration(self.active_pm, self.active_map, iteration=self.iteration, current_plan=[])
+        finally:
+            forget_activity()
         if self.backward:
             plans = [list(reversed(plan[0])) for plan in plans]
         return plans
@@ -459,7 +462,7 @@ class SpSearch(MapSearch):
                     next_pm = self._time_shift_spat(active_pm, action[1])
                     included_map = True
                     next_map = None
-                    included_sit = [sit for sit in self.exp_sits if sit.includes('image', next_pm)]
+                    included_sit = self.including_situations(next_pm)
                     if included_sit and included_map:
                         plan.append(
                             (active_pm, action[1].sign.name, action[1], action[0], None, (None, self.clarification_lv), (self.additions[0][max(self.additions[0])-1], self.additions[0][max(self.additions[0])])))
@@ -1,5 +0,0 @@
-import pstats
-
-p = pstats.Stats('main.prof')
-
-p.sort_stats('time').print_stats()
\ No newline at end of file
@@ -4,6 +4,7 @@ import json
 
 from agents.dqn.dqn_agent import Agent as DQNAgent
 import envs.manipulator
+from envs.manipulator.envs.ManipulatorVec import ManipulatorVec
 from collections import deque
 import torch
 
@@ -60,6 +61,43 @@ def dqn_train(agent, env, n_episodes=500, max_t=1000, eps_start=0.3, eps_end=0.0
     return scores_mean
 
 
+def dqn_train_vec(agent, env, n_episodes=500, eps_start=0.3, eps_end=0.01, eps_decay=0.995):
+    """Deep Q-Learning on a ManipulatorVec, one batched act per tick for all copies.
+
+    Params
+    ======
+        n_episodes (int): number of finished episodes (over all copies) to train for
+        eps_start (float): starting value of epsilon, for epsilon-greedy action selection
+        eps_end (float): minimum value of epsilon
+        eps_decay (float): multiplicative factor (per finished episode) for decreasing epsilon
+    """
+    scores = []  # list containing scores from each episode
+    scores_mean = []
+    scores_window = deque(maxlen=100)  # last 100 scores
+    eps = eps_start  # initialize epsilon
+    states = env.reset()
+    while len(scores) < n_episodes:
+        actions = agent.act_batch(states, eps)
+        next_states, rewards, dones, info = env.step(actions)
+        agent.step_batch(states, actions, rewards, info['final_observations'], dones)
+        states = next_states
+        for score in info['episode_returns'][dones | info['truncated']]:
+            scores_window.append(score)
+            scores.append(score)
+            scores_mean.append(np.mean(scores))
+            eps = max(eps_end, eps_decay * eps)  # decrease epsilon
+            print('\rEpisode {}\tScore: {:.2f}\tAverage Score: {:.2f}'.format(len(scores), score,
+                                                                         np.mean(scores_window)), end="")
+            if len(scores) % 100 == 0:
+                print('\rEpisode {}\tAverage Score: {:.2f}'.format(len(scores), np.mean(scores_window)))
+        if len(scores_window) and np.mean(scores_window) >= 40:
+            print('\nEnvironment solved in {:d} episodes!\tAverage Score: {:.2f}'.format(len(scores),
+                                                                                         np.mean(scores_window)))
+            torch.save(agent.qnetwork_local.state_dict(), 'agents/dqn/models/model1.pth')
+            break
+    return scores_mean
+
+
 def train(parameters):
     num_episodes = int(parameters['episodes'])
     gamma = parameters['gamma']
@@ -73,8 +111,16 @@ def train(parameters):
         'task': 'release'
     }
     env = gym.make(env_name, situation=situation)
-    agent = DQNAgent(env.num_of_joints+1+1, env.action_space.n, seed=0)
-    average_rewards = dqn_train(agent, env)
+    agent = DQNAgent(env.num_of_joints+1+1, env.action_space.n, seed=0,
+                     prioritized=parameters.get('prioritized', False),
+                     updates_per_step=parameters.get('updates_per_step', 1))
+    # copies stepped together are opt-in, one Manipulator is trained by default
+    num_envs = parameters.get('num_envs', 1)
+    if num_envs > 1:
+        vec_env = ManipulatorVec([situation] * num_envs)
+        average_rewards = dqn_train_vec(agent, vec_env)
+    else:
+        average_rewards = dqn_train(agent, env)
 
 
 def q_to_policy(q, offset=0):
@@ -85,7 +131,8 @@ def q_to_policy(q, offset=0):
 
 
 def main():
-    parameters = {'episodes': 200, 'gamma': 0.99, 'alpha': 0.4, 'epsilon': 0.2}
+    parameters = {'episodes': 200, 'gamma': 0.99, 'alpha': 0.4, 'epsilon': 0.2, 'num_envs': 1,
+                  'prioritized': False, 'updates_per_step': 1}
     train(parameters)
 
 
@@ -0,0 +1,57 @@
+import numpy as np
+
+from envs.blocks.envs import BlocksWorld, BlocksWorldVec
+from envs.blocks.envs.BlocksWorld import UP, RIGHT, DOWN, PICKUP, PUTDOWN, NUM_ACTIONS
+
+# block-a is carried around its own start cell to its goal, block-b stays in place
+MAP = {'map': {'walls': [[5, 0, 5, 2]], 'rows': 6, 'cols': 6, 'start_x': 0, 'start_y': 0},
+       'agent': {'start_x': 0, 'start_y': 0, 'goal_x': 4, 'goal_y': 5,
+                 'holding_start': None, 'holding_goal': None, 'r': 5, 'coord_mode': 'cropped'},
+       'blocks': {'block-a': {'start_x': 2, 'start_y': 2, 'goal_x': 4, 'goal_y': 4, 'r': 1, 'coord_mode': 'cropped'},
+                  'block-b': {'start_x': 0, 'start_y': 5, 'goal_x': 0, 'goal_y': 5, 'r': 1, 'coord_mode': 'cropped'}}}
+# solves MAP, the last step is taken in the goal
+SCRIPT = [DOWN, RIGHT, RIGHT, PICKUP, RIGHT, DOWN, DOWN, PUTDOWN, RIGHT, RIGHT, DOWN, UP]
+
+
+def test_script_reaches_goal():
+    env = BlocksWorld(MAP)
+    rewards = [env.step(action)[1] for action in SCRIPT]
+    assert rewards.count(env.nice_action_reward) == 2
+    assert rewards[-1] == env.goal_reward and env.done
+
+
+def test_vec_matches_scalar_step_for_step():
+    num_envs = 4
+    vec = BlocksWorldVec(MAP, num_envs=num_envs)
+    envs = [BlocksWorld(MAP) for _ in range(num_envs)]
+    rng = np.random.RandomState(0)
+    episodes = 0
+    for step in range(400):
+        actions = rng.randint(NUM_ACTIONS, size=num_envs)
+        actions[0] = SCRIPT[step % len(SCRIPT)]
+        states, rewards, dones, info = vec.step(actions)
+        for i, env in enumerate(envs):
+            state, reward, done, _ = env.step(int(actions[i]))
+            assert info['final_states'][i] == state
+            assert rewards[i] == reward
+            assert dones[i] == done
+            if done:
+                env.reset()
+                episodes += 1
+            assert states[i] == env.state
+    assert episodes >= 400 // len(SCRIPT)
+
+
+def test_vec_decodes_scalar_states():
+    env = BlocksWorld(MAP)
+    vec = BlocksWorldVec(MAP, num_envs=1)
+    states = []
+    for action in SCRIPT:
+        states.append(env.step(action)[0])
+    agent, blocks, b_in_h, _ = vec._decode_batch(states)
+    assert (vec._encode_batch(agent, blocks, b_in_h) == states).all()
+    for i, state in enumerate(states):
+        (a_x, a_y), block_dict, hand = env._decode(state)
+        assert agent[i].tolist() == [a_x, a_y]
+        assert blocks[i].tolist() == env._blocks_dict_to_arr(block_dict)
+        assert b_in_h[i] == hand
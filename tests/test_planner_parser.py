@@ -0,0 +1,87 @@
+import json
+import os
+
+import pytest
+
+from utils.planner_parser import choose_window_size, estimate_states, parse, read_steps, task_states
+
+STEPS_PATH = os.path.join(os.path.dirname(__file__), '..', 'tasks_jsons/spatial/task0/planner_steps/')
+
+
+def move_task(start, goal, holding=None, rows=250, cols=250):
+    coords = {'start_x': start[0], 'start_y': start[1], 'goal_x': goal[0], 'goal_y': goal[1]}
+    block = coords if holding else {'start_x': 0, 'start_y': 0, 'goal_x': 0, 'goal_y': 0}
+    return {'map': {'walls': None, 'rows': rows, 'cols': cols},
+            'agent': dict(coords, holding_start=holding, holding_goal=holding, r=5),
+            'blocks': {'block-a': dict(block, r=1)}}
+
+
+def saved_tasks(to_path):
+    names = sorted(os.listdir(to_path), key=lambda name: int(name.split('_')[-1].split('.')[0]))
+    tasks = []
+    for name in names:
+        with open(os.path.join(to_path, name), 'r') as read:
+            tasks.append(json.load(read))
+    return names, tasks
+
+
+def walls():
+    return next(read_steps(STEPS_PATH))['map'].get('wall')
+
+
+def test_estimate_states_widens_short_sides():
+    assert estimate_states(1, 64, 0) == 640
+    assert estimate_states(6, 6, 0) == 36
+    assert estimate_states(10, 10, 1) == 100 ** 2 * 2
+    assert estimate_states(10, 10, 0, wall_share=0.5) == 50
+
+
+def test_choose_window_size_shrinks_with_the_budget():
+    task = move_task((0, 0), (40, 40), holding='block-a')
+    assert choose_window_size(task, None, 1e12, 30) == 30
+    window = choose_window_size(task, None, 1e5, 30)
+    assert window < 30
+    assert estimate_states(window + 1, window + 1, 1) <= 1e5 < estimate_states(window + 2, window + 2, 1)
+    assert choose_window_size(task, None, 1, 30) == 1
+
+
+def test_parse_without_budget_reports_every_file(tmp_path):
+    to_path = str(tmp_path) + '/'
+    saved = parse(STEPS_PATH, to_path, window_size=30)
+    names, tasks = saved_tasks(to_path)
+    assert [os.path.basename(path) for path, _, _ in saved] == names
+    assert all(window == 30 for _, window, _ in saved)
+    assert [states for _, _, states in saved] == [task_states(task, walls()) for task in tasks]
+
+
+@pytest.mark.parametrize('state_budget', [1e5, 3e4])
+def test_parse_splits_every_file_to_the_budget(tmp_path, state_budget):
+    unbounded = str(tmp_path / 'unbounded') + '/'
+    bounded = str(tmp_path / 'bounded') + '/'
+    assert max(states for _, _, states in parse(STEPS_PATH, unbounded, window_size=30)) > state_budget
+    saved = parse(STEPS_PATH, bounded, window_size=30, state_budget=state_budget)
+    names, tasks = saved_tasks(bounded)
+    assert [os.path.basename(path) for path, _, _ in saved] == names
+    assert len(names) > len(os.listdir(unbounded))
+    for task, (_, _, states) in zip(tasks, saved):
+        assert task_states(task, walls()) == states <= state_budget
+
+
+def test_parse_keeps_the_moves_chained(tmp_path):
+    def full(task, point):
+        if point['coord_mode'] == 'full':
+            return point['start_x'], point['start_y'], point['goal_x'], point['goal_y']
+        x, y = task['map']['start_x'], task['map']['start_y']
+        return point['start_x'] + x, point['start_y'] + y, point['goal_x'] + x, point['goal_y'] + y
+
+    to_path = str(tmp_path) + '/'
+    parse(STEPS_PATH, to_path, window_size=30, state_budget=3e4)
+    _, tasks = saved_tasks(to_path)
+    for task, next_task in zip(tasks, tasks[1:]):
+        assert full(task, task['agent'])[2:] == full(next_task, next_task['agent'])[:2]
+        assert task['agent']['holding_goal'] == next_task['agent']['holding_start']
+
+
+def test_parse_fails_below_the_smallest_sub_task(tmp_path):
+    with pytest.raises(ValueError):
+        parse(STEPS_PATH, str(tmp_path) + '/', window_size=30, state_budget=1e3)
@@ -0,0 +1,44 @@
+import json
+import os
+
+from map_spatial_wrapper.test2 import pack_steps, unpack_steps, write_steps
+
+TASKS_PATH = os.path.join(os.path.dirname(__file__), '..', 'tasks_jsons')
+
+
+def load_steps(task):
+    path = os.path.join(TASKS_PATH, task, 'planner_steps')
+    steps = []
+    for i in range(len(os.listdir(path))):
+        with open(os.path.join(path, f'{i}.json')) as read:
+            steps.append(json.load(read))
+    return steps
+
+
+def test_pack_unpack_round_trip():
+    for task in ('spatial/task0', 'maspatial/task0'):
+        steps = load_steps(task)
+        document = json.loads(json.dumps(pack_steps(steps)))
+        assert unpack_steps(document) == steps
+        assert len(document['maps']) <= len(steps)
+
+
+def test_pack_stores_repeated_maps_once():
+    first, second = {'cells': [1, 2]}, {'cells': [3]}
+    steps = [{'map': m, 'global-start': i, 'global-finish': i + 1}
+             for i, m in enumerate((first, dict(first), second, first))]
+    document = pack_steps(steps)
+    assert document['maps'] == [first, second, first]
+    assert [sit['map'] for sit in document['situations']] == [0, 0, 1, 2]
+    unpacked = unpack_steps(document)
+    assert unpacked == steps
+    assert unpacked[0]['map'] is unpacked[1]['map']
+
+
+def test_write_steps_matches_planner_files(tmp_path):
+    steps = load_steps('spatial/task0')
+    write_steps(unpack_steps(pack_steps(steps)), str(tmp_path))
+    assert sorted(os.listdir(str(tmp_path))) == sorted(f'{i}.json' for i in range(len(steps)))
+    for i, sit in enumerate(steps):
+        with open(os.path.join(str(tmp_path), f'{i}.json')) as read:
+            assert json.load(read) == sit
@@ -0,0 +1,52 @@
+import numpy as np
+
+from agents.qlearning.q_table import DenseQTable, HashQTable, make_q_table
+
+NUM_STATES = 5000
+NUM_ACTIONS = 6
+
+
+def test_hash_table_agrees_with_dense():
+    rng = np.random.RandomState(0)
+    dense = DenseQTable(NUM_STATES, NUM_ACTIONS)
+    hashed = HashQTable(NUM_ACTIONS, capacity=16)
+    for _ in range(200):
+        # batches repeat states, and the hash table grows many times
+        states = rng.randint(NUM_STATES, size=rng.randint(1, 64))
+        actions = rng.randint(NUM_ACTIONS, size=len(states))
+        deltas = rng.randn(len(states)).astype(np.float32)
+        for table in (dense, hashed):
+            # rows() can grow values, take them first
+            rows = table.rows(states)
+            np.add.at(table.values, (rows, actions), deltas)
+        state = int(rng.randint(NUM_STATES))
+        dense[state][0] += 1
+        hashed[state][0] += 1
+    assert sorted(hashed.visited_states().tolist()) == dense.visited_states().tolist()
+    assert len(hashed) == len(dense)
+    assert set(hashed) == set(dense)
+    for state in dense.visited_states():
+        assert np.allclose(hashed[state], dense[state])
+    assert hashed.greedy_policy(offset=1) == dense.greedy_policy(offset=1)
+
+
+def test_hash_rows_are_stable():
+    hashed = HashQTable(NUM_ACTIONS, capacity=4)
+    states = np.array([7, 2 ** 40, 3, 7, 0, 2 ** 40])
+    rows = hashed.rows(states)
+    assert rows[0] == rows[3] and rows[1] == rows[5]
+    assert len(set(rows.tolist())) == 4
+    hashed.rows(np.arange(100, 1000))
+    assert hashed.rows(states).tolist() == rows.tolist()
+    assert hashed.visited_states()[:4].tolist() == [0, 3, 7, 2 ** 40]
+
+
+def test_unseen_states_get_zero_rows():
+    for table in (DenseQTable(NUM_STATES, NUM_ACTIONS), HashQTable(NUM_ACTIONS)):
+        assert not table[42].any()
+        assert list(table) == ['42']
+
+
+def test_make_q_table_falls_back_to_hash():
+    assert isinstance(make_q_table(NUM_STATES, NUM_ACTIONS), DenseQTable)
+    assert isinstance(make_q_table(NUM_STATES, NUM_ACTIONS, max_dense_bytes=1024), HashQTable)
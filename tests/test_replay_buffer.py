@@ -0,0 +1,76 @@
+import numpy as np
+
+from agents.dqn.dqn_agent import SumTree, ReplayBuffer, PrioritizedReplayBuffer, PER_EPS
+
+
+def check_sums(tree):
+    for node in range(1, tree.capacity):
+        assert np.isclose(tree.nodes[node], tree.nodes[2 * node] + tree.nodes[2 * node + 1])
+
+
+def test_sum_tree_keeps_sums():
+    rng = np.random.RandomState(0)
+    tree = SumTree(10)
+    assert tree.capacity == 16
+    priorities = np.zeros(10)
+    for _ in range(50):
+        leaves = rng.randint(10, size=rng.randint(1, 5))
+        values = rng.uniform(0, 3, size=len(leaves))
+        tree.update(leaves, values)
+        # a leaf given twice in one update keeps its last priority
+        for leaf, value in zip(leaves, values):
+            priorities[leaf] = value
+        assert np.allclose(tree[np.arange(10)], priorities)
+        assert np.isclose(tree.total, priorities.sum())
+        check_sums(tree)
+
+
+def test_sum_tree_finds_prefix_sums():
+    tree = SumTree(8)
+    priorities = np.array([1.0, 0.0, 2.0, 0.5, 0.0, 3.0, 1.5, 0.0])
+    tree.update(np.arange(8), priorities)
+    ends = np.cumsum(priorities)
+    middles = ends - priorities / 2
+    nonzero = np.flatnonzero(priorities)
+    assert tree.find(middles[nonzero]).tolist() == nonzero.tolist()
+    # a prefix sum on a boundary belongs to the leaf it closes
+    assert tree.find(ends[nonzero]).tolist() == nonzero.tolist()
+    assert tree.find([0.0]).tolist() == [0]
+
+
+def test_sum_tree_samples_by_priority():
+    rng = np.random.RandomState(0)
+    tree = SumTree(5)
+    priorities = np.array([1.0, 4.0, 0.0, 2.0, 3.0])
+    tree.update(np.arange(5), priorities)
+    leaves = tree.find(rng.uniform(0, tree.total, size=100000))
+    frequencies = np.bincount(leaves, minlength=5) / len(leaves)
+    assert np.allclose(frequencies, priorities / priorities.sum(), atol=0.01)
+    assert frequencies[2] == 0
+
+
+def test_prioritized_buffer_keeps_replay_buffer_contract():
+    uniform = ReplayBuffer(2, 4, 2, seed=0)
+    prioritized = PrioritizedReplayBuffer(2, 4, 2, seed=0)
+    for step in range(6):
+        state = np.full(3, step)
+        assert prioritized.add(state, 1, 0.5, state, False) == uniform.add(state, 1, 0.5, state, False)
+    assert len(prioritized) == len(uniform) == 4
+    assert np.array_equal(prioritized.states, uniform.states)
+    assert np.allclose(prioritized.tree[np.arange(4)], 1.0)
+
+
+def test_prioritized_buffer_samples_by_td_error():
+    buffer = PrioritizedReplayBuffer(2, 8, 4, seed=0, alpha=1.0)
+    buffer.add_batch(np.arange(8)[:, None], np.zeros(8), np.zeros(8), np.arange(8)[:, None], np.zeros(8))
+    # the last error of an experience sampled twice wins
+    buffer.update_priorities(np.array([3, 5, 3]), np.array([0.0, 0.0, 9.0]))
+    assert np.isclose(buffer.tree[3], 9.0 + PER_EPS)
+    assert buffer.max_priority >= 9.0
+    counts = np.zeros(8)
+    for _ in range(500):
+        *_, weights, idx = buffer.sample()
+        np.add.at(counts, idx, 1)
+        assert np.isclose(weights.max().item(), 1.0)
+    assert counts[3] > counts[np.arange(8) != 3].max()
+    assert counts[5] < counts[np.arange(8) != 5].min()
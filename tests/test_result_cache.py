@@ -0,0 +1,99 @@
+import json
+import os
+import time
+
+from train import RL_OUTPUT, rl_key, rl_parameters
+from utils.result_cache import ResultCache, STALE_TMP_SECONDS, content_key
+
+
+def write_json(path, data):
+    with open(path, 'w+') as write:
+        write.write(json.dumps(data))
+
+
+def read_json(path):
+    with open(path, 'r') as read:
+        return json.load(read)
+
+
+def test_content_key_ignores_dict_order():
+    assert content_key({'a': 1, 'b': 2}, [1]) == content_key({'b': 2, 'a': 1}, [1])
+    assert content_key({'a': 1}) != content_key({'a': 2})
+
+
+def test_restore_copies_files_and_documents(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    source = tmp_path / 'parsed_tasks_0.json'
+    write_json(source, {'map': 1})
+    assert cache.restore('parse', 'key', str(tmp_path)) is None
+    cache.put('parse', 'key', [str(source)], chain={'angles': [1, 2]})
+
+    to_path = tmp_path / 'restored'
+    to_path.mkdir()
+    assert cache.restore('parse', 'key', str(to_path)) == [str(to_path / 'parsed_tasks_0.json')]
+    assert read_json(to_path / 'parsed_tasks_0.json') == {'map': 1}
+    assert cache.document('parse', 'key', 'chain') == {'angles': [1, 2]}
+    assert cache.document('parse', 'other', 'chain') is None
+
+
+def test_restore_named_file(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    source = tmp_path / 'rl_output_3.json'
+    write_json(source, [{'action': 'pick up'}])
+    cache.put('rl', 'key', [str(source)], names=['output.json'])
+
+    to_file = str(tmp_path / 'rl_output_7.json')
+    assert cache.restore('rl', 'key', to_file, name='output.json') == [to_file]
+    assert read_json(to_file) == [{'action': 'pick up'}]
+    assert cache.restore('rl', 'key', to_file, name='missing.json') is None
+
+
+def test_identical_sub_tasks_restore_to_their_own_outputs(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    parameters = {'episodes': 10, 'gamma': 0.99, 'alpha': 0.6, 'epsilon': 0.2, 'verbose': False, 'plot': False,
+                  'movement': False, 'bench': '', 'save_path': str(tmp_path) + '/'}
+    paths = []
+    for index in (0, 1):
+        paths.append(str(tmp_path / f'parsed_tasks_{index}.json'))
+        write_json(paths[-1], {'map': 'same'})
+    first, second = [rl_parameters(parameters, path, index) for index, path in enumerate(paths)]
+    assert rl_key(first) == rl_key(second)
+
+    # the first sub-task is trained and stored, the second one is restored from its entry
+    write_json(first['save_path'], [{'action': 'put down'}])
+    cache.put('rl', rl_key(first), [first['save_path']], names=[RL_OUTPUT])
+    os.remove(first['save_path'])
+    assert cache.restore('rl', rl_key(second), second['save_path'], name=RL_OUTPUT) == [second['save_path']]
+    assert read_json(tmp_path / 'rl_output_1.json') == [{'action': 'put down'}]
+    assert not os.path.exists(first['save_path'])
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    source = tmp_path / 'output.json'
+    write_json(source, 'x' * 1000)
+    cache = ResultCache(str(tmp_path / 'cache'))
+    for age, key in enumerate(('old', 'used', 'new')):
+        cache.put('rl', key, [str(source)])
+        mtime = time.time() - 100 + age
+        os.utime(cache.get('rl', key), (mtime, mtime))
+    # a hit marks the entry as used, two of the three entries fit
+    cache.get('rl', 'old')
+    cache.max_bytes = 2500
+    cache.evict()
+    assert cache.get('rl', 'used') is None
+    assert cache.get('rl', 'old') is not None
+    assert cache.get('rl', 'new') is not None
+
+
+def test_evict_removes_stale_temporary_entries(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    cache.put('rl', 'done', answer=1)
+    stage_dir = tmp_path / 'cache' / 'rl'
+    stale, fresh = stage_dir / 'crashed.123.tmp', stage_dir / 'writing.456.tmp'
+    for tmp in (stale, fresh):
+        tmp.mkdir()
+        write_json(tmp / 'part.json', 'x')
+    mtime = time.time() - STALE_TMP_SECONDS - 1
+    os.utime(str(stale), (mtime, mtime))
+    cache.evict()
+    assert sorted(os.listdir(str(stage_dir))) == ['done', 'writing.456.tmp']
@@ -0,0 +1,138 @@
+import itertools
+import random
+
+from mapcore.swm.src.components.semnet import Sign
+
+NAMES = ('I', 'on', 'clear', 'block-a', 'block-b', 'table')
+
+
+def random_matrices(seed, count=40, repeats=False):
+    rng = random.Random(seed)
+    signs = {name: Sign(name) for name in NAMES}
+    leaves = {name: [sign.add_meaning() for _ in range(2)] for name, sign in signs.items()}
+    # predicates have their blocks in them, so resonance goes one level down
+    for name in ('on', 'clear'):
+        for cm in leaves[name]:
+            cm.add_feature(rng.choice(leaves[rng.choice(('block-a', 'block-b'))]))
+    situation = Sign('situation')
+    matrices = []
+    for _ in range(count):
+        cm = situation.add_meaning()
+        for effect in (False, True):
+            for _ in range(rng.randint(1 - effect, 3)):
+                size = rng.randint(1, 3)
+                # with repeats an event can hold several connectors from one sign
+                names = rng.choices(NAMES, k=size) if repeats else rng.sample(NAMES, size)
+                connector = cm.add_feature(rng.choice(leaves[names[0]]), effect=effect)
+                for name in names[1:]:
+                    cm.add_feature(rng.choice(leaves[name]), order=connector.in_order, effect=effect)
+        matrices.append(cm)
+    return matrices
+
+
+# resonance of the network before fingerprints, every event is scanned against every event
+
+def scan_events(cm):
+    return [event for event in itertools.chain(cm.cause, cm.effect)
+            if 'I' not in {connector.out_sign.name for connector in event.coincidences}]
+
+
+def scan_event_resonate(event, other, check_order=True):
+    if not len(event.coincidences) == len(other.coincidences):
+        if not len(event.coincidences) == 1 and \
+                not [con.out_sign.name for con in event.coincidences][0] in \
+                [con.out_sign.name for con in other.coincidences]:
+            return False
+    for connector in event.coincidences:
+        for conn in other.coincidences:
+            if connector.out_sign == conn.out_sign:
+                if connector.get_out_cm('meaning').get_signs() == conn.get_out_cm('meaning').get_signs():
+                    break
+        else:
+            return False
+        if not scan_resonate(connector.get_out_cm('meaning'), conn.get_out_cm('meaning'), check_order):
+            return False
+    return True
+
+
+def scan_resonate(cm, pm, check_order=True):
+    if not cm.sign == pm.sign:
+        return False
+    sub1, sub2 = scan_events(cm), scan_events(pm)
+    if not len(sub1) == len(sub2):
+        return False
+    if check_order:
+        return all(scan_event_resonate(e1, e2) for e1, e2 in zip(itertools.chain(cm.cause, cm.effect),
+                                                                 itertools.chain(pm.cause, pm.effect)))
+    return all(any(scan_event_resonate(e1, e2, check_order) for e2 in sub2) for e1 in sub1)
+
+
+def scan_exp_resonate(event, other):
+    if not len(event.coincidences) == len(other.coincidences):
+        return False
+    return all(any(connector.out_sign == conn.out_sign for conn in other.coincidences)
+               for connector in event.coincidences)
+
+
+def scan_sub(cm, other):
+    return [e1 for events, part in ((cm.cause, other.cause), (cm.effect, other.effect))
+            for e1 in events if not any(scan_exp_resonate(e1, e2) for e2 in part)]
+
+
+def scan_includes(cm, smaller):
+    return all(any(scan_event_resonate(event2, event1) for event1 in scan_events(cm))
+               for event2 in scan_events(smaller))
+
+
+def test_signature_matches_the_connectors():
+    for cm in random_matrices(0):
+        for event in itertools.chain(cm.cause, cm.effect):
+            names = {connector.out_sign.name for connector in event.coincidences}
+            assert event.signature() == (len(event.coincidences), names)
+
+
+def test_candidates_match_a_scan_of_the_events():
+    matrices = random_matrices(1)
+    for cm, other in itertools.product(matrices, repeat=2):
+        fingerprint = cm.fingerprint()
+        applicable = [event for event in itertools.chain(cm.cause, cm.effect) if 'I' not in event.get_signs_names()]
+        assert fingerprint.applicable == applicable
+        for event in itertools.chain(other.cause, other.effect):
+            names = event.get_signs_names()
+            assert fingerprint.candidates(event) == [candidate for candidate in applicable
+                                                     if names <= candidate.get_signs_names()]
+
+
+def test_includes_and_resonate_match_the_scans():
+    matrices = random_matrices(2)
+    for cm, other in itertools.product(matrices, repeat=2):
+        assert cm.includes('meaning', other) == scan_includes(cm, other)
+        assert cm.resonate('meaning', other) == scan_resonate(cm, other)
+        assert cm.resonate('meaning', other, check_order=False) == scan_resonate(cm, other, check_order=False)
+    assert any(cm.includes('meaning', other) for cm, other in itertools.permutations(matrices, 2))
+    assert any(cm.resonate('meaning', other, check_order=False)
+               for cm, other in itertools.permutations(matrices, 2))
+
+
+def test_fingerprint_follows_new_events():
+    cm = random_matrices(3, count=1)[0]
+    before = cm.fingerprint()
+    connector = cm.add_feature(Sign('floor').add_meaning())
+    assert cm.fingerprint() is not before
+    assert 'floor' in cm.fingerprint().names
+    cm.add_feature(Sign('wall').add_meaning(), order=connector.in_order)
+    assert cm.fingerprint().postings['wall'] == cm.fingerprint().postings['floor']
+
+
+
+def test_subtraction_matches_the_scan():
+    for repeats in (False, True):
+        matrices = random_matrices(4, repeats=repeats)
+        for cm, other in itertools.product(matrices, repeat=2):
+            assert [id(event) for event in cm - other] == [id(event) for event in scan_sub(cm, other)]
+        assert any(not cm - other for cm, other in itertools.permutations(matrices, 2))
+        assert any(len(cm - other) < len(cm.cause) + len(cm.effect)
+                   for cm, other in itertools.permutations(matrices, 2))
+    # the scan path is taken for events with repeated out signs
+    assert any(count > len(names) for cm in matrices
+               for count, names in (event.signature() for event in itertools.chain(cm.cause, cm.effect)))
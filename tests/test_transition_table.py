@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+
+from envs.blocks.envs import BlocksWorld
+from envs.blocks.envs.BlocksWorld import NUM_ACTIONS
+from envs.blocks.envs.TransitionTable import TransitionTable
+from tests.test_blocks_world import MAP, SCRIPT
+
+
+def test_table_steps_match_scalar(tmp_path):
+    env = BlocksWorld(MAP)
+    table_env = BlocksWorld(MAP, use_table=True, table_cache_dir=str(tmp_path))
+    rng = np.random.RandomState(0)
+    actions = SCRIPT + list(rng.randint(NUM_ACTIONS, size=300)) + SCRIPT
+    for action in actions:
+        assert table_env.step(int(action)) == env.step(int(action))
+        if env.done:
+            env.reset()
+            table_env.reset()
+
+
+def test_table_covers_reachable_states():
+    env = BlocksWorld(MAP)
+    table = TransitionTable.build(env)
+    assert (np.diff(table.states) > 0).all()
+    assert table.states[table.start_index] == env.starting_state
+    assert table.states[table.goal_index] == env.goal
+    # every next state is a row of the table
+    assert table.next_index.shape == (len(table), NUM_ACTIONS)
+    assert ((table.next_index >= 0) & (table.next_index < len(table))).all()
+    assert table.dones[table.goal_index].all()
+    assert not table.dones[np.arange(len(table)) != table.goal_index].any()
+
+
+def test_save_load_round_trip(tmp_path):
+    table = TransitionTable.build(BlocksWorld(MAP))
+    path = str(tmp_path / 'table.npz')
+    table.save(path)
+    loaded = TransitionTable.load(path)
+    for name in ('states', 'next_index', 'rewards', 'dones'):
+        assert np.array_equal(getattr(loaded, name), getattr(table, name))
+        assert getattr(loaded, name).dtype == getattr(table, name).dtype
+    assert (loaded.start, loaded.goal) == (table.start, table.goal)
+    assert (loaded.start_index, loaded.goal_index) == (table.start_index, table.goal_index)
+
+
+def test_load_or_build_caches_by_map_and_rewards(tmp_path):
+    env = BlocksWorld(MAP)
+    built = TransitionTable.load_or_build(env, str(tmp_path))
+    assert os.listdir(str(tmp_path)) == [TransitionTable.key(env) + '.npz']
+    loaded = TransitionTable.load_or_build(env, str(tmp_path))
+    assert np.array_equal(loaded.next_index, built.next_index)
+    other = BlocksWorld(MAP, goal_reward=20.0)
+    assert not TransitionTable.key(other) == TransitionTable.key(env)
+    rebuilt = TransitionTable.load_or_build(other, str(tmp_path))
+    assert len(os.listdir(str(tmp_path))) == 2
+    assert rebuilt.rewards[rebuilt.goal_index].max() == 20.0
+
+
+def test_key_changes_with_table_version(monkeypatch):
+    env = BlocksWorld(MAP)
+    key = TransitionTable.key(env)
+    monkeypatch.setattr('envs.blocks.envs.TransitionTable.TABLE_VERSION', -1)
+    assert not TransitionTable.key(env) == key
+
+
+def test_save_moves_finished_file_into_place(tmp_path):
+    table = TransitionTable.build(BlocksWorld(MAP))
+    path = str(tmp_path / 'table.npz')
+    table.save(path)
+    table.save(path)
+    assert os.listdir(str(tmp_path)) == ['table.npz']
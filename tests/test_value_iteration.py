@@ -0,0 +1,20 @@
+from agents.value_iteration.value_iteration_agent import ValueIterationAgent
+from envs.blocks.envs import BlocksWorld
+from train import q_to_policy
+from tests.test_blocks_world import MAP, SCRIPT
+
+
+def test_greedy_policy_solves_map():
+    env = BlocksWorld(MAP)
+    agent = ValueIterationAgent(env, gamma=0.95)
+    rewards, average = agent.train()
+    assert rewards == [average]
+    policy = q_to_policy(agent.q)
+    assert len(policy) == len(agent.table)
+    assert agent.act(env.starting_state) == policy[str(env.starting_state)]
+    steps = 0
+    while not env.done and steps < 100:
+        env.step(policy[str(env.state)])
+        steps += 1
+    # no longer than the hand written solution
+    assert env.done and steps <= len(SCRIPT)
@@ -0,0 +1,161 @@
+import pickle
+
+from mapcore.swm.src.components import semnet
+from mapcore.swm.src.components.semnet import Sign
+from mapcore.swm.src.components.world_model import WorldModel
+
+
+def connect(cm, feature, effect=False, base='image'):
+    connector = cm.add_feature(feature, effect=effect)
+    getattr(feature.sign, 'add_out_' + base)(connector)
+    return connector
+
+
+def build():
+    wm = WorldModel()
+    for name in ('I', 'on', 'clear', 'block-a', 'block-b', 'table', 'situation'):
+        wm[name] = Sign(name)
+    for name in ('I', 'on', 'clear', 'block-a', 'block-b', 'table'):
+        wm[name].add_image()
+        wm[name].add_meaning()
+    move = wm['move'] = Sign('move')
+    move.add_image()
+    action = move.add_meaning()
+    connect(action, wm['clear'].meanings[1], base='meaning')
+    connect(action, wm['on'].meanings[1], effect=True, base='meaning')
+    for name, predicates in (('sit-1', ('on', 'clear')), ('sit-2', ('clear',)), ('sit-3', ('on', 'I'))):
+        sit = wm[name] = Sign(name)
+        image = sit.add_image()
+        for predicate in predicates:
+            connect(image, wm[predicate].images[1])
+        connect(wm['situation'].add_image(), image)
+    return wm
+
+
+# the world model before the indexes, every sign is scanned on every query
+
+def scan_causal_meanings(wm):
+    acts = {}
+    for name, sign in wm.items():
+        if sign.meanings and sign.images:
+            for index, cm in sign.meanings.items():
+                if cm.is_causal():
+                    acts.setdefault(sign, {})[index] = cm
+    return acts
+
+
+def scan_situations(wm, name):
+    return {image for image in wm['situation']._spread_down_activity_obj('image', 1)
+            if name in {connector.out_sign.name for event in image.cause for connector in event.coincidences}}
+
+
+def check(wm, names=('on', 'clear', 'I', 'block-a')):
+    assert wm.causal_meanings() == scan_causal_meanings(wm)
+    for name in names:
+        assert wm.situations(name) == scan_situations(wm, name)
+
+
+def test_causal_meanings_follow_changes():
+    wm = build()
+    check(wm)
+    assert list(wm.causal_meanings()) == [wm['move']]
+    stack = wm['stack'] = Sign('stack')
+    stack.add_image()
+    cm = stack.add_meaning()
+    connect(cm, wm['on'].meanings[1], base='meaning')
+    check(wm)
+    assert stack not in wm.causal_meanings()
+    connect(cm, wm['clear'].meanings[1], effect=True, base='meaning')
+    check(wm)
+    assert list(wm.causal_meanings()) == [wm['move'], stack]
+    wm['move'].clear('meaning', 'image')
+    check(wm)
+    assert list(wm.causal_meanings()) == [stack]
+    wm.pop('stack')
+    check(wm)
+    assert wm.causal_meanings() == {}
+
+
+def test_situations_follow_changes():
+    wm = build()
+    assert wm.situations('on') == {wm['sit-1'].images[1], wm['sit-3'].images[1]}
+    assert wm.situations(wm['clear']) == {wm['sit-1'].images[1], wm['sit-2'].images[1]}
+    wm['situation'].drop('image', 1)
+    check(wm)
+    assert wm.situations('on') == {wm['sit-3'].images[1]}
+    wm['situation'].drop('image', 2)
+    wm['sit-2'].clear('image')
+    check(wm)
+    assert wm.situations('clear') == set()
+    sit = wm['sit-4'] = Sign('sit-4')
+    connect(sit.add_image(), wm['clear'].images[1])
+    connect(wm['situation'].add_image(), sit.images[1])
+    check(wm)
+    assert wm.situations('clear') == {sit.images[1]}
+
+
+def test_set_name_indexes_the_new_name():
+    wm = build()
+    check(wm)
+    wm['sit-3'].set_name('sit-3-task')
+    wm['on'].set_name('on-table')
+    check(wm, names=('on', 'on-table', 'clear', 'I'))
+    assert wm.situations('on') == set()
+    assert wm.situations('on-table') == {wm['sit-1'].images[1], wm['sit-3'].images[1]}
+    wm['situation'].clear('image')
+    check(wm, names=('on-table', 'clear'))
+    assert wm.situations('on-table') == set()
+
+
+def test_cached_activity_follows_tracked_changes():
+    wm = build()
+    situation, on = wm['situation'], wm['on']
+    assert situation.spread_down_activity_obj('image', 1) == situation._spread_down_activity_obj('image', 1)
+    assert len(on.spread_up_activity_obj('image', 1)) == 2
+    situation.drop('image', 2)
+    assert situation.spread_down_activity_obj('image', 1) == {wm['sit-1'].images[1], wm['sit-3'].images[1]}
+    on.clear_out('image')
+    assert on.spread_up_activity_obj('image', 1) == set()
+    clear = wm['clear']
+    assert clear.spread_up_activity_act('meaning', 1) == {wm['move'].meanings[1]}
+    clear.remove_out_meaning(clear.out_meanings[0])
+    assert clear.spread_up_activity_act('meaning', 1) == set()
+
+
+def test_pickle_builds_indexes_again():
+    wm = pickle.loads(pickle.dumps(build()))
+    check(wm)
+    assert len(wm.situations('on')) == 2
+
+
+class Dropping(WorldModel):
+    """Lets go of another world model while it is told about a change"""
+
+    def __init__(self, others):
+        super().__init__()
+        self.others = others
+
+    def touch(self, sign):
+        super().touch(sign)
+        self.others.clear()
+
+
+def test_collected_world_model_does_not_hide_the_next_one():
+    others = [WorldModel()]
+    dropping = Dropping(others)
+    last = WorldModel()
+    # the first world model is collected in the middle of the notifications
+    Sign('block-a').add_image()
+    assert not others
+    assert 'block-a' in dropping._dirty
+    assert 'block-a' in last._dirty
+
+
+def test_activity_is_forgotten():
+    wm = build()
+    wm['situation'].spread_down_activity_obj('image', 1)
+    assert semnet._activity
+    semnet.forget_activity()
+    assert not semnet._activity
+    assert wm['situation'].spread_down_activity_obj('image', 1) == \
+        wm['situation']._spread_down_activity_obj('image', 1)
@@ -7,15 +7,26 @@ from multiprocessing import Pool
 
 import gym
 import numpy as np
-import torch
 
 from agents.qlearning.qlearning_agent import QLearningAgent
-from agents.dqn.dqn_agent import Agent as DQNAgent
-from map_spatial_wrapper.test2 import main as planner_main
-from utils.planner_parser import parse
+from agents.qlearning.q_table import QTable
+from agents.dqn.model_service import ManipulatorModelService, MODEL_PATH
+from agents.value_iteration.value_iteration_agent import ValueIterationAgent
+from envs.blocks.envs.BlocksWorldVec import BlocksWorldVec
+from map_spatial_wrapper.test2 import search as planner_search, planner_steps, write_steps, pack_steps, \
+    unpack_steps
+from utils.planner_parser import parse, read_steps
+from utils.instrumentation import Instrumentation
+from utils.result_cache import ResultCache, content_key, file_hash
 
+# parameters that do not change the trained policy, left out of the RL cache key
+RL_KEY_IGNORED = ('bench', 'save_path', 'verbose', 'plot', 'movement')
+# name of the RL output in its cache entry, the entry is shared by identical sub-tasks at any index
+RL_OUTPUT = 'rl_output.json'
+BENCHMARKS_PATH = 'mapspatial/benchmarks/'
 
-def train_rl(parameters):
+
+def train_rl(parameters, record=None):
     print(parameters['bench'], ' starting...')
     num_episodes = int(parameters['episodes'])
     gamma = parameters['gamma']
@@ -27,13 +38,27 @@ def train_rl(parameters):
             map_dict = json.load(read)
     else:
         raise FileNotFoundError
-    env = gym.make(env_name, map_dict=map_dict)
-    agent = QLearningAgent(env, gamma=gamma, alpha=alpha, epsilon=epsilon)
-    all_rewards, average_rewards = agent.train(num_episodes, True)
+    # transition tables are opt-in, a plain BlocksWorld steps the map itself
+    use_table = parameters.get('use_table', False)
+    env = gym.make(env_name, map_dict=map_dict, use_table=use_table)
+    if parameters.get('solver', 'qlearning') == 'value_iteration':
+        agent = ValueIterationAgent(env, gamma=gamma)
+        all_rewards, average_rewards = agent.train(verbose=True)
+    elif parameters.get('num_envs', 1) > 1:
+        agent = QLearningAgent(env, gamma=gamma, alpha=alpha, epsilon=epsilon)
+        vec_env = BlocksWorldVec(map_dict, num_envs=parameters['num_envs'], use_table=use_table)
+        all_rewards, average_rewards = agent.train_batch(vec_env, num_episodes, True)
+    else:
+        agent = QLearningAgent(env, gamma=gamma, alpha=alpha, epsilon=epsilon)
+        all_rewards, average_rewards = agent.train(num_episodes, True)
     # import pickle
     # with open('interval_50x50', 'wb') as fp:
     #     pickle.dump(all_rewards, fp)
 
+    if record is not None:
+        record['env_steps'] = agent.env_steps
+        record['q_states'] = len(agent.q)
+
     policy = q_to_policy(agent.q)
     if parameters['plot']:
         env.render(policy=policy)
@@ -49,6 +74,8 @@ def train_rl(parameters):
 
 
 def q_to_policy(q, offset=0):
+    if isinstance(q, QTable):
+        return q.greedy_policy(offset)
     optimal_policy = {}
     for state in q:
         optimal_policy[state] = np.argmax(q[state]) + offset
@@ -65,52 +92,171 @@ def train_one_file(parameters):
     print('---End---')
 
 
-def train_rl_multiple_files(paths, parameters):
-    params_arr = []
-    for i, path in enumerate(paths):
-        curr_params = deepcopy(parameters)
-        curr_params['bench'] = path
-        curr_params['save_path'] += f'rl_output_{i}.json'
-        params_arr.append(curr_params)
-    pool = Pool(processes=len(paths))
+def timed_train_rl(parameters, profile_dir=None):
+    """train_rl in a worker process, returns its instrumentation record."""
+    instrumentation = Instrumentation(profile_dir)
+    index = int(parameters['bench'].split('_')[-1].split('.')[0])
+    with instrumentation.stage('train_rl', index=index) as record:
+        train_rl(parameters, record)
+    return record
+
+
+def rl_parameters(parameters, path, index):
+    curr_params = deepcopy(parameters)
+    curr_params['bench'] = path
+    curr_params['save_path'] += f'rl_output_{index}.json'
+    return curr_params
+
+
+def train_rl_multiple_files(paths, parameters, processes=None):
+    params_arr = [rl_parameters(parameters, path, i) for i, path in enumerate(paths)]
+    pool = Pool(processes=min(len(paths), processes or os.cpu_count()))
     pool.map(train_rl, params_arr)
     pool.close()
     pool.join()
 
 
-def apply_manipulator_model(situations_path, to_path):
+def rl_key(parameters):
+    """Cache key of one RL sub-task: the parsed task and the hyperparameters that shape the policy."""
+    hyperparameters = {name: value for name, value in parameters.items() if name not in RL_KEY_IGNORED}
+    return content_key(file_hash(parameters['bench']), hyperparameters)
+
+
+def run_pipeline(steps, planner_steps_parsed_path, rl_agent_steps_path, manipulator_situations_path,
+                 manipulator_situations_solved_path, parameters, window_size=30, processes=None, cache=None,
+                 instrumentation=None, state_budget=None):
+    """
+    Parsing, RL training and manipulator solving with overlapping stages.
+
+    steps are the planner steps, a directory written by save_steps or the
+    steps themselves, which are parsed without going through files.
+
+    Every sub-task is queued to a pool of processes (os.cpu_count() by
+    default) as soon as parse() writes it. RL outputs are consumed in
+    sub-task order as they land: their situations are extracted and solved
+    by the manipulator model right away, continuing from the joint angles the
+    previous output ended with, while later sub-tasks are still training.
+
+    With a ResultCache the parsed sub-tasks, every RL output and every
+    solved chain are stored by the hash of their inputs (planner steps and
+    window_size, parsed task and RL hyperparameters, situations and model
+    file), so a re-run only recomputes what changed.
+
+    Timings of parsing and of every train_rl, extraction and rollout go to
+    instrumentation, a new Instrumentation if it is not given. With
+    state_budget windows are sized adaptively up to window_size and
+    sub-tasks are split until they fit the budget, see
+    utils.planner_parser.parse.
+    """
+    instrumentation = instrumentation or Instrumentation()
+    pool = Pool(processes=processes or os.cpu_count())
+    results = {}
+    keys = {}
+
+    def submit(path):
+        index = int(path.split('_')[-1].split('.')[0])
+        curr_params = rl_parameters(parameters, path, index)
+        # an output left from an earlier run must not stand in for a failed one
+        if os.path.exists(curr_params['save_path']):
+            os.remove(curr_params['save_path'])
+        if cache is not None:
+            keys[index] = rl_key(curr_params)
+            if cache.restore('rl', keys[index], curr_params['save_path'], name=RL_OUTPUT) is not None:
+                instrumentation.count('rl_cache_hits')
+                results[index] = None
+                return
+        results[index] = pool.apply_async(timed_train_rl, (curr_params, instrumentation.profile_dir))
+
+    parse_key = None
+    parsed = None
+    if cache is not None:
+        steps = list(read_steps(steps) if isinstance(steps, str) else steps)
+        parse_key = content_key(pack_steps(steps), window_size, state_budget)
+        parsed = cache.restore('parse', parse_key, planner_steps_parsed_path)
+    if parsed is None:
+        parsed = []
+
+        def on_task(path):
+            parsed.append(path)
+            submit(path)
+
+        # sub-tasks are only queued while parsing, training runs outside of the parse timing
+        with instrumentation.stage('parse') as record:
+            saved = parse(steps, planner_steps_parsed_path, multiple=True, window_size=window_size,
+                          on_task=on_task, state_budget=state_budget)
+            record['num_tasks'] = len(parsed)
+            record['min_window'] = min(window for _, window, _ in saved)
+            record['max_window'] = max(window for _, window, _ in saved)
+            record['max_states'] = max(states for _, _, states in saved)
+        for path, window, states in saved:
+            print('{} window {} estimated states {:.3g}'.format(os.path.basename(path), window, states))
+        if cache is not None:
+            cache.put('parse', parse_key, parsed)
+    else:
+        instrumentation.count('parse_cache_hits')
+        for path in parsed:
+            submit(path)
+    pool.close()
+    print('PARSING TO RL FINISHED')
+
+    service = ManipulatorModelService.get()
+    model_hash = file_hash(MODEL_PATH) if cache is not None else None
+    situations = []
+    angles = None
+    for index in sorted(results):
+        rl_output = rl_agent_steps_path + f'rl_output_{index}.json'
+        if results[index] is not None:
+            instrumentation.add(results[index].get())
+            if cache is not None and os.path.exists(rl_output):
+                cache.put('rl', keys[index], [rl_output], names=[RL_OUTPUT])
+        if not os.path.exists(rl_output):
+            continue
+        with instrumentation.stage('extract_situations', index=index) as record:
+            with open(rl_output, 'r') as read:
+                new_situations = situations_from_steps(json.load(read), len(situations))
+            record['num_situations'] = len(new_situations)
+        if not new_situations:
+            continue
+        situations.extend(deepcopy(new_situations))
+        if angles is not None:
+            new_situations[0]['manipulator_angles'] = angles
+        chain_key = None
+        solved = None
+        if cache is not None:
+            # ids only name the output files, the rollouts do not depend on them
+            chain_key = content_key([{name: value for name, value in situation.items() if name != 'id'}
+                                     for situation in new_situations], model_hash)
+            solved = cache.document('manipulator', chain_key, 'chain')
+        if solved is None:
+            with instrumentation.stage('manipulator', index=index) as record:
+                # one chain: the angles of this sub-task are the start of the next one
+                (solutions,), (angles,) = service.solve([new_situations])
+                record['env_steps'] = sum(len(solution) for solution in solutions)
+            if cache is not None:
+                cache.put('manipulator', chain_key, chain={'solutions': solutions, 'angles': angles})
+        else:
+            instrumentation.count('manipulator_cache_hits')
+            solutions, angles = solved['solutions'], solved['angles']
+        for situation, solution in zip(new_situations, solutions):
+            with open(manipulator_situations_solved_path + f'{situation["id"]}.json', 'w+') as write:
+                write.write(json.dumps(solution, indent=4))
+    pool.join()
+    with open(manipulator_situations_path + 'situations.json', 'w+') as write:
+        write.write(json.dumps(situations, indent=4))
+
+
+def apply_manipulator_model(situations_path, to_path, model_path=MODEL_PATH):
     with open(situations_path + 'situations.json', 'r') as read:
         situations = json.load(read)
-    env_name = "envs.manipulator:Manipulator-v1"
-    current_situation = situations[0]
-    for i in range(len(situations)):
-        env = gym.make(env_name, situation=current_situation)
-        agent = DQNAgent(env.num_of_joints + 1 + 1, env.action_space.n, seed=0)
-        agent.qnetwork_local.load_state_dict(torch.load('agents/dqn/models/model1.pth'))
-        state = env.reset(return_all=True)
-        solution = []
-        for t in range(100):
-            action = agent.act(np.array(state), 0)
-            next_state, reward, done, _ = env.step(action, return_all=True)
-            # agent.step(state, action, reward, next_state, done)
-            curr_state = {
-                'manipulator': env.denormalize(state[:env.num_of_joints]),
-                'grabbed': bool(state[env.num_of_joints]),
-                'action': env.action_to_str(action)
-            }
-            solution.append(curr_state)
-            state = next_state
-            if done:
-                break
-        with open(to_path + f'{current_situation["id"]}.json', 'w+') as write:
+    service = ManipulatorModelService.get(model_path)
+    (solutions,), _ = service.solve([situations])
+    for situation, solution in zip(situations, solutions):
+        with open(to_path + f'{situation["id"]}.json', 'w+') as write:
             write.write(json.dumps(solution, indent=4))
-        new_man_state = env.denormalize(state[:env.num_of_joints])
-        if i != len(situations)-1:
-            current_situation = situations[i + 1]
-            current_situation['manipulator_angles'] = new_man_state
 
 
-def extract_situations(from_path, to_path):
+def situations_from_steps(steps, first_id=0):
+    """Manipulator situations of the 'pick up' and 'put down' steps of one RL output, numbered from first_id."""
     situations = []
     situation_template = {
         'manipulator_angles': [0, 0, 0],
@@ -118,47 +264,71 @@ def extract_situations(from_path, to_path):
         'block_pos': 0,
         'task': 'grab'
     }
-    sit_id = 0
+    for step in steps:
+        if 'block_pos' in step:
+            grab = step['action'] == 'pick up'
+            curr_sit = deepcopy(situation_template)
+            curr_sit['grabbed'] = not grab
+            curr_sit['task'] = 'grab' if grab else 'release'
+            curr_sit['block_pos'] = step['block_pos']
+            curr_sit['id'] = first_id + len(situations)
+            situations.append(curr_sit)
+    return situations
+
+
+def extract_situations(from_path, to_path):
+    situations = []
     for name in sorted(os.listdir(from_path), key=lambda file: int(file.split('.')[0].split('_')[-1])):
         filename = from_path + name
         with open(filename, 'r') as read:
             steps = json.load(read)
-        for step in steps:
-            if 'block_pos' in step:
-                grab = step['action'] == 'pick up'
-                curr_sit = deepcopy(situation_template)
-                curr_sit['grabbed'] = not grab
-                curr_sit['task'] = 'grab' if grab else 'release'
-                curr_sit['block_pos'] = step['block_pos']
-                curr_sit['id'] = sit_id
-                situations.append(curr_sit)
-                sit_id += 1
+        situations.extend(situations_from_steps(steps, len(situations)))
     with open(to_path+'situations.json', 'w+') as write:
         write.write(json.dumps(situations, indent=4))
 
 
-def train_planner(task_num, type):
-    planner_main(sys.argv[1:], str(task_num), type, f'tasks_jsons/{type}/task{task_num}/planner_steps/')
+def planner_inputs(task_num, type):
+    """Hashes of the benchmark files the planner reads for a task, configs are generated and left out."""
+    blocks_path = os.path.join(BENCHMARKS_PATH, type, 'blocks')
+    paths = [os.path.join(blocks_path, name) for name in os.listdir(blocks_path) if name.startswith('domain')]
+    for root, _, names in os.walk(os.path.join(blocks_path, f'task{task_num}')):
+        paths.extend(os.path.join(root, name) for name in names if not name.endswith('.ini'))
+    return {os.path.relpath(path, blocks_path): file_hash(path) for path in paths}
+
+
+def train_planner(task_num, type, cache=None, instrumentation=None, save_path=None):
+    """Planner steps of a task, also written to save_path as <i>.json when it is given."""
+    key = None
+    steps = None
+    if cache is not None:
+        key = content_key(planner_inputs(task_num, type), sys.argv[1:])
+        document = cache.document('planner_steps', key, 'steps')
+        if document is not None:
+            steps = unpack_steps(document)
+            if instrumentation is not None:
+                instrumentation.count('planner_cache_hits')
+    if steps is None:
+        instrumentation = instrumentation or Instrumentation()
+        with instrumentation.stage('planner_search') as record:
+            solution, problem_path = planner_search(sys.argv[1:], str(task_num), type)
+            steps = list(planner_steps(solution, problem_path))
+            record['num_steps'] = len(steps)
+        if cache is not None:
+            cache.put('planner_steps', key, steps=pack_steps(steps))
+    if save_path is not None:
+        # steps of an earlier run with more situations must not be left next to the new ones
+        for name in os.listdir(save_path):
+            if name.endswith('.json'):
+                os.remove(save_path + name)
+        write_steps(steps, save_path)
+    return steps
 
 
 def create_dir(path):
     if not os.path.exists(path):
         os.mkdir(path)
 
-#from memory_profiler import profile
-import cProfile
 
-def profile(func):
-    """Decorator for run function profile"""
-    def wrapper(*args, **kwargs):
-        profile_filename = func.__name__ + '.prof'
-        profiler = cProfile.Profile()
-        result = profiler.runcall(func, *args, **kwargs)
-        profiler.dump_stats(profile_filename)
-        return result
-    return wrapper
-
-@profile
 def main():
     task_num = '2'
     type = 'maspatial'
@@ -169,6 +339,14 @@ def main():
     rl_agent_steps_path = path_prefix + f'rl_agent_steps/'
     manipulator_situations_path = path_prefix + 'manipulator_sits_raw/'
     manipulator_situations_solved_path = path_prefix + 'manipulator_sits_solved/'
+    reports_path = path_prefix + 'reports/'
+    # dump a cProfile of every stage next to the reports
+    profile_stages = False
+    # planner steps go to the parser in memory, they are written to planner_steps_path only for inspection
+    save_planner_steps = False
+    # sub-tasks are split until they are estimated to have at most this many states, like int(2e6)
+    # a transition table is built for, None keeps the fixed 30 cell windows
+    state_budget = None
     create_dir(type_prefix)
     create_dir(path_prefix)
     create_dir(planner_steps_path)
@@ -177,30 +355,32 @@ def main():
     create_dir(manipulator_situations_path)
     create_dir(manipulator_situations_solved_path)
 
+    # stage outputs of earlier runs are reused while their inputs stay the same
+    cache = ResultCache()
+    run_name = time.strftime('%Y%m%d-%H%M%S')
+    instrumentation = Instrumentation(reports_path + run_name + '_profiles/' if profile_stages else None)
+
     # planner creates high-level steps
-    train_planner(task_num, type)
+    steps = train_planner(task_num, type, cache, instrumentation,
+                          save_path=planner_steps_path if save_planner_steps else None)
     print('PLANNER FINISHED, PARSING TO RL STARTED')
 
-    # parse high-level step representations to rl env-friendly
-    parse(planner_steps_path, planner_steps_parsed_path, multiple=True, window_size=30)
-    print('PARSING TO RL FINISHED, RL LEARNING STARTED')
-
-    parsed_tasks_len = len(os.listdir(planner_steps_parsed_path))
-    tasks_files = [planner_steps_parsed_path + f'parsed_tasks_{i}.json'
-                   for i in range(parsed_tasks_len)]
     parameters = {'episodes': 1000, 'gamma': 0.99, 'alpha': 0.6, 'epsilon': 0.2,
                   'verbose': False, 'plot': False, 'movement': False, 'bench': '',
-                  'save_path': rl_agent_steps_path}
+                  'save_path': rl_agent_steps_path, 'use_table': False,
+                  'num_envs': 1, 'solver': 'qlearning'}
 
-    # rl agent trains to decompose high-level tasks into atomic steps
+    # parse high-level step representations to rl env-friendly, rl agent trains to decompose
+    # high-level tasks into atomic steps while parsing goes on, 'pick up' and 'put down' actions
+    # of every finished sub-task are solved by the pretrained manipulator model
     # todo check pd act
-    train_rl_multiple_files(tasks_files, parameters)
-
-    # find 'pick up' and 'put down' actions and parse them into manipulator env-friendly
-    extract_situations(rl_agent_steps_path, manipulator_situations_path)
+    run_pipeline(steps, planner_steps_parsed_path, rl_agent_steps_path, manipulator_situations_path,
+                 manipulator_situations_solved_path, parameters, window_size=30, cache=cache,
+                 instrumentation=instrumentation, state_budget=state_budget)
 
-    # apply pretrained manipulator model to generate sequence of joint rotations and grabs
-    apply_manipulator_model(manipulator_situations_path, manipulator_situations_solved_path)
+    # per-stage timings and counters, comparable between runs
+    instrumentation.report(reports_path + run_name)
+    print(instrumentation.summary())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,102 @@
+import cProfile
+import csv
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# record fields added up in totals(), besides the num_* counters
+SUMMED = ('wall', 'cpu', 'env_steps', 'q_states')
+
+
+class Instrumentation:
+    """
+    Wall and CPU timers and counters of pipeline stages.
+
+    Every stage() block becomes one record with the stage name, the fields
+    it was opened with (like the index of a sub-task), its wall and CPU time
+    and whatever counters the block writes into the yielded dict. Records of
+    'env_steps' also get 'env_steps_per_sec'. Records made in worker
+    processes are passed back and add()-ed, counters of the whole run are
+    kept with count().
+
+    With profile_dir every stage is also run under cProfile and dumped to
+    <profile_dir>/<stage>[_<field>...].prof, readable with pstats. Stages
+    must not be nested then, only one profiler can be active at a time.
+
+    """
+
+    def __init__(self, profile_dir=None):
+        self.profile_dir = profile_dir
+        self.records = []
+        self.counters = defaultdict(int)
+        if profile_dir is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    @contextmanager
+    def stage(self, name, **fields):
+        record = {'stage': name, **fields}
+        profiler = cProfile.Profile() if self.profile_dir is not None else None
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profile_name = '_'.join([name] + [str(value) for value in fields.values()])
+                profiler.dump_stats(os.path.join(self.profile_dir, profile_name + '.prof'))
+            record['wall'] = time.perf_counter() - wall
+            record['cpu'] = time.process_time() - cpu
+            self.add(record)
+
+    def add(self, record):
+        if 'env_steps' in record and record['wall'] > 0:
+            record['env_steps_per_sec'] = record['env_steps'] / record['wall']
+        self.records.append(record)
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def totals(self):
+        """Number of records, summed wall and CPU time and counters of every stage."""
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['stage'], {'count': 0, 'wall': 0.0, 'cpu': 0.0})
+            total['count'] += 1
+            for name, value in record.items():
+                if name in SUMMED or name.startswith('num_'):
+                    total[name] = total.get(name, 0) + value
+        for total in totals.values():
+            if total.get('env_steps') and total['wall'] > 0:
+                total['env_steps_per_sec'] = total['env_steps'] / total['wall']
+        return totals
+
+    def summary(self):
+        lines = []
+        for stage, total in self.totals().items():
+            line = '{:<20} x{:<4} wall {:9.3f}s  cpu {:9.3f}s'.format(stage, total['count'], total['wall'],
+                                                                   total['cpu'])
+            if 'env_steps_per_sec' in total:
+                line += '  {:.0f} steps/s'.format(total['env_steps_per_sec'])
+            lines.append(line)
+        lines.extend('{:<20} {}'.format(name, value) for name, value in self.counters.items())
+        return '\n'.join(lines)
+
+    def report(self, path):
+        """Writes <path>.json with records, totals and counters and <path>.csv with one row per record."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + '.json', 'w+') as write:
+            write.write(json.dumps({'records': self.records, 'totals': self.totals(),
+                                    'counters': dict(self.counters)}, indent=4))
+        columns = []
+        for record in self.records:
+            columns.extend(name for name in record if name not in columns)
+        with open(path + '.csv', 'w+', newline='') as write:
+            writer = csv.DictWriter(write, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(self.records)
@@ -1,6 +1,5 @@
 import json
 import os
-from copy import deepcopy
 
 import math
 
@@ -29,88 +28,69 @@ def get_agent(planner_data):
              'r': start[act_ag]['r']}
 
 
-def check_window_size(ut, window_size, index, to_path):
-    sub_tasks = []
-    if abs(ut['agent']['goal_x'] - ut['agent']['start_x']) > window_size or abs(ut['agent']['goal_y'] - ut['agent']['start_y']) > window_size:
-        got_x = False
-        got_y = False
-        ag_st = deepcopy([ut['agent']['start_x'], ut['agent']['start_y']])
-        ag_g = deepcopy([ut['agent']['goal_x'], ut['agent']['goal_y']])
-        hs = ut['agent']['holding_start']
-        hg = ut['agent']['holding_goal']
-        if hs and hg: # this situation can be only in move action
-            move_block = hs
-        else:
-            move_block = None
-        while not got_x and not got_y:
-            task = deepcopy(ut)
-            if ag_g[0] > ag_st[0]:
-                if ag_st[0] + window_size < ag_g[0]:
-                    task['agent']['start_x'] = ag_st[0]
-                    task['agent']['goal_x'] = ag_st[0] + window_size
-                    ag_st[0] = task['agent']['goal_x']
-                else:
-                    task['agent']['start_x'] = ag_st[0]
-                    task['agent']['goal_x'] = ag_g[0]
-                    got_x = True
-            elif ag_g[0] < ag_st[0]:
-                if ag_st[0] - window_size > ag_g[0]:
-                    task['agent']['start_x'] = ag_st[0]
-                    task['agent']['goal_x'] = ag_st[0] - window_size
-                    ag_st[0] = task['agent']['goal_x']
-                else:
-                    task['agent']['start_x'] = ag_st[0]
-                    task['agent']['goal_x'] = ag_g[0]
-                    got_x = True
-            if ag_g[1] > ag_st[1]:
-                if ag_st[1] + window_size < ag_g[1]:
-                    task['agent']['start_y'] = ag_st[1]
-                    task['agent']['goal_y'] = ag_st[1] + window_size
-                    ag_st[1] = task['agent']['goal_y']
-                else:
-                    task['agent']['start_y'] = ag_st[1]
-                    task['agent']['goal_y'] = ag_g[1]
-                    got_y = True
-            elif ag_g[1] < ag_st[1]:
-                if ag_st[1] - window_size > ag_g[1]:
-                    task['agent']['start_y'] = ag_st[1]
-                    task['agent']['goal_y'] = ag_st[1] - window_size
-                    ag_st[1] = task['agent']['goal_y']
-                else:
-                    task['agent']['start_y'] = ag_st[1]
-                    task['agent']['goal_y'] = ag_g[1]
-                    got_y = True
-            if move_block:
-                task['blocks'][move_block]['start_x'] = task['agent']['start_x']
-                task['blocks'][move_block]['goal_x'] = task['agent']['goal_x']
-                task['blocks'][move_block]['start_y'] = task['agent']['start_y']
-                task['blocks'][move_block]['goal_y'] = task['agent']['goal_y']
-            sub_tasks.append(task)
-        for task in sub_tasks[:-1]:
-            name ='tasks_' + index + '.json'
-            with open(to_path + 'parsed_' + name, 'w+') as write:
-                write.write(json.dumps(crop_task_map(task), indent=4))
-            index = eval(index)
-            index+=1
-            index = str(index)
+def save_task(task, index, to_path, on_task=None, budget=None):
+    """
+    Saves task as to_path/parsed_tasks_<index>.json, returns the index of
+    the last file written. With a StateBudget the task is split into
+    sub-tasks that fit it first, they are saved under consecutive indices.
+    """
+    if budget is None:
+        tasks = [task]
     else:
-        sub_tasks.append(ut)
-    return sub_tasks[-1], index
+        tasks = budget.fit(task)
+    for offset, sub_task in enumerate(tasks):
+        path = to_path + 'parsed_tasks_' + str(int(index) + offset) + '.json'
+        if budget is not None:
+            budget.saved.append((path, budget.window, budget.estimate(sub_task)))
+        with open(path, 'w+') as write:
+            write.write(json.dumps(crop_task_map(sub_task), indent=4))
+        if on_task is not None:
+            on_task(path)
+    return str(int(index) + len(tasks) - 1)
+
+
+def overlay_task(task, agent=None, blocks=None):
+    """
+    Sub-task of task with some agent fields and block fields replaced.
+
+    Splitting only records these overrides, a sub-task dict is built from
+    them right before it is saved. map, agent and blocks are copied one
+    level deep, which is all crop_task_map writes to.
+    """
+    blocks = blocks or {}
+    sub_task = dict(task)
+    sub_task['map'] = dict(task['map'])
+    sub_task['agent'] = {**task['agent'], **(agent or {})}
+    sub_task['blocks'] = {name: {**fields, **blocks.get(name, {})} for name, fields in task['blocks'].items()}
+    return sub_task
+
 
+def save_overlays(task, overlays, index, to_path, on_task=None, budget=None):
+    """Saves the (agent, blocks) overlays of task as consecutive sub-tasks from index, returns the next index."""
+    for agent, blocks in overlays:
+        index = int(save_task(overlay_task(task, agent, blocks), str(index), to_path, on_task, budget)) + 1
+    return index
 
-def check_manipulator(ut, index, to_path):
+
+def check_window_size(ut, window_size, index, to_path, on_task=None, budget=None):
+    if abs(ut['agent']['goal_x'] - ut['agent']['start_x']) <= window_size and \
+            abs(ut['agent']['goal_y'] - ut['agent']['start_y']) <= window_size:
+        return ut, index
+    overlays = split_move(ut, window_size)
+    index = save_overlays(ut, overlays[:-1], int(index), to_path, on_task, budget)
+    return overlay_task(ut, *overlays[-1]), str(index)
+
+
+def check_manipulator(ut, index, to_path, on_task=None, budget=None):
     """
     Q-learning normally find subactions to pick-up and stack actions
     only iff agent place and block goal place on 1 line. So in this
     function we devide pickup and stack actions to move-to-line and move-to-block
     """
-    ag_st = deepcopy([ut['agent']['start_x'], ut['agent']['start_y']])
+    ag_st = [ut['agent']['start_x'], ut['agent']['start_y']]
+    ag_g = [ut['agent']['goal_x'], ut['agent']['goal_y']]
     hs = ut['agent']['holding_start']
     hg = ut['agent']['holding_goal']
-    sub_tasks = []
-    block = None
-    sv_coord= None
-    ch_coord = None
     if hs and not hg:
         block = hs
         ch_coord = 'goal_x', 'goal_y'
@@ -118,164 +98,348 @@ def check_manipulator(ut, index, to_path):
         block = hg
         ch_coord = 'start_x', 'start_y'
     else:
-        sub_tasks.append(ut)
-    if block:
-        if ut['blocks'][block][ch_coord[0]] == ag_st[0] or ut['blocks'][block][ch_coord[1]] == ag_st[1]:
-            sub_tasks.append(ut)  # if already on 1 line we wouldnt do anything
-            return sub_tasks[-1], index
-        move_to_line = deepcopy(ut)
-        if abs(ut['blocks'][block][ch_coord[0]] - ag_st[0]) >= abs(ut['blocks'][block][ch_coord[1]] - ag_st[1]):
-            move_to_line['agent']['goal_y'] = move_to_line['blocks'][block][ch_coord[1]]
-        else:
-            move_to_line['agent']['goal_x'] = move_to_line['blocks'][block][ch_coord[0]]
-        if hs:
-            move_to_line['agent']['holding_goal'] = block
-            move_to_line['blocks'][block]['goal_x'] = move_to_line['agent']['goal_x']
-            move_to_line['blocks'][block]['goal_y'] = move_to_line['agent']['goal_y']
-        else:
-            move_to_line['blocks'][block]['goal_x'] = move_to_line['blocks'][block]['start_x']
-            move_to_line['blocks'][block]['goal_y'] = move_to_line['blocks'][block]['start_y']
-            move_to_line['agent']['holding_start'] = None
-            move_to_line['agent']['holding_goal'] = None
-        sub_tasks.append(move_to_line)
-        grab_ungrab = deepcopy(move_to_line)
-        grab_ungrab['agent']['start_x'] = grab_ungrab['agent']['goal_x']
-        grab_ungrab['agent']['start_y'] = grab_ungrab['agent']['goal_y']
-        if hg:
-            grab_ungrab['agent']['holding_start'] = None
-            grab_ungrab['agent']['holding_goal'] = block
-            grab_ungrab['blocks'][block]['goal_x'] = grab_ungrab['agent']['goal_x']
-            grab_ungrab['blocks'][block]['goal_y'] = grab_ungrab['agent']['goal_y']
-        else:
-            grab_ungrab['agent']['holding_start'] = block
-            grab_ungrab['agent']['holding_goal'] = None
-            grab_ungrab['blocks'][block]['start_x'] = grab_ungrab['agent']['start_x']
-            grab_ungrab['blocks'][block]['start_y'] = grab_ungrab['agent']['start_y']
-            grab_ungrab['blocks'][block]['goal_x'] = deepcopy(ut['blocks'][block]['goal_x'])
-            grab_ungrab['blocks'][block]['goal_y'] = deepcopy(ut['blocks'][block]['goal_y'])
-        sub_tasks.append(grab_ungrab)
-        move_to_start = deepcopy(grab_ungrab)
-        if hg:
-            move_to_start['agent']['goal_x'] = deepcopy(ut['agent']['goal_x'])
-            move_to_start['agent']['goal_y'] = deepcopy(ut['agent']['goal_y'])
-            move_to_start['agent']['holding_start'] = block
-            move_to_start['blocks'][block]['start_x'] = move_to_start['agent']['start_x']
-            move_to_start['blocks'][block]['start_y'] = move_to_start['agent']['start_y']
-            move_to_start['blocks'][block]['goal_x'] = move_to_start['agent']['goal_x']
-            move_to_start['blocks'][block]['goal_y'] = move_to_start['agent']['goal_y']
-        else:
-            move_to_start['agent']['goal_x'] = deepcopy(ut['agent']['goal_x'])
-            move_to_start['agent']['goal_y'] = deepcopy(ut['agent']['goal_y'])
-            move_to_start['agent']['holding_start'] = None
-            move_to_start['blocks'][block]['start_x'] = deepcopy(ut['blocks'][block]['goal_x'])
-            move_to_start['blocks'][block]['start_y'] = deepcopy(ut['blocks'][block]['goal_y'])
-            move_to_start['blocks'][block]['goal_x'] = deepcopy(ut['blocks'][block]['goal_x'])
-            move_to_start['blocks'][block]['goal_y'] = deepcopy(ut['blocks'][block]['goal_y'])
-        sub_tasks.append(move_to_start)
-        for task in sub_tasks[:-1]:
-            name ='tasks_' + index + '.json'
-            with open(to_path + 'parsed_' + name, 'w+') as write:
-                write.write(json.dumps(crop_task_map(task), indent=4))
-            index = eval(index)
-            index+=1
-            index = str(index)
-
-    return sub_tasks[-1], index
-
-
-
-def parse(from_path, to_path, multiple=True, window_size=30):
-    file_paths = []
-    if multiple:
-        if not os.path.exists(to_path):
-            os.mkdir(to_path)
-        for filename in os.listdir(from_path):
-            file_paths.append(from_path + filename)
+        return ut, index
+    ut_block = ut['blocks'][block]
+    if ut_block[ch_coord[0]] == ag_st[0] or ut_block[ch_coord[1]] == ag_st[1]:
+        return ut, index  # if already on 1 line we wouldnt do anything
+    line_agent = {}
+    if abs(ut_block[ch_coord[0]] - ag_st[0]) >= abs(ut_block[ch_coord[1]] - ag_st[1]):
+        line_agent['goal_y'] = ut_block[ch_coord[1]]
+    else:
+        line_agent['goal_x'] = ut_block[ch_coord[0]]
+    line_goal = [line_agent.get('goal_x', ag_g[0]), line_agent.get('goal_y', ag_g[1])]
+    if hs:
+        line_agent['holding_goal'] = block
+        line_block = {'goal_x': line_goal[0], 'goal_y': line_goal[1]}
+    else:
+        line_block = {'goal_x': ut_block['start_x'], 'goal_y': ut_block['start_y']}
+        line_agent['holding_start'] = None
+        line_agent['holding_goal'] = None
+    # grab or ungrab where the move to the line ends
+    grab_agent = dict(line_agent, start_x=line_goal[0], start_y=line_goal[1])
+    grab_block = dict(line_block)
+    if hg:
+        grab_agent['holding_start'] = None
+        grab_agent['holding_goal'] = block
+        grab_block['goal_x'] = line_goal[0]
+        grab_block['goal_y'] = line_goal[1]
     else:
-        file_paths.append(from_path)
-    fp = []
-    for i in range(len(file_paths)):
-        files = []
-        for file in file_paths:
-            if f'{i}.json' in file:
-                files.append(file)
-        fp.append(min(files, key = lambda files:len(files)))
+        grab_agent['holding_start'] = block
+        grab_agent['holding_goal'] = None
+        grab_block['start_x'] = line_goal[0]
+        grab_block['start_y'] = line_goal[1]
+        grab_block['goal_x'] = ut_block['goal_x']
+        grab_block['goal_y'] = ut_block['goal_y']
+    # move from there to the goal of the agent
+    start_agent = dict(grab_agent, goal_x=ag_g[0], goal_y=ag_g[1])
+    start_block = dict(grab_block)
+    if hg:
+        start_agent['holding_start'] = block
+        start_block['start_x'] = line_goal[0]
+        start_block['start_y'] = line_goal[1]
+        start_block['goal_x'] = ag_g[0]
+        start_block['goal_y'] = ag_g[1]
+    else:
+        start_agent['holding_start'] = None
+        start_block['start_x'] = ut_block['goal_x']
+        start_block['start_y'] = ut_block['goal_y']
+        start_block['goal_x'] = ut_block['goal_x']
+        start_block['goal_y'] = ut_block['goal_y']
+    overlays = [(line_agent, {block: line_block}), (grab_agent, {block: grab_block})]
+    index = save_overlays(ut, overlays, int(index), to_path, on_task, budget)
+    return overlay_task(ut, start_agent, {block: start_block}), str(index)
+
+
+def read_steps(from_path):
+    """Yields planner steps saved as <from_path>/<i>.json in plan order, reading one file at a time."""
+    names = [name for name in os.listdir(from_path) if name.endswith('.json') and name[:-5].isdigit()]
+    for name in sorted(names, key=lambda name: int(name[:-5])):
+        with open(from_path + name, 'r') as read:
+            yield json.load(read)
+
+
+def step_to_task(planner_data):
+    """RL task of one planner step, planner_data is left unchanged."""
+    full_rl_data = {'map': {'walls': None}}
+    map_size = planner_data['map']['map-size']
+    full_rl_data['map']['rows'] = map_size[0]
+    full_rl_data['map']['cols'] = map_size[1]
+    start = planner_data['global-start']['objects']
+    goal = planner_data['global-finish']['objects']
+    # On each step only 1 agent has an action -> Let's find it!
+    act_ag, agent = get_agent(planner_data)
+    blocks = {}
+    block_names = list(start.keys()) + ([agent['holding_start']] if agent['holding_start'] is not None else [])
+    block_names = [name for name in block_names if 'block-' in name]
+    for key in block_names:
+        blocks[key] = {}
+        if key == agent['holding_start'] and key !=agent['holding_goal']:  # task is to put down a block
+            s_item = start[act_ag]
+            g_item = goal[key]
+            r = g_item['r']
+        elif key == agent['holding_goal'] and key !=agent['holding_start']:  # task is to pick up a block
+            s_item = start[key]
+            g_item = goal[act_ag]
+            r = s_item['r']
+        elif key == agent['holding_start'] and key ==agent['holding_goal']: # task to move with block
+            s_item = start[act_ag]
+            g_item = goal[act_ag]
+            r = 1 #todo check anywhere
+        else:
+            s_item = start[key]
+            g_item = goal[key]
+            r = s_item['r']
+        blocks[key] = {'start_x': s_item['x'],
+                       'start_y': s_item['y'],
+                       'goal_x': g_item['x'],
+                       'goal_y': g_item['y'],
+                       'r': r}
+    full_rl_data['agent'] = agent
+    start_cond = planner_data['global-start']['conditions']
+    goal_cond = planner_data['global-finish']['conditions']
+    conditions = {'start': {block: [] for block in block_names},
+                  'goal': {block: [] for block in block_names}}
+    conditions['start'] = rewrite_conditions(start_cond, conditions['start'])
+    conditions['goal'] = rewrite_conditions(goal_cond, conditions['goal'])
+    full_rl_data['blocks'] = change_order_via_conditions(blocks, conditions)
+    return full_rl_data
+
+
+def estimate_states(rows, cols, moving_blocks, wall_share=0.0):
+    """
+    Upper bound of the BlocksWorld states of a window: the agent cell, the
+    cells of the moving blocks and the block in hand over its free cells.
+    """
+    # BlocksWorld widens sides shorter than 6 cells to 10
+    rows = rows if rows >= 6 else 10
+    cols = cols if cols >= 6 else 10
+    cells = max(rows * cols * (1 - wall_share), 1)
+    if moving_blocks:
+        return cells ** (moving_blocks + 1) * (moving_blocks + 1)
+    return cells
+
+
+def wall_share(walls, minx, maxx, miny, maxy):
+    """Share of the cells of a box covered by the [x_0, y_0, x_1, y_1] wall rectangles of the planner map."""
+    covered = 0
+    for x_0, y_0, x_1, y_1 in walls or []:
+        dx = min(max(x_0, x_1), maxx) - max(min(x_0, x_1), minx) + 1
+        dy = min(max(y_0, y_1), maxy) - max(min(y_0, y_1), miny) + 1
+        if dx > 0 and dy > 0:
+            covered += dx * dy
+    return min(covered / ((maxx - minx + 1) * (maxy - miny + 1)), 1.0)
+
+
+def task_wall_share(task, walls, minx, maxx, miny, maxy):
+    # joined tasks are cropped already, walls are in full map coordinates
+    off_x, off_y = task['map'].get('start_x', 0), task['map'].get('start_y', 0)
+    return wall_share(walls, minx + off_x, maxx + off_x, miny + off_y, maxy + off_y)
+
+
+def moving_blocks(task):
+    return len([block for block in task['blocks'].values()
+                if (block['start_x'], block['start_y']) != (block['goal_x'], block['goal_y'])])
+
+
+def task_states(task, walls):
+    """Estimated number of BlocksWorld states of the crop of task, see estimate_states."""
+    xs, ys = get_changing_points(task)
+    if not xs:
+        return estimate_states(1, 1, 0)
+    minx, maxx, miny, maxy = bounding_rect_points(xs, ys)
+    share = task_wall_share(task, walls, minx, maxx, miny, maxy)
+    return estimate_states(maxx - minx + 1, maxy - miny + 1, moving_blocks(task), share)
+
+
+def choose_window_size(task, walls, state_budget, max_window):
+    """Largest window up to max_window whose sub-tasks of task are estimated to have at most state_budget states."""
+    xs, ys = get_changing_points(task)
+    if not xs:
+        return max_window
+    minx, maxx, miny, maxy = bounding_rect_points(xs, ys)
+    share = task_wall_share(task, walls, minx, maxx, miny, maxy)
+    blocks = moving_blocks(task)
+    for window in range(max_window, 0, -1):
+        rows = min(maxx - minx, window) + 1
+        cols = min(maxy - miny, window) + 1
+        if estimate_states(rows, cols, blocks, share) <= state_budget:
+            return window
+    return 1
+
+
+def split_move(task, window):
+    """
+    Overlays of task cutting the move of the agent into pieces of at most
+    window cells along each axis, the block in hand moves with the agent.
+    """
+    agent = task['agent']
+    block = agent['holding_start'] if agent['holding_start'] == agent['holding_goal'] else None
+    x, y = agent['start_x'], agent['start_y']
+    overlays = []
+    while (x, y) != (agent['goal_x'], agent['goal_y']):
+        next_x = x + max(min(agent['goal_x'] - x, window), -window)
+        next_y = y + max(min(agent['goal_y'] - y, window), -window)
+        coords = {'start_x': x, 'start_y': y, 'goal_x': next_x, 'goal_y': next_y}
+        overlays.append((coords, {block: coords} if block else {}))
+        x, y = next_x, next_y
+    return overlays
+
+
+def split_handover(task, reach):
+    """
+    Overlays of a pick up or put down task moving the handover to a point
+    at most reach cells from where the block lies: the agent goes there from
+    its start, picks up or puts down the block and goes on to its goal.
+    """
+    agent = task['agent']
+    name = agent['holding_goal'] or agent['holding_start']
+    block = task['blocks'][name]
+    lies = (block['start_x'], block['start_y']) if agent['holding_goal'] else (block['goal_x'], block['goal_y'])
+    start, goal = (agent['start_x'], agent['start_y']), (agent['goal_x'], agent['goal_y'])
+    point = tuple(lie + max(min(coord - lie, reach), -reach) for lie, coord in zip(lies, start))
+
+    def move(from_point, to_point, holding):
+        coords = {'start_x': from_point[0], 'start_y': from_point[1], 'goal_x': to_point[0], 'goal_y': to_point[1]}
+        if holding:
+            return dict(coords, holding_start=name, holding_goal=name), {name: coords}
+        place = {'start_x': lies[0], 'start_y': lies[1], 'goal_x': lies[0], 'goal_y': lies[1]}
+        return dict(coords, holding_start=None, holding_goal=None), {name: place}
+
+    handover = {'start_x': point[0], 'start_y': point[1], 'goal_x': point[0], 'goal_y': point[1],
+                'holding_start': agent['holding_start'], 'holding_goal': agent['holding_goal']}
+    handed = {'start_x': lies[0], 'start_y': lies[1], 'goal_x': point[0], 'goal_y': point[1]}
+    if agent['holding_start']:
+        handed = {'start_x': point[0], 'start_y': point[1], 'goal_x': lies[0], 'goal_y': lies[1]}
+    overlays = [move(start, point, bool(agent['holding_start'])), (handover, {name: handed}),
+                move(point, goal, bool(agent['holding_goal']))]
+    # a move of no length would be an empty crop
+    return [(agent, blocks) for agent, blocks in overlays
+            if (agent['start_x'], agent['start_y']) != (agent['goal_x'], agent['goal_y'])
+            or any((block['start_x'], block['start_y']) != (block['goal_x'], block['goal_y'])
+                   for block in blocks.values())]
+
+
+class StateBudget:
+    """
+    Estimated number of BlocksWorld states every saved sub-task has to fit.
+
+    fit() splits a sub-task over the budget: moves into shorter moves, pick
+    up and put down tasks into a move to a point next to the block, the
+    handover there and a move on. A sub-task that can not be split further
+    raises ValueError. The path, window and estimate of every saved file are
+    kept in saved, in the order of the files.
+    """
+
+    def __init__(self, states=None, walls=None, window=None):
+        self.states = states
+        self.walls = walls
+        self.window = window
+        self.saved = []
+
+    def estimate(self, task):
+        return task_states(task, self.walls)
+
+    def fit(self, task):
+        """Sub-tasks of task within the budget, in the order they are done."""
+        if self.states is None or self.estimate(task) <= self.states:
+            return [task]
+        overlays = self.split(task)
+        if not overlays:
+            raise ValueError('a sub-task with {} moving blocks is estimated to have {:.3g} states and can not be '
+                             'split to fit the budget of {:.3g}'.format(moving_blocks(task), self.estimate(task),
+                                                                       self.states))
+        return [fitted for agent, blocks in overlays for fitted in self.fit(overlay_task(task, agent, blocks))]
+
+    def split(self, task):
+        agent = task['agent']
+        if agent['holding_start'] == agent['holding_goal']:
+            distance = max(abs(agent['goal_x'] - agent['start_x']), abs(agent['goal_y'] - agent['start_y']))
+            if distance <= 1:
+                return None
+            window = choose_window_size(task, self.walls, self.states, int(distance) - 1)
+            return split_move(task, window)
+        block = task['blocks'][agent['holding_goal'] or agent['holding_start']]
+        distance = max(abs(block['goal_x'] - block['start_x']), abs(block['goal_y'] - block['start_y']))
+        for reach in range(int(distance) - 1, 0, -1):
+            overlays = split_handover(task, reach)
+            handover = [overlay_task(task, agent, blocks) for agent, blocks in overlays
+                        if agent['holding_start'] != agent['holding_goal']]
+            if self.estimate(handover[0]) <= self.states:
+                return overlays
+        return None
+
+
+def parse(from_path, to_path, multiple=True, window_size=30, on_task=None, state_budget=None):
+    """
+    Splits planner steps into RL sub-tasks saved as to_path/parsed_tasks_<i>.json.
+
+    from_path is a directory of steps written by save_steps or, with
+    multiple, any iterable of steps in plan order (like the planner_steps
+    generator of map_spatial_wrapper.test2), which are consumed one at a time
+    without going through files. on_task is called with the path of every
+    sub-task file as soon as it is written, so consumers can start on it
+    while parsing goes on.
+
+    With state_budget the window of every step is chosen by
+    choose_window_size: the largest one up to window_size whose estimated
+    number of BlocksWorld states (the crop size, the number of moving blocks
+    and the walls inside the crop) fits the budget. Every sub-task written,
+    the last window and the pick up and put down tasks included, is split
+    further while it is over the budget, see StateBudget. Returns the path,
+    window size and estimated number of states of every file written, in
+    order.
+    """
+    if not multiple:
+        with open(from_path, 'r') as read:
+            full_rl_data = step_to_task(json.load(read))
+        name = from_path.split('/')[-1]
+        with open(to_path + 'parsed_' + name, 'w+') as write:
+            write.write(json.dumps(full_rl_data, indent=4))
+        return
+    if not os.path.exists(to_path):
+        os.mkdir(to_path)
+    steps = read_steps(from_path) if isinstance(from_path, str) else from_path
     united_task = None
     united_tasks_indices = None
     count = 0
-    for one_file_path in fp:
-        with open(one_file_path, 'r') as read:
-            planner_data = json.load(read)
-        full_rl_data = {'map': {'walls': None}}
-        map_size = planner_data['map']['map-size']
-        full_rl_data['map']['rows'] = map_size[0]
-        full_rl_data['map']['cols'] = map_size[1]
-        start = planner_data['global-start']['objects']
-        goal = planner_data['global-finish']['objects']
-        # On each step only 1 agent has an action -> Let's find it!
-        act_ag, agent = get_agent(planner_data)
-        blocks = {}
-        block_names = list(start.keys()) + ([agent['holding_start']] if agent['holding_start'] is not None else [])
-        block_names = [name for name in block_names if 'block-' in name]
-        for key in block_names:
-            blocks[key] = {}
-            if key == agent['holding_start'] and key !=agent['holding_goal']:  # task is to put down a block
-                s_item = start[act_ag]
-                g_item = goal[key]
-                s_item['r'] = g_item['r']
-            elif key == agent['holding_goal'] and key !=agent['holding_start']:  # task is to pick up a block
-                s_item = start[key]
-                g_item = goal[act_ag]
-                g_item['r'] = s_item['r']
-            elif key == agent['holding_start'] and key ==agent['holding_goal']: # task to move with block
-                s_item = start[act_ag]
-                g_item = goal[act_ag]
-                g_item['r'] = 1 #todo check anywhere
-                s_item['r'] = 1
-            else:
-                s_item = start[key]
-                g_item = goal[key]
-            blocks[key] = {'start_x': s_item['x'],
-                           'start_y': s_item['y'],
-                           'goal_x': g_item['x'],
-                           'goal_y': g_item['y'],
-                           'r': s_item['r']}
-        full_rl_data['agent'] = agent
-        start_cond = planner_data['global-start']['conditions']
-        goal_cond = planner_data['global-finish']['conditions']
-        conditions = {'start': {block: [] for block in block_names},
-                      'goal': {block: [] for block in block_names}}
-        conditions['start'] = rewrite_conditions(start_cond, conditions['start'])
-        conditions['goal'] = rewrite_conditions(goal_cond, conditions['goal'])
-        full_rl_data['blocks'] = change_order_via_conditions(blocks, conditions)
-        if not multiple:
-            name = one_file_path.split('/')[-1]
-            with open(to_path + 'parsed_' + name, 'w+') as write:
-                write.write(json.dumps(full_rl_data, indent=4))
-            return
+    budget = StateBudget(state_budget, window=window_size)
+    for planner_data in steps:
+        full_rl_data = step_to_task(planner_data)
+        budget.walls = planner_data['map'].get('wall')
         if united_task is None:
             united_task = full_rl_data
             united_tasks_indices = str(count)
             count += 1
             continue
-        if is_in_window(united_task, full_rl_data, window_size): # check if few planner steps in 1 RL window
+        window = window_size
+        if state_budget is not None:
+            window = min(choose_window_size(united_task, budget.walls, state_budget, window_size),
+                         choose_window_size(full_rl_data, budget.walls, state_budget, window_size))
+        if is_in_window(united_task, full_rl_data, window): # check if few planner steps in 1 RL window
             united_task = join_tasks(united_task, full_rl_data) # previous full_rl_data
             united_tasks_indices += str(count)
         else:
             united_tasks_indices = str(count-1)
-            united_task, united_tasks_indices = check_window_size(united_task, window_size, united_tasks_indices, to_path)
-            united_task, united_tasks_indices = check_manipulator(united_task, united_tasks_indices, to_path)
-            name = 'tasks_' + united_tasks_indices + '.json'
-            with open(to_path + 'parsed_' + name, 'w+') as write:
-                write.write(json.dumps(crop_task_map(united_task), indent=4))
+            if state_budget is not None:
+                budget.window = choose_window_size(united_task, budget.walls, state_budget, window_size)
+            united_task, united_tasks_indices = check_window_size(united_task, budget.window, united_tasks_indices,
+                                                                  to_path, on_task, budget)
+            united_task, united_tasks_indices = check_manipulator(united_task, united_tasks_indices, to_path, on_task,
+                                                                  budget)
+            united_tasks_indices = save_task(united_task, united_tasks_indices, to_path, on_task, budget)
             united_task = full_rl_data
-            count = eval(united_tasks_indices) + 1
+            count = int(united_tasks_indices) + 1
             #united_tasks_indices = str(count)
         count += 1
-    name = 'tasks_' + united_tasks_indices + '.json'
-    united_task, united_tasks_indices = check_manipulator(united_task, united_tasks_indices, to_path)
-    with open(to_path + 'parsed_' + name, 'w+') as write:
-        write.write(json.dumps(crop_task_map(united_task), indent=4))
+    # the last window gets the next free index, like windows closed inside the loop
+    united_tasks_indices = str(count - 1)
+    if state_budget is not None:
+        budget.window = choose_window_size(united_task, budget.walls, state_budget, window_size)
+        united_task, united_tasks_indices = check_window_size(united_task, budget.window, united_tasks_indices,
+                                                              to_path, on_task, budget)
+    united_task, united_tasks_indices = check_manipulator(united_task, united_tasks_indices, to_path, on_task, budget)
+    save_task(united_task, united_tasks_indices, to_path, on_task, budget)
+    return budget.saved
 
 
 def is_in_window(old_task, new_task, window):
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+CACHE_DIR = 'tasks_jsons/.cache/results/'
+MAX_CACHE_BYTES = 256 * 2 ** 20
+# temporary entries untouched for this long were left by a crashed put
+STALE_TMP_SECONDS = 3600
+
+
+def file_hash(path):
+    with open(path, 'rb') as read:
+        return hashlib.sha1(read.read()).hexdigest()
+
+
+def content_key(*inputs):
+    """Hash of JSON-serializable stage inputs, dict key order does not matter."""
+    payload = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Outputs of pipeline stages stored by the hash of their inputs.
+
+    An entry is a directory <cache_dir>/<stage>/<key>/ with copies of the
+    output files and JSON documents of the stage. Entries are written under
+    a temporary name and renamed into place, so a crashed run never leaves
+    a half-written entry behind. Once the cache grows over max_bytes the
+    least recently used entries are removed.
+
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _entry(self, stage, key):
+        return os.path.join(self.cache_dir, stage, key)
+
+    def get(self, stage, key):
+        """Directory of the entry, None on a miss."""
+        entry = self._entry(stage, key)
+        if not os.path.isdir(entry):
+            return None
+        # mtime marks the last use for eviction
+        os.utime(entry)
+        return entry
+
+    def restore(self, stage, key, to_path, name=None):
+        """
+        Copies the output files of the entry into the to_path directory,
+        returns their paths or None on a miss. With name only the output file
+        of that name is copied, to the file to_path.
+        """
+        entry = self.get(stage, key)
+        if entry is None:
+            return None
+        if name is not None:
+            if not os.path.isfile(os.path.join(entry, name)):
+                return None
+            shutil.copyfile(os.path.join(entry, name), to_path)
+            return [to_path]
+        paths = []
+        for name in sorted(os.listdir(entry)):
+            if name.endswith('.doc.json'):
+                continue
+            paths.append(os.path.join(to_path, name))
+            shutil.copyfile(os.path.join(entry, name), paths[-1])
+        return paths
+
+    def document(self, stage, key, name):
+        """JSON document stored with the entry, None on a miss."""
+        entry = self.get(stage, key)
+        if entry is None:
+            return None
+        with open(os.path.join(entry, name + '.doc.json'), 'r') as read:
+            return json.load(read)
+
+    def put(self, stage, key, paths=(), names=None, **documents):
+        """
+        Stores copies of the files in paths and the JSON documents as the entry
+        of key. The copies are named by names, the base names of paths by default.
+        """
+        entry = self._entry(stage, key)
+        tmp = f'{entry}.{os.getpid()}.tmp'
+        os.makedirs(tmp, exist_ok=True)
+        for path, name in zip(paths, names or [os.path.basename(path) for path in paths]):
+            shutil.copyfile(path, os.path.join(tmp, name))
+        for name, data in documents.items():
+            with open(os.path.join(tmp, name + '.doc.json'), 'w+') as write:
+                write.write(json.dumps(data))
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+        self.evict()
+        return entry
+
+    def evict(self):
+        """
+        Removes temporary entries of crashed puts, then least recently used
+        entries until the cache fits into max_bytes.
+        """
+        entries = []
+        total = 0
+        for stage in os.listdir(self.cache_dir):
+            stage_dir = os.path.join(self.cache_dir, stage)
+            if not os.path.isdir(stage_dir):
+                continue
+            for key in os.listdir(stage_dir):
+                entry = os.path.join(stage_dir, key)
+                if entry.endswith('.tmp'):
+                    # other processes may still be writing their recent ones
+                    if time.time() - os.path.getmtime(entry) > STALE_TMP_SECONDS:
+                        shutil.rmtree(entry, ignore_errors=True)
+                    continue
+                size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+                entries.append((os.path.getmtime(entry), size, entry))
+                total += size
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)